@@ -0,0 +1,88 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Sliding window for detecting duplicate packets that arrive
+on multiple links
+"""
+import time
+
+
+class DedupWindow():
+    """
+    A fixed size window of the most recent packet keys and their
+    arrival times. Lookups use a hash table and the oldest key is
+    evicted via a ring buffer
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+        # the keys currently in the window
+        # Key is the packet key, Val is the arrival time
+        self.keys = {}
+
+        # ring buffer of the keys, in order of arrival
+        self.ring = [None] * size
+        self.ringpos = 0
+
+        # Number of duplicates dropped
+        # Key is linkname, Val is count
+        self.dropped = {}
+
+    @staticmethod
+    def packetKey(pkt):
+        """Get the dedup key for a mavlink packet"""
+        return (pkt.get_srcSystem(), pkt.get_srcComponent(), pkt.get_seq(), pkt.get_crc())
+
+    def seen(self, key, linkname: str = None) -> bool:
+        """Check if the key is in the window, without adding it. If
+        linkname is given, a duplicate is counted against that link"""
+        if key in self.keys:
+            if linkname is not None:
+                self.dropped[linkname] = self.dropped.get(linkname, 0) + 1
+            return True
+        return False
+
+    def arrival(self, key):
+        """Get the time the key was added to the window. None if
+        not in the window"""
+        return self.keys.get(key)
+
+    def check(self, key, linkname: str = None, now: float = None) -> bool:
+        """Returns True if the key is a duplicate. Otherwise the
+        key is added to the window at time now and False is returned"""
+        if key in self.keys:
+            self.dropped[linkname] = self.dropped.get(linkname, 0) + 1
+            return True
+
+        # evict the oldest key
+        oldkey = self.ring[self.ringpos]
+        if oldkey is not None:
+            self.keys.pop(oldkey, None)
+        self.ring[self.ringpos] = key
+        self.ringpos = (self.ringpos + 1) % self.size
+        self.keys[key] = now if now is not None else time.time()
+        return False
+
+    def clear(self):
+        """Empty the window"""
+        self.keys.clear()
+        self.ring = [None] * self.size
+        self.ringpos = 0
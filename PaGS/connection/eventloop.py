@@ -0,0 +1,71 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Selection of the asyncio event loop implementation
+"""
+import asyncio
+import logging
+import platform
+
+LOOPS = ('asyncio', 'uvloop')
+
+
+def loopAvailable(name: str) -> bool:
+    """Check if an event loop implementation can be used"""
+    if name == 'asyncio':
+        return True
+    if name == 'uvloop':
+        if platform.system() == 'Windows':
+            return False
+        try:
+            import uvloop  # noqa: F401
+        except ImportError:
+            return False
+        return True
+    return False
+
+
+def newEventLoop(name: str = 'asyncio'):
+    """Create an event loop of the named implementation, and set it
+    as the current loop. Falls back to asyncio if not available"""
+    if name not in LOOPS:
+        raise ValueError("Unknown event loop")
+    if not loopAvailable(name):
+        logging.warning("Event loop %s not available, using asyncio", name)
+        name = 'asyncio'
+
+    if name == 'uvloop':
+        import uvloop
+        loop = uvloop.new_event_loop()
+        addPrivateReaders(loop)
+    else:
+        loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def addPrivateReaders(loop):
+    """Some transports (like serial_asyncio) call the private
+    _add_reader() family of the selector loops. Map them to the
+    public versions if the loop does not have them"""
+    for name in ('add_reader', 'remove_reader', 'add_writer', 'remove_writer'):
+        if not hasattr(loop, '_' + name):
+            setattr(loop, '_' + name, getattr(loop, name))
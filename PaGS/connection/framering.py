@@ -0,0 +1,103 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Shared memory ring buffer for passing raw frames between processes
+"""
+import struct
+from multiprocessing import shared_memory
+
+# Header of the ring: the total bytes written and read, and
+# the number of frames dropped as the ring was full
+HEADER = struct.Struct('<QQQ')
+LENGTH = struct.Struct('<H')
+
+
+class FrameRing():
+    """
+    A single producer, single consumer ring buffer of frames in shared
+    memory. Each frame is stored as a 2 byte length, then the frame. The
+    write and read positions only increase, so the producer only writes
+    the write position and the consumer only writes the read position.
+    If name is None, a new ring of size bytes is created
+    """
+
+    def __init__(self, size: int = 1 << 20, name: str = None):
+        self.size = size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER.size + size)
+            HEADER.pack_into(self.shm.buf, 0, 0, 0, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.data = self.shm.buf[HEADER.size:HEADER.size + size]
+
+    def write(self, pos: int, buf):
+        """Copy buf into the ring at pos, wrapping around the end"""
+        offset = pos % self.size
+        first = min(len(buf), self.size - offset)
+        self.data[offset:offset + first] = buf[:first]
+        if first < len(buf):
+            self.data[:len(buf) - first] = buf[first:]
+
+    def read(self, pos: int, length: int) -> bytearray:
+        """Copy length bytes from the ring at pos, wrapping around the end"""
+        offset = pos % self.size
+        first = min(length, self.size - offset)
+        buf = bytearray(self.data[offset:offset + first])
+        if first < length:
+            buf += self.data[:length - first]
+        return buf
+
+    def put(self, frame) -> bool:
+        """Add a frame to the ring. Returns False, and the frame is
+        dropped, if the ring is full"""
+        writepos, readpos, dropped = HEADER.unpack_from(self.shm.buf, 0)
+        need = LENGTH.size + len(frame)
+        if need > self.size - (writepos - readpos):
+            struct.pack_into('<Q', self.shm.buf, 16, dropped + 1)
+            return False
+        self.write(writepos, LENGTH.pack(len(frame)))
+        self.write(writepos + LENGTH.size, frame)
+        # only make the frame visible once it's all written
+        struct.pack_into('<Q', self.shm.buf, 0, writepos + need)
+        return True
+
+    def get(self) -> list:
+        """Remove all frames in the ring, as a list of bytearrays"""
+        writepos, readpos, dropped = HEADER.unpack_from(self.shm.buf, 0)
+        frames = []
+        while readpos < writepos:
+            length = LENGTH.unpack(self.read(readpos, LENGTH.size))[0]
+            frames.append(self.read(readpos + LENGTH.size, length))
+            readpos += LENGTH.size + length
+        struct.pack_into('<Q', self.shm.buf, 8, readpos)
+        return frames
+
+    def getDropped(self) -> int:
+        """Get the number of frames dropped as the ring was full"""
+        return HEADER.unpack_from(self.shm.buf, 0)[2]
+
+    def close(self, unlink: bool = False):
+        """Detach from the ring. The creator must unlink it"""
+        self.data.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
@@ -0,0 +1,124 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Fair scheduling of the received packets of all links
+"""
+import collections
+import logging
+import time
+
+
+class IngestScheduler():
+    """
+    Queues the received packets of each link and passes them on to the
+    handler in round-robin slices of up to slicesize packets per link.
+    Each run stops after budget seconds and yields to the event loop, so
+    a burst on one link can't hold up the other links or the UI
+    """
+
+    def __init__(self, loop, handler, budget: float = 0.005, slicesize: int = 16,
+                 maxqueue: int = 10000):
+        self.loop = loop
+        # Called with (pkt, linkname) for each packet
+        self.handler = handler
+        self.budget = budget
+        self.slicesize = slicesize
+        # Max packets queued per link. The oldest are dropped
+        self.maxqueue = maxqueue
+
+        # Packets waiting for each link
+        # Key is linkname, Val is a deque of packets
+        self.queues = {}
+        # Packets dropped from each link's full queue
+        # Key is linkname, Val is count
+        self.dropped = {}
+        # The links with packets waiting, in turn order
+        self.ready = collections.deque()
+
+        # The scheduled run, if any
+        self.handle = None
+
+    def put(self, pkt, linkname: str):
+        """Queue a packet received on a link"""
+        queue = self.queues.get(linkname)
+        if queue is None:
+            queue = self.queues[linkname] = collections.deque()
+            self.dropped[linkname] = 0
+        if not queue:
+            self.ready.append(linkname)
+        elif len(queue) >= self.maxqueue:
+            logging.debug("Rx queue full %s", linkname)
+            queue.popleft()
+            self.dropped[linkname] += 1
+        queue.append(pkt)
+        if self.handle is None:
+            self.handle = self.loop.call_soon(self.run)
+
+    def passOn(self, pkt, linkname: str):
+        """Pass a packet on to the handler. Any exception is logged, so
+        the rest of the link's queue is still passed on"""
+        try:
+            self.handler(pkt, linkname)
+        except Exception:
+            logging.exception("Error handling packet from %s", linkname)
+
+    def run(self):
+        """Pass on queued packets, a slice from each link in turn,
+        until the queues are empty or the budget is used"""
+        self.handle = None
+        deadline = time.perf_counter() + self.budget
+        while self.ready:
+            linkname = self.ready.popleft()
+            queue = self.queues.get(linkname)
+            if not queue:
+                continue
+            for i in range(min(self.slicesize, len(queue))):
+                self.passOn(queue.popleft(), linkname)
+            if queue:
+                self.ready.append(linkname)
+            if time.perf_counter() >= deadline:
+                break
+        if self.ready and self.handle is None:
+            # continue after the loop has handled any other events
+            self.handle = self.loop.call_soon(self.run)
+
+    def flush(self):
+        """Pass on all queued packets now"""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        while self.ready:
+            linkname = self.ready.popleft()
+            queue = self.queues.get(linkname)
+            while queue:
+                self.passOn(queue.popleft(), linkname)
+
+    def removeLink(self, linkname: str):
+        """Drop the queue of a link"""
+        self.queues.pop(linkname, None)
+        self.dropped.pop(linkname, None)
+        if linkname in self.ready:
+            self.ready.remove(linkname)
+
+    def get(self, linkname: str) -> dict:
+        """Get the number of packets queued and dropped for a link"""
+        return {'rxqueue': len(self.queues.get(linkname, ())),
+                'rxdropped': self.dropped.get(linkname, 0)}
@@ -0,0 +1,92 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Reconnection backoff for links
+"""
+import random
+import time
+
+
+class LinkBackoff():
+    """
+    Exponential backoff, with jitter, between the reconnection attempts
+    of a link. The delay starts at mindelay and doubles on each failure,
+    up to maxdelay. Each delay is randomly shortened by up to jitter
+    (0-1) of itself, so links that fail together don't retry together
+    """
+
+    def __init__(self, name: str, mindelay: float = 1, maxdelay: float = 30,
+                 jitter: float = 0.5):
+        self.name = name
+        self.mindelay = mindelay
+        self.maxdelay = maxdelay
+        self.jitter = jitter
+
+        # Set when the link is connected
+        self.connected = False
+        # Number of failed attempts since the last connection
+        self.failures = 0
+        # Time of the next attempt
+        self.nextretry = 0
+        # Reason for the last failed attempt or disconnection
+        self.lasterror = None
+
+    def isReady(self, now: float = None) -> bool:
+        """True if the link is disconnected and due a reconnection attempt"""
+        if now is None:
+            now = time.time()
+        return not self.connected and now >= self.nextretry
+
+    def success(self):
+        """The link has connected"""
+        self.connected = True
+        self.failures = 0
+
+    def failure(self, reason: str, now: float = None):
+        """A connection attempt has failed. Schedule the next attempt"""
+        if now is None:
+            now = time.time()
+        self.connected = False
+        self.failures += 1
+        self.lasterror = reason
+        delay = min(self.maxdelay, self.mindelay * 2 ** (self.failures - 1))
+        self.nextretry = now + delay * (1 - self.jitter * random.random())
+
+    def disconnected(self, reason: str, now: float = None):
+        """A connected link has been lost. Reconnect straight away"""
+        if now is None:
+            now = time.time()
+        self.connected = False
+        self.lasterror = reason
+        self.nextretry = now
+
+    def remaining(self, now: float = None) -> float:
+        """Seconds until the next reconnection attempt. 0 if connected"""
+        if now is None:
+            now = time.time()
+        if self.connected:
+            return 0
+        return max(0, self.nextretry - now)
+
+    def get(self, now: float = None) -> dict:
+        """Get the reconnection state"""
+        return {'connected': self.connected, 'failures': self.failures,
+                'retryin': self.remaining(now), 'lasterror': self.lasterror}
@@ -0,0 +1,169 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Selection of the links to transmit on, for vehicles with
+multiple links
+"""
+import time
+
+# TX policies:
+# broadcast - send on all links
+# best - send on the link with the lowest loss and latency
+# failover - send on the first link (in the order they were added) that
+#   is receiving packets from the vehicle
+TXPOLICIES = ('broadcast', 'best', 'failover')
+
+# Bulk (parameter, mission, log and file transfer) modes:
+# policy - send as per the tx policy
+# stripe - send each packet on the next receiving link, round-robin
+# weighted - as stripe, but in proportion to the rate each link is
+#   receiving from the vehicle
+BULKMODES = ('policy', 'stripe', 'weighted')
+
+
+class LinkSelector():
+    """
+    Selects the link(s) a vehicle's packets are sent on. A link is
+    quiet if nothing has been received from the vehicle on it for
+    quiet seconds. Quiet links are only used if all links are quiet,
+    in which case the link last received on is used, or all links if
+    nothing has been received yet.
+
+    The best link has the lowest score, which is the packet loss (0-1)
+    plus the lag (seconds behind the fastest link). The selected link
+    is only changed for a score lower by more than hysteresis, or if
+    it goes quiet.
+
+    Bulk packets can instead be striped across the receiving links, so
+    each goes on one link only and the responses are merged by the
+    de-duplication of incoming packets
+    """
+
+    def __init__(self, policy: str = 'broadcast', quiet: float = 2, hysteresis: float = 0.05,
+                 bulkmode: str = 'policy'):
+        if policy not in TXPOLICIES:
+            raise ValueError('Unknown tx policy (must be one of ' + ', '.join(TXPOLICIES) + ')')
+        if bulkmode not in BULKMODES:
+            raise ValueError('Unknown bulk mode (must be one of ' + ', '.join(BULKMODES) + ')')
+        self.policy = policy
+        self.quiet = quiet
+        self.hysteresis = hysteresis
+        self.bulkmode = bulkmode
+
+        # The currently selected link
+        self.selected = None
+
+        # Position in the round-robin of bulk packets
+        self.bulknext = 0
+        # Credit of each link for weighted bulk packets
+        # Key is link, Val is the credit
+        self.bulkcredit = {}
+
+    @staticmethod
+    def score(stats, now: float) -> float:
+        """Get the score of a link's statistics. Lower is better"""
+        return stats.loss + stats.getLag(now)
+
+    def liveLinks(self, links: list, now: float):
+        """Get the links from a list of (link, sysid) that are not quiet,
+        as a list of (link, sysid, stats)"""
+        live = []
+        for link, sysid in links:
+            stats = link.getSysidStats(sysid)
+            if stats is not None and stats.lastrx is not None and now - stats.lastrx < self.quiet:
+                live.append((link, sysid, stats))
+        return live
+
+    def selectBulk(self, links: list, now: float = None) -> list:
+        """Select from a list of (link, sysid) the link to send a bulk
+        packet on. If not striping bulk packets, or no links are
+        receiving, the tx policy is used"""
+        if self.bulkmode == 'policy' or len(links) < 2:
+            return self.select(links, now)
+        if now is None:
+            now = time.time()
+
+        live = self.liveLinks(links, now)
+        if not live:
+            return self.select(links, now)
+
+        if self.bulkmode == 'stripe':
+            chosen = live[self.bulknext % len(live)]
+            self.bulknext += 1
+        else:
+            # smooth weighted round-robin. Links that have only just
+            # started receiving get a small weight
+            total = 0
+            chosen = None
+            for entry in live:
+                weight = max(1.0, entry[2].rxbytes.get(now) * (1 - entry[2].loss))
+                total += weight
+                credit = self.bulkcredit.get(entry[0], 0) + weight
+                self.bulkcredit[entry[0]] = credit
+                if chosen is None or credit > self.bulkcredit[chosen[0]]:
+                    chosen = entry
+            self.bulkcredit[chosen[0]] -= total
+            # forget any links that are no longer receiving
+            if len(self.bulkcredit) > len(live):
+                self.bulkcredit = {entry[0]: self.bulkcredit[entry[0]] for entry in live}
+
+        return [(chosen[0], chosen[1])]
+
+    def select(self, links: list, now: float = None) -> list:
+        """Select from a list of (link, sysid) the links to send on"""
+        if self.policy == 'broadcast' or len(links) < 2:
+            return links
+        if now is None:
+            now = time.time()
+
+        # the links that are receiving, and the last one received on
+        live = []
+        latest = None
+        latestrx = None
+        for link, sysid in links:
+            stats = link.getSysidStats(sysid)
+            if stats is None or stats.lastrx is None:
+                continue
+            if now - stats.lastrx < self.quiet:
+                live.append((link, sysid, stats))
+            if latestrx is None or stats.lastrx > latestrx:
+                latest = (link, sysid)
+                latestrx = stats.lastrx
+
+        if not live:
+            if latest is None:
+                self.selected = None
+                return links
+            self.selected = latest[0]
+            return [latest]
+
+        if self.policy == 'failover':
+            chosen = live[0]
+        else:
+            chosen = min(live, key=lambda entry: self.score(entry[2], now))
+            for entry in live:
+                if entry[0] is self.selected:
+                    if self.score(entry[2], now) - self.score(chosen[2], now) <= self.hysteresis:
+                        chosen = entry
+                    break
+
+        self.selected = chosen[0]
+        return [(chosen[0], chosen[1])]
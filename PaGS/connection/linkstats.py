@@ -0,0 +1,183 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Link quality statistics, per sysid, for a single link
+"""
+import math
+import time
+
+
+class EWMARate():
+    """
+    Exponentially weighted moving average of a rate (units/sec), updated
+    in constant time on each event. tau is the time constant in seconds
+    """
+    __slots__ = ('tau', 'rate', 'last')
+
+    def __init__(self, tau: float):
+        self.tau = tau
+        self.rate = 0.0
+        self.last = None
+
+    def add(self, amount: float, now: float):
+        """Add an event of size amount at time now"""
+        if self.last is not None:
+            self.rate *= math.exp(-(now - self.last) / self.tau)
+        self.rate += amount / self.tau
+        self.last = now
+
+    def get(self, now: float) -> float:
+        """Get the rate at time now"""
+        if self.last is None:
+            return 0.0
+        return self.rate * math.exp(-(now - self.last) / self.tau)
+
+
+class SysidStats():
+    """
+    The statistics for a single sysid on a link
+    """
+
+    def __init__(self, tau: float, lossalpha: float):
+        self.tau = tau
+        self.rxbytes = EWMARate(tau)
+        self.rxpackets = EWMARate(tau)
+        self.txbytes = EWMARate(tau)
+        self.txpackets = EWMARate(tau)
+
+        # Total counts
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.sent = 0
+
+        # EWMA of the fraction of packets lost (0-1)
+        self.lossalpha = lossalpha
+        self.loss = 0.0
+
+        # Last seq number, per compid
+        self.lastseq = {}
+
+        # time of last received packet
+        self.lastrx = None
+
+        # EWMA of the time (sec) duplicate packets arrived after the same
+        # packet on another link, and the time of the last duplicate
+        self.lag = 0.0
+        self.lastlag = None
+
+    def rxPacket(self, compid: int, seq: int, size: int, now: float):
+        """Update for a received packet"""
+        self.rxbytes.add(size, now)
+        self.rxpackets.add(1, now)
+        self.received += 1
+        self.lastrx = now
+
+        # Loss from gaps in the seq numbers. A repeated seq is
+        # not counted as loss
+        lastseq = self.lastseq.get(compid)
+        self.lastseq[compid] = seq
+        if lastseq is None or seq == lastseq:
+            gap = 0
+        else:
+            gap = (seq - lastseq - 1) % 256
+            self.lost += gap
+        # A lost packet is a sample of 1 and the received packet
+        # is a sample of 0
+        keep = 1 - self.lossalpha
+        self.loss = (1 - (1 - self.loss) * keep ** gap) * keep
+
+    def duplicate(self, lag: float, now: float):
+        """Update for a packet that arrived lag seconds after the
+        same packet on another link"""
+        self.duplicates += 1
+        if lag is not None:
+            self.lag = self.lag * (1 - self.lossalpha) + lag * self.lossalpha
+            self.lastlag = now
+
+    def getLag(self, now: float) -> float:
+        """Get the lag at time now. It decays to 0 with no duplicates,
+        as the link is then the fastest"""
+        if self.lastlag is None:
+            return 0.0
+        return self.lag * math.exp(-(now - self.lastlag) / self.tau)
+
+    def txPacket(self, size: int, now: float):
+        """Update for a transmitted packet"""
+        self.txbytes.add(size, now)
+        self.txpackets.add(1, now)
+        self.sent += 1
+
+    def get(self, now: float) -> dict:
+        """Get a dict of the current statistics"""
+        return {'rxbytespersec': self.rxbytes.get(now),
+                'rxpktspersec': self.rxpackets.get(now),
+                'txbytespersec': self.txbytes.get(now),
+                'txpktspersec': self.txpackets.get(now),
+                'received': self.received,
+                'lost': self.lost,
+                'loss': self.loss,
+                'duplicates': self.duplicates,
+                'lag': self.getLag(now),
+                'sent': self.sent,
+                'lastrx': self.lastrx}
+
+
+class LinkStats():
+    """
+    Link statistics (rx/tx bandwidth and packet rate, packet loss,
+    duplicates and lag behind other links), tracked per sysid
+    """
+
+    def __init__(self, tau: float = 5, lossalpha: float = 0.05):
+        self.tau = tau
+        self.lossalpha = lossalpha
+
+        # Key is sysid, Val is SysidStats
+        self.sysids = {}
+
+    def getSysid(self, sysid: int) -> SysidStats:
+        """Get the stats for a sysid, creating if required"""
+        stats = self.sysids.get(sysid)
+        if stats is None:
+            stats = SysidStats(self.tau, self.lossalpha)
+            self.sysids[sysid] = stats
+        return stats
+
+    def rxPacket(self, sysid: int, compid: int, seq: int, size: int, now: float = None):
+        """Update for a received packet"""
+        self.getSysid(sysid).rxPacket(compid, seq, size, now if now is not None else time.time())
+
+    def txPacket(self, sysid: int, size: int, now: float = None):
+        """Update for a transmitted packet. sysid is the target
+        vehicle, or None if not known"""
+        self.getSysid(sysid).txPacket(size, now if now is not None else time.time())
+
+    def duplicate(self, sysid: int, lag: float = None, now: float = None):
+        """Update for a packet that was already received on another link,
+        lag seconds earlier (None if not known)"""
+        self.getSysid(sysid).duplicate(lag, now if now is not None else time.time())
+
+    def get(self, now: float = None) -> dict:
+        """Get the statistics for all sysids.
+        Key is sysid, Val is a dict of the statistics"""
+        if now is None:
+            now = time.time()
+        return {sysid: stats.get(now) for sysid, stats in self.sysids.items()}
@@ -20,12 +20,58 @@ along with this program. If not, see <https://www.gnu.org/licenses/>.
 """
 Subclass for managing MAVLink connections
 """
-import collections
 import asyncio
-import time
+import collections
 import logging
 
 from PaGS.mavlink.pymavutil import getpymavlinkpackage
+from PaGS.mavlink.framescanner import BufferedFrameScanner, frameMsgId
+from PaGS.mavlink.lazymessage import LazyMessage
+from PaGS.connection.packetcapture import PacketCapture
+from PaGS.connection.linkstats import LinkStats
+from PaGS.connection.radioflow import RadioFlowControl
+
+# Parser backends:
+# python - pymavlink's pure python parser
+# native - pymavlink's mavnative C parser, if available for the dialect
+# scanner - PaGS FrameScanner, with pymavlink decoding of each frame
+PARSERS = ('python', 'native', 'scanner')
+
+# TX priority levels, highest first. Packets are sent from a
+# level only when all higher levels are empty
+PRIORITY_CONTROL = 0
+PRIORITY_COMMAND = 1
+PRIORITY_BULK = 2
+PRIORITIES = ('control', 'command', 'bulk')
+
+# Messages sent at the control and bulk priorities. All
+# others are at the command priority
+CONTROL_MSGS = ('HEARTBEAT', 'MANUAL_CONTROL', 'RC_CHANNELS_OVERRIDE', 'SET_MODE')
+BULK_MSGS = ('PARAM_REQUEST_LIST', 'PARAM_REQUEST_READ', 'PARAM_SET', 'PARAM_VALUE',
+             'MISSION_REQUEST_LIST', 'MISSION_COUNT', 'MISSION_REQUEST', 'MISSION_REQUEST_INT',
+             'MISSION_ITEM', 'MISSION_ITEM_INT', 'FENCE_POINT', 'RALLY_POINT',
+             'LOG_REQUEST_LIST', 'LOG_REQUEST_DATA', 'FILE_TRANSFER_PROTOCOL',
+             'GPS_RTCM_DATA', 'GPS_INJECT_DATA', 'ENCAPSULATED_DATA', 'SERIAL_CONTROL')
+
+# sysid of the RADIO_STATUS messages from a local SiK-style radio
+RADIO_SYSID = 51
+
+
+def nativeAvailable(mod) -> bool:
+    """Check if the mavnative parser can be used for a dialect"""
+    return bool(getattr(mod, 'native_supported', False))
+
+
+def txPriorities(mod) -> dict:
+    """Get the TX priority of the control and bulk messages in a dialect.
+    Key is msgid, Val is the priority"""
+    priorities = {}
+    for msgid, msgtype in mod.mavlink_map.items():
+        if msgtype.name in CONTROL_MSGS:
+            priorities[msgid] = PRIORITY_CONTROL
+        elif msgtype.name in BULK_MSGS:
+            priorities[msgid] = PRIORITY_BULK
+    return priorities
 
 
 class MAVConnection(asyncio.Protocol):
@@ -34,42 +80,356 @@ class MAVConnection(asyncio.Protocol):
     """
     def __init__(self, dialect: str, mavversion: float, name: str,
                  srcsystem: int, srccomp: int, rxcallback,
-                 clcallback=None) -> None:
+                 clcallback=None, parser: str = 'python') -> None:
         self.sourceSystem = srcsystem
         self.sourceComponent = srccomp
         self.mod = getpymavlinkpackage(dialect, mavversion)
-        self.packetsRx = collections.deque()
-        self.packetsTx = collections.deque()
+
+        # Capture of the recent rx and tx packets. None if disabled
+        self.capture = None
+
+        # Select the parser backend, falling back to python
+        if parser not in PARSERS:
+            raise ValueError('Unknown parser (must be one of ' + ', '.join(PARSERS) + ')')
+        if parser == 'native' and not nativeAvailable(self.mod):
+            logging.debug("No native parser for %s - using python", name)
+            parser = 'python'
+        self.parser = parser
+
         self.mav = self.mod.MAVLink(self, self.sourceSystem,
-                                    self.sourceComponent, use_native=False)
+                                    self.sourceComponent,
+                                    use_native=(self.parser == 'native'))
         self.mav.robust_parsing = True
+        self.scanner = BufferedFrameScanner(self.mod) if self.parser == 'scanner' else None
 
-        # BW measures for RX, per sysid
-        # bytes and time(sec) in measurement period
-        self.bytesmeasure = (0, time.time())
-        self.bytespersecond = 0
+        # Link quality statistics, per sysid
+        self.stats = LinkStats()
 
         self.callback = rxcallback
         self.closecallback = clcallback
+        self.transport = None
+        # The event loop of the transport. Set when connected
+        self.loop = None
+
+        # Pre-filter for raw frames, before they are decoded, and the
+        # callback for the frames that passed it and are valid
+        self.rxfilter = None
+        self.rxaccept = None
+
+        # Only decode the payload of each packet when first used.
+        # Only used by the scanner parser
+        self.lazydecode = False
+        # Number of frames dropped by the pre-filter
+        self.rxfiltered = 0
 
-        # Loss % per sysid
+        # Queues of (buffer, sysid) to transmit, one per priority level.
+        # Everything queued in one event loop iteration is written in
+        # batches of up to txbatchsize bytes by flushTx()
+        self.txqueue = [collections.deque() for p in PRIORITIES]
+        self.txpriority = txPriorities(self.mod)
+        self.txbatchsize = 4096
+        self.txflush = None
+        # Set if txflush is waiting for the bulk rate limit
+        self.txflushdelayed = False
 
-        # BW measures for TX, per sysid
+        # The transport's write buffer high-water mark (bytes) for pausing
+        # the tx queues. None for the transport's default
+        self.txhighwater = None
+        # Set when the transport's write buffer is above the high-water mark
+        self.writepaused = False
+        # Number of times writing has been paused
+        self.writepauses = 0
+
+        # Rate limit of the bulk tx queue, from the local radio's RADIO_STATUS
+        self.radioflow = RadioFlowControl(name)
+        self.radiostatusid = getattr(self.mod, 'MAVLINK_MSG_ID_RADIO_STATUS', None)
 
         self.name = name
 
+    def setCapture(self, maxpackets: int = None, maxbytes: int = None):
+        """
+        Keep a history of the most recent packets, limited to maxpackets
+        and/or maxbytes. If both are None, stop capturing
+        """
+        if maxpackets is None and maxbytes is None:
+            self.capture = None
+        else:
+            self.capture = PacketCapture(maxpackets, maxbytes)
+
+    def snapshotCapture(self):
+        """
+        Get a list of the captured (time, direction, packet) entries.
+        rx packets are decoded mavlink messages, tx packets are bytes
+        """
+        return self.capture.snapshot(self.decodeCaptured) if self.capture is not None else []
+
+    def drainCapture(self):
+        """
+        Get a list of the captured (time, direction, packet) entries
+        and empty the capture
+        """
+        return self.capture.drain(self.decodeCaptured) if self.capture is not None else []
+
+    def decodeCaptured(self, buf: bytes):
+        """
+        Decode a captured rx packet. Bad packets are left as bytes
+        """
+        try:
+            return self.mav.decode(bytearray(buf))
+        except self.mod.MAVError:
+            return buf
+
+    def recordRx(self, sysid: int, compid: int, seq: int, size: int):
+        """
+        Update the statistics for a received packet
+        """
+        self.stats.rxPacket(sysid, compid, seq, size)
+
+    def recordTx(self, data: bytes, sysid: int = None):
+        """
+        Update the statistics and capture for a transmitted buffer
+        """
+        self.stats.txPacket(sysid, len(data))
+        if self.capture is not None:
+            self.capture.add('tx', bytes(data))
+
+    def initTransport(self, transport):
+        """
+        Set the transport for a new connection
+        """
+        self.transport = transport
+        # called from the loop that runs the transport
+        self.loop = asyncio.get_event_loop()
+        if self.txhighwater is not None:
+            transport.set_write_buffer_limits(high=self.txhighwater)
+
+    def getLoop(self):
+        """
+        Get the event loop the link runs in. The current loop if
+        it's not connected yet
+        """
+        return self.loop if self.loop is not None else asyncio.get_event_loop()
+
+    def send_data(self, data: bytes, sysid: int = None, priority: int = None) -> None:
+        """
+        Queue a buffer to send across the link. sysid is the target
+        vehicle. If priority is None, it is found from the msgid. The
+        queues are flushed on the next event loop iteration
+        """
+        if priority is None:
+            priority = self.txpriority.get(frameMsgId(data), PRIORITY_COMMAND)
+        self.txqueue[priority].append((data, sysid))
+        if self.txflush is None:
+            self.txflush = self.getLoop().call_soon(self.flushTx)
+        elif self.txflushdelayed and priority != PRIORITY_BULK:
+            # don't hold non-bulk packets behind the bulk rate limit
+            self.txflush.cancel()
+            self.txflush = self.getLoop().call_soon(self.flushTx)
+            self.txflushdelayed = False
+
+    def flushTx(self):
+        """
+        Write out the tx queues, highest priority first, until they are
+        empty or the transport pauses writing. Bulk packets are held
+        back by the radio rate limit, if active
+        """
+        if self.txflush is not None:
+            self.txflush.cancel()
+            self.txflush = None
+            self.txflushdelayed = False
+        bulk = self.txqueue[PRIORITY_BULK]
+        while not self.writepaused:
+            batch = []
+            size = 0
+            for queue in self.txqueue:
+                while queue and size < self.txbatchsize:
+                    if queue is bulk and not self.radioflow.take(len(queue[0][0])):
+                        break
+                    data, sysid = queue.popleft()
+                    batch.append((data, sysid))
+                    size += len(data)
+            if not batch:
+                break
+            if not self.writeData(batch):
+                # no current connection, so drop everything
+                for queue in self.txqueue:
+                    queue.clear()
+                return
+        if bulk and not self.writepaused:
+            # wait for the rate limit
+            self.txflush = self.getLoop().call_later(self.radioflow.delay(len(bulk[0][0])), self.flushTx)
+            self.txflushdelayed = True
+
+    def writeData(self, queue: list) -> bool:
+        """
+        Write a list of (buffer, sysid) to the transport. Returns False
+        if there is no connection. Implemented by each link type
+        """
+        raise NotImplementedError
+
+    def getTxQueue(self) -> dict:
+        """
+        Get the depth of the tx queues
+        """
+        depth = {name: len(queue) for name, queue in zip(PRIORITIES, self.txqueue)}
+        depth['bytes'] = sum(len(data) for queue in self.txqueue for data, sysid in queue)
+        depth['transport'] = self.transport.get_write_buffer_size() if self.transport is not None else 0
+        depth['paused'] = self.writepaused
+        depth['pauses'] = self.writepauses
+        depth['txbuf'] = self.radioflow.txbuf
+        depth['bulkrate'] = self.radioflow.getRate()
+        return depth
+
+    def getTxQueues(self) -> dict:
+        """
+        Get the depth of the tx queues, as {Key=name, Val=dict of queue depths}
+        """
+        return {self.name: self.getTxQueue()}
+
+    def getStats(self) -> dict:
+        """
+        Get the link statistics, as {Key=name, Val={Key=sysid, Val=dict of stats}}
+        """
+        return {self.name: self.stats.get()}
+
+    def getSysidStats(self, sysid: int):
+        """
+        Get the statistics (SysidStats) of a sysid. None if nothing
+        has been sent to or received from the sysid
+        """
+        return self.stats.sysids.get(sysid)
+
+    def duplicate(self, sysid: int, lag: float = None):
+        """
+        A packet from sysid was already received on another link,
+        lag seconds earlier
+        """
+        self.stats.duplicate(sysid, lag)
+
+    def pause_writing(self):
+        """
+        The transport's write buffer is above the high-water mark
+        """
+        logging.debug("Pause writing - %s", self.name)
+        self.writepaused = True
+        self.writepauses += 1
+
+    def resume_writing(self):
+        """
+        The transport's write buffer has drained below the low-water mark
+        """
+        logging.debug("Resume writing - %s", self.name)
+        self.writepaused = False
+        self.flushTx()
+
+    def radioStatus(self, msg):
+        """
+        Adapt the bulk tx rate to a RADIO_STATUS from the local radio
+        """
+        if msg.get_srcSystem() == RADIO_SYSID:
+            self.radioflow.radioStatus(msg.txbuf)
+            if self.txflushdelayed:
+                self.flushTx()
+
+    def setRxFilter(self, func, accept=None):
+        """
+        Attach a callback to pre-filter raw frames before they are
+        decoded. Args are (frame, linkname) and it returns True if the
+        frame is to be decoded. None to remove the pre-filter.
+        accept is called with the same args once a frame that passed
+        the pre-filter has been CRC checked or decoded.
+        Only used by the scanner parser
+        """
+        self.rxfilter = func
+        self.rxaccept = accept
+
     def processPackets(self, data):
         """
         When data is recieved on the device, process
         into mavlink packets
         """
+        if self.scanner:
+            self.processFrames(data)
+            return
         msgList = self.mav.parse_buffer(data)
         if msgList:
             for msg in msgList:
-                self.packetsRx.append(msg)
+                if msg.get_type() != 'BAD_DATA':
+                    self.recordRx(msg.get_srcSystem(), msg.get_srcComponent(),
+                                  msg.get_seq(), len(msg.get_msgbuf()))
+                    if msg.get_msgId() == self.radiostatusid:
+                        self.radioStatus(msg)
+                if self.capture is not None:
+                    self.capture.add('rx', bytes(msg.get_msgbuf()))
                 if self.callback:
                     self.callback(msg, self.name)
 
+    def processFrames(self, data):
+        """
+        Split data into raw frames and only decode the frames
+        that pass the pre-filter, if any
+        """
+        for frame in self.scanner.frames(data):
+            if not self.processFrame(frame):
+                self.scanner.reject()
+
+    def get_buffer(self, sizehint: int):
+        """
+        Get the buffer to receive into, for transports that support
+        asyncio.BufferedProtocol. Only used by the scanner parser
+        """
+        return self.scanner.getBuffer()
+
+    def buffer_updated(self, nbytes: int):
+        """
+        nbytes were received into the buffer from get_buffer()
+        """
+        for frame in self.scanner.bufferFrames(nbytes):
+            if not self.processFrame(frame):
+                self.scanner.reject()
+
+    def processFrame(self, frame, validated: bool = False) -> bool:
+        """
+        Pre-filter and decode a single raw frame. validated is True if
+        the CRC has already been checked. Returns False if the frame
+        is not valid
+        """
+        if frame.msgId == self.radiostatusid and frame.srcSystem == RADIO_SYSID:
+            # the radio's sysid is not routed, so handle before the pre-filter
+            try:
+                self.radioStatus(self.mav.decode(self.scanner.keep(frame).buf))
+            except self.mod.MAVError as reason:
+                logging.debug("Bad frame - %s - %s", self.name, reason.message)
+                return False
+        if self.rxfilter and not self.rxfilter(frame, self.name):
+            # only drop frames that are valid, otherwise resync
+            if not validated and not self.scanner.validate(frame):
+                return False
+            self.rxfiltered += 1
+            self.recordRx(frame.srcSystem, frame.srcComponent, frame.seq, len(frame.buf))
+            return True
+        # signed packets need a full decode to check the signature.
+        # The frame may be a view of the scanner's buffer, so only
+        # copied once it's known to be wanted
+        if self.lazydecode and self.mav.signing.secret_key is None:
+            if not validated and not self.scanner.validate(frame):
+                return False
+            msg = LazyMessage(self.scanner.keep(frame), self.mav, self.mod.mavlink_map[frame.msgId])
+        else:
+            try:
+                msg = self.mav.decode(self.scanner.keep(frame).buf)
+            except self.mod.MAVError as reason:
+                logging.debug("Bad frame - %s - %s", self.name, reason.message)
+                return False
+        if self.rxaccept:
+            self.rxaccept(frame, self.name)
+        self.recordRx(frame.srcSystem, frame.srcComponent, frame.seq, len(frame.buf))
+        if self.capture is not None:
+            self.capture.add('rx', bytes(frame.buf))
+        if self.callback:
+            self.callback(msg, self.name)
+        return True
+
     def connection_lost(self, exc):
         logging.debug('Connection Lost - %s', self.name)
         if self.closecallback:
@@ -80,17 +440,3 @@ class MAVConnection(asyncio.Protocol):
         logging.debug('Error Received - %s - %s', self.name, str(exc))
         if self.closecallback:
             self.closecallback(self.name)
-
-    def updatebandwidth(self, bytelen):
-        """
-        Update the bandwidth (bytes/sec) measurement by
-        taking in the number of new bytes recieved,
-        every 5 seconds
-        """
-        (bytesi, timei) = self.bytesmeasure
-        if time.time() - timei > 5:
-            # do an update if 5 seconds since last BW update
-            self.bytespersecond = int(bytesi / (time.time() - timei))
-            self.bytesmeasure = (bytelen, time.time())
-        else:
-            self.bytesmeasure = (bytesi + bytelen, timei)
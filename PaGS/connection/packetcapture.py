@@ -0,0 +1,70 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Bounded history of the packets on a link, for debugging
+"""
+import collections
+import time
+
+
+class PacketCapture():
+    """
+    A ring of the most recent rx and tx packets on a link. The oldest
+    packets are dropped once there are more than maxpackets, or they
+    use more than maxbytes. None for no limit
+    """
+
+    def __init__(self, maxpackets: int = None, maxbytes: int = None):
+        if maxpackets is None and maxbytes is None:
+            raise ValueError('Packet capture needs a packet or byte limit')
+        self.maxpackets = maxpackets
+        self.maxbytes = maxbytes
+
+        # Entries are (time, direction, bytes). Direction is 'rx' or 'tx'
+        self.packets = collections.deque()
+        self.bytes = 0
+
+        # Number of packets dropped to keep within the limits
+        self.dropped = 0
+
+    def add(self, direction: str, buf: bytes):
+        """Add a packet's raw bytes to the capture"""
+        self.packets.append((time.time(), direction, buf))
+        self.bytes += len(buf)
+        while ((self.maxpackets is not None and len(self.packets) > self.maxpackets) or
+               (self.maxbytes is not None and self.bytes > self.maxbytes)):
+            self.bytes -= len(self.packets.popleft()[2])
+            self.dropped += 1
+
+    def snapshot(self, decode=None):
+        """Get a list of the captured (time, direction, packet) entries.
+        If decode is set, the rx packets are passed through it"""
+        if decode is None:
+            return list(self.packets)
+        return [(stamp, direction, decode(buf) if direction == 'rx' else buf)
+                for (stamp, direction, buf) in self.packets]
+
+    def drain(self, decode=None):
+        """Get a list of the captured (time, direction, packet) entries
+        and empty the capture"""
+        entries = self.snapshot(decode)
+        self.packets.clear()
+        self.bytes = 0
+        return entries
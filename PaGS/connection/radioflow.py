@@ -0,0 +1,116 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Adaptive tx rate control from the RADIO_STATUS messages of
+SiK-style telemetry radios
+"""
+import logging
+import time
+
+
+class RadioFlowControl():
+    """
+    Token bucket limiting the bulk tx rate (bytes/sec) of a link. The
+    rate is adapted from the free space in the local radio's tx buffer
+    (txbuf, 0-100%): decreased when the buffer is filling, increased when
+    it is mostly empty. No limit until a RADIO_STATUS is received, or if
+    none have been received for timeout seconds
+    """
+
+    def __init__(self, name: str, startrate: float = 2000, minrate: float = 100,
+                 maxrate: float = 20000, burst: float = 512, timeout: float = 5):
+        self.name = name
+        self.startrate = startrate
+        self.minrate = minrate
+        self.maxrate = maxrate
+        self.burst = burst
+        self.timeout = timeout
+
+        # Current rate limit (bytes/sec)
+        self.rate = startrate
+        self.tokens = burst
+        self.lastfill = None
+
+        # txbuf and time of the last RADIO_STATUS
+        self.txbuf = None
+        self.laststatus = None
+
+    def isActive(self, now: float) -> bool:
+        """True if the rate limit is in use"""
+        return self.laststatus is not None and now - self.laststatus < self.timeout
+
+    def radioStatus(self, txbuf: int, now: float = None):
+        """Adapt the rate to the radio's tx buffer free space (%)"""
+        if now is None:
+            now = time.time()
+        if not self.isActive(now):
+            logging.debug("Radio flow %s: txbuf %d%%, limiting bulk tx to %.0f B/s",
+                          self.name, txbuf, self.startrate)
+            self.rate = self.startrate
+            self.tokens = self.burst
+            self.lastfill = now
+        self.txbuf = txbuf
+        self.laststatus = now
+
+        oldrate = self.rate
+        if txbuf < 20:
+            # nearly full, back off hard
+            self.rate = max(self.minrate, self.rate * 0.5)
+        elif txbuf < 50:
+            self.rate = max(self.minrate, self.rate * 0.9)
+        elif txbuf > 80:
+            self.rate = min(self.maxrate, self.rate + 0.1 * self.startrate)
+        if self.rate != oldrate:
+            logging.debug("Radio flow %s: txbuf %d%%, bulk tx %.0f -> %.0f B/s",
+                          self.name, txbuf, oldrate, self.rate)
+
+    def refill(self, now: float):
+        """Add the tokens since the last refill"""
+        if self.lastfill is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.lastfill) * self.rate)
+        self.lastfill = now
+
+    def take(self, size: int, now: float = None) -> bool:
+        """Returns True if size bytes can be sent now"""
+        if now is None:
+            now = time.time()
+        if not self.isActive(now):
+            return True
+        self.refill(now)
+        # packets larger than the burst are sent on a full bucket
+        if self.tokens >= min(size, self.burst):
+            self.tokens -= size
+            return True
+        return False
+
+    def delay(self, size: int, now: float = None) -> float:
+        """Seconds until size bytes can be sent"""
+        if now is None:
+            now = time.time()
+        if not self.isActive(now):
+            return 0
+        self.refill(now)
+        return max(0, (min(size, self.burst) - self.tokens) / self.rate)
+
+    def getRate(self, now: float = None) -> float:
+        """Get the current rate limit (bytes/sec). None if not limited"""
+        if now is None:
+            now = time.time()
+        return self.rate if self.isActive(now) else None
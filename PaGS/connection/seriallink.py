@@ -31,23 +31,35 @@ class SerialConnection(MAVConnection):
     A MAVLink Serial port connection
     """
     def __init__(self, dialect: str, mavversion: float, name: str,
-                 srcsystem: int, srccomp: int, rxcallback, clcallback=None) -> None:
+                 srcsystem: int, srccomp: int, rxcallback, clcallback=None,
+                 parser: str = 'python') -> None:
         MAVConnection.__init__(self, dialect, mavversion, name,
-                               srcsystem, srccomp, rxcallback, clcallback)
+                               srcsystem, srccomp, rxcallback, clcallback, parser)
         self.transport = None
 
+        # Keep the queued packets in the tx queues, rather than the
+        # transport, so that higher priority packets are not stuck
+        # behind bulk packets on slow links
+        self.txhighwater = 1024
+        self.txbatchsize = 256
+
     def connection_made(self, transport):
-        self.transport = transport
+        self.initTransport(transport)
 
     def data_received(self, data: bytes):
         self.processPackets(data)
 
-    def send_data(self, data: bytes) -> None:
-        """Send data across the link"""
-        if self.transport is not None:
-            self.transport.write(data)
+    def writeData(self, queue: list) -> bool:
+        """Write the queued buffers as a single write"""
+        if self.transport is None:
+            return False
+        for data, sysid in queue:
+            self.recordTx(data, sysid)
+        self.transport.write(b''.join(data for data, sysid in queue))
+        return True
 
     def close(self):
+        self.flushTx()
         if self.transport:
             self.transport.close()
 
@@ -20,6 +20,7 @@ along with this program. If not, see <https://www.gnu.org/licenses/>.
 """
 Module for defining tcp connections to mavlink
 """
+import asyncio
 import logging
 import socket
 
@@ -31,15 +32,16 @@ class TCPConnection(MAVConnection):
     A MAVLink TCP connection (server or client)
     """
     def __init__(self, dialect: str, mavversion: float, name: str,
-                 srcsystem: int, srccomp: int, rxcallback, server: bool, clcallback=None) -> None:
+                 srcsystem: int, srccomp: int, rxcallback, server: bool, clcallback=None,
+                 parser: str = 'python') -> None:
         MAVConnection.__init__(self, dialect, mavversion, name,
-                               srcsystem, srccomp, rxcallback, clcallback)
+                               srcsystem, srccomp, rxcallback, clcallback, parser)
         self.server = server
         self.transport = None
 
     def connection_made(self, transport) -> None:
         logging.debug("Connection made %s", self.name)
-        self.transport = transport
+        self.initTransport(transport)
         sock = self.transport.get_extra_info('socket')
         sock.setsockopt(socket.SOL_TCP, socket.TCP_NODELAY, 1)
 
@@ -47,18 +49,209 @@ class TCPConnection(MAVConnection):
         logging.debug("Rx packet %s", self.name)
         self.processPackets(data)
 
-    def send_data(self, data: bytes) -> None:
-        """Send a bytes through the link"""
+    def writeData(self, queue: list) -> bool:
+        """Write the queued buffers as a single write"""
         try:
-            self.transport.write(data)
-            logging.debug("Tx packet %s", self.name)
+            self.transport.write(b''.join(data for data, sysid in queue))
+            for data, sysid in queue:
+                self.recordTx(data, sysid)
+            logging.debug("Tx %d packets %s", len(queue), self.name)
+            return True
         except AttributeError:
             # no transport - no current connection
             logging.debug("Tx send error %s", self.name)
             if self.closecallback is not None:
                 self.closecallback(self.name)
-            return
+            return False
 
     def close(self):
+        self.flushTx()
         if self.transport:
             self.transport.close()
+
+
+class TCPServerClient(TCPConnection):
+    """
+    A single client of a TCPServerConnection, with it's own parser,
+    statistics and tx queues. Received packets are passed on with
+    the server's name
+    """
+    def __init__(self, server, dialect: str, mavversion: float, name: str,
+                 srcsystem: int, srccomp: int, rxcallback, parser: str = 'python') -> None:
+        TCPConnection.__init__(self, dialect, mavversion, name, srcsystem, srccomp,
+                               rxcallback, True, None, parser)
+        self.tcpserver = server
+        # (ip, port) of the client
+        self.addr = None
+
+    def connection_made(self, transport) -> None:
+        TCPConnection.connection_made(self, transport)
+        self.addr = transport.get_extra_info('peername')[:2]
+        self.tcpserver.addClient(self)
+
+    def connection_lost(self, exc):
+        logging.debug('Client Lost - %s - %s', self.name, self.addr)
+        self.tcpserver.removeClient(self)
+
+    def recordRx(self, sysid: int, compid: int, seq: int, size: int):
+        """Update the statistics and the client of the sysid"""
+        TCPConnection.recordRx(self, sysid, compid, seq, size)
+        self.tcpserver.sysidclients[sysid] = self.addr
+
+
+def bufferedAvailable() -> bool:
+    """Check if the buffered (receive into the scanner's buffer)
+    TCP links can be used. asyncio.BufferedProtocol needs Python 3.7"""
+    return hasattr(asyncio, 'BufferedProtocol')
+
+
+if bufferedAvailable():
+    class BufferedTCPConnection(TCPConnection, asyncio.BufferedProtocol):
+        """
+        A TCPConnection that the transport receives into directly, using
+        the scanner's buffer (see MAVConnection.get_buffer()). Only for
+        the scanner parser
+        """
+
+    class BufferedTCPServerClient(TCPServerClient, asyncio.BufferedProtocol):
+        """
+        A TCPServerClient that the transport receives into directly. Only
+        for the scanner parser
+        """
+else:
+    BufferedTCPConnection = None
+    BufferedTCPServerClient = None
+
+
+class TCPServerConnection():
+    """
+    A MAVLink TCP server, which can have many clients. Each client has
+    it's own TCPServerClient protocol, and they are presented as a single
+    link. Packets are sent to the client that their sysid was last
+    received from, or all clients if not known
+    """
+    def __init__(self, dialect: str, mavversion: float, name: str,
+                 srcsystem: int, srccomp: int, rxcallback, clcallback=None,
+                 parser: str = 'python') -> None:
+        self.dialect = dialect
+        self.mavversion = mavversion
+        self.name = name
+        self.sourceSystem = srcsystem
+        self.sourceComponent = srccomp
+        self.callback = rxcallback
+        self.closecallback = clcallback
+        self.parser = parser
+
+        # The asyncio Server, set by the creator
+        self.listener = None
+
+        # Connected clients. Key is (ip, port), Val is TCPServerClient
+        self.clients = {}
+
+        # The client each sysid was last received from
+        # Key is sysid, Val is (ip, port)
+        self.sysidclients = {}
+
+        # Settings applied to each client
+        self.rxfilter = None
+        self.rxaccept = None
+        self.lazydecode = False
+        self.capturecfg = None
+
+    def newClient(self):
+        """Create the protocol for a newly accepted client"""
+        if self.parser == 'scanner' and bufferedAvailable():
+            clientclass = BufferedTCPServerClient
+        else:
+            clientclass = TCPServerClient
+        client = clientclass(self, self.dialect, self.mavversion, self.name,
+                             self.sourceSystem, self.sourceComponent,
+                             self.callback, self.parser)
+        client.setRxFilter(self.rxfilter, self.rxaccept)
+        client.lazydecode = self.lazydecode
+        if self.capturecfg is not None:
+            client.setCapture(*self.capturecfg)
+        return client
+
+    def addClient(self, client):
+        """A client has connected"""
+        logging.debug("New client %s - %s", client.addr, self.name)
+        self.clients[client.addr] = client
+
+    def removeClient(self, client):
+        """A client has disconnected"""
+        if self.clients.get(client.addr) is client:
+            del self.clients[client.addr]
+        for sysid, addr in list(self.sysidclients.items()):
+            if addr == client.addr:
+                del self.sysidclients[sysid]
+
+    def clientName(self, client) -> str:
+        """Name of a client, for statistics"""
+        return "{0}/{1}:{2}".format(self.name, client.addr[0], client.addr[1])
+
+    def send_data(self, data: bytes, sysid: int = None, priority: int = None) -> None:
+        """Queue a buffer to send to the client of sysid, or
+        all clients if not known"""
+        client = self.clients.get(self.sysidclients.get(sysid))
+        if client is not None:
+            client.send_data(data, sysid, priority)
+        elif not self.clients:
+            logging.debug("No clients to tx to %s", self.name)
+        else:
+            for client in self.clients.values():
+                client.send_data(data, sysid, priority)
+
+    def setRxFilter(self, func, accept=None):
+        """Attach a callback to pre-filter raw frames on all clients"""
+        self.rxfilter = func
+        self.rxaccept = accept
+        for client in self.clients.values():
+            client.setRxFilter(func, accept)
+
+    def setCapture(self, maxpackets: int = None, maxbytes: int = None):
+        """Capture the recent packets on all clients"""
+        if maxpackets is None and maxbytes is None:
+            self.capturecfg = None
+        else:
+            self.capturecfg = (maxpackets, maxbytes)
+        for client in self.clients.values():
+            client.setCapture(maxpackets, maxbytes)
+
+    def snapshotCapture(self):
+        """Get a list of the captured (time, direction, packet)
+        entries of all clients, in time order"""
+        return sorted((entry for client in self.clients.values() for entry in client.snapshotCapture()),
+                      key=lambda entry: entry[0])
+
+    def drainCapture(self):
+        """Get a list of the captured (time, direction, packet) entries
+        of all clients, in time order, and empty the captures"""
+        return sorted((entry for client in self.clients.values() for entry in client.drainCapture()),
+                      key=lambda entry: entry[0])
+
+    def getStats(self) -> dict:
+        """Get the statistics of each client"""
+        return {self.clientName(client): client.stats.get() for client in self.clients.values()}
+
+    def getTxQueues(self) -> dict:
+        """Get the depth of the tx queues of each client"""
+        return {self.clientName(client): client.getTxQueue() for client in self.clients.values()}
+
+    def getSysidStats(self, sysid: int):
+        """Get the statistics of a sysid, from it's client"""
+        client = self.clients.get(self.sysidclients.get(sysid))
+        return client.getSysidStats(sysid) if client is not None else None
+
+    def duplicate(self, sysid: int, lag: float = None):
+        """A packet from sysid was already received on another link"""
+        client = self.clients.get(self.sysidclients.get(sysid))
+        if client is not None:
+            client.duplicate(sysid, lag)
+
+    def close(self):
+        """Stop the server and close all clients"""
+        if self.listener is not None:
+            self.listener.close()
+        for client in list(self.clients.values()):
+            client.close()
@@ -21,47 +21,272 @@ along with this program. If not, see <https://www.gnu.org/licenses/>.
 Module for defining udp connections to mavlink
 """
 import logging
+import platform
+import socket
+import struct
+import time
 
 from PaGS.connection.mavconnection import MAVConnection
 
+# Socket option for the kernel's count of datagrams dropped on a
+# socket, sent with each datagram (Linux only)
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+
+
+def batchAvailable() -> bool:
+    """Check if BatchUDPConnection can be used on this platform"""
+    return platform.system() == 'Linux'
+
 
 class UDPConnection(MAVConnection):
     """
-    A MAVLink UDP connection (server or client)
+    A MAVLink UDP connection (server or client). A server can have many
+    remote peers, and sends to the peer that each sysid was received from
     """
     def __init__(self, dialect: str, mavversion: float, name: str,
-                 srcsystem: int, srccomp: int, rxcallback, server: bool, clcallback=None) -> None:
+                 srcsystem: int, srccomp: int, rxcallback, server: bool, clcallback=None,
+                 parser: str = 'python', mtu: int = 1400) -> None:
         MAVConnection.__init__(self, dialect, mavversion, name,
-                               srcsystem, srccomp, rxcallback, clcallback)
+                               srcsystem, srccomp, rxcallback, clcallback, parser)
         self.server = server
         self.transport = None
 
+        # Queued packets are packed into datagrams of up to mtu bytes.
+        # 0 for one packet per datagram
+        self.mtu = mtu
+        self.txbatchsize = max(mtu, 1)
+
+        # Remote peers of a server, removed after peertimeout sec
+        # without receiving anything
+        # Key is (ip, port), Val is time of last rx
+        self.peers = {}
+        self.peertimeout = 10
+        self.lastexpire = 0
+
+        # The peer each sysid was last received from
+        # Key is sysid, Val is (ip, port)
+        self.sysidpeers = {}
+
+        # The sender of the datagram being processed
+        self.rxaddr = None
+
         if self.server:
             self.addr = None
         else:
             self.addr = (name.split(':')[1], int(name.split(':')[2]))
 
     def connection_made(self, transport) -> None:
-        self.transport = transport
+        self.initTransport(transport)
 
     def datagram_received(self, data, addr) -> None:
         """A packet is recieved by this link"""
         logging.debug("Rx packet %s", self.name)
-        self.addr = addr
+        if self.server:
+            if addr not in self.peers:
+                logging.debug("New peer %s - %s", addr, self.name)
+            self.peers[addr] = time.time()
+        self.rxaddr = addr
         self.processPackets(data)
+        self.rxaddr = None
 
-    def send_data(self, data: bytes) -> None:
-        """Send a buffer of bytes to the other side of the link"""
-        if self.addr:
-            try:
-                logging.debug("Tx packet %s", self.name)
-                self.transport.sendto(data, self.addr)
-            except AttributeError:
-                # no transport - no current connection
-                self.closecallback(self.name)
-        else:
+    def recordRx(self, sysid: int, compid: int, seq: int, size: int):
+        """Update the statistics and the peer of the sysid"""
+        MAVConnection.recordRx(self, sysid, compid, seq, size)
+        if self.server and self.rxaddr is not None:
+            self.sysidpeers[sysid] = self.rxaddr
+
+    def expirePeers(self, now: float = None):
+        """Remove any peers that have timed out"""
+        if now is None:
+            now = time.time()
+        if now - self.lastexpire < 1:
+            return
+        self.lastexpire = now
+        for addr, lastrx in list(self.peers.items()):
+            if now - lastrx > self.peertimeout:
+                logging.debug("Peer timed out %s - %s", addr, self.name)
+                del self.peers[addr]
+        for sysid, addr in list(self.sysidpeers.items()):
+            if addr not in self.peers:
+                del self.sysidpeers[sysid]
+
+    def getPeers(self):
+        """Get the remote peers of a server.
+        Returns a dict of {Key=(ip, port), Val=(time of last rx, list of sysids)}"""
+        self.expirePeers()
+        return {addr: (lastrx, sorted(sysid for sysid, peer in self.sysidpeers.items() if peer == addr))
+                for addr, lastrx in self.peers.items()}
+
+    def writeData(self, queue: list) -> bool:
+        """Send the queued buffers to the peer of their sysid, packed
+        into as few datagrams as the mtu allows. Buffers for an unknown
+        sysid are sent to all peers"""
+        if not self.server:
+            if not self.addr:
+                logging.debug("No remote to tx to %s", self.name)
+                return False
+            return self.sendDatagrams(queue, self.addr)
+
+        self.expirePeers()
+        if not self.peers:
             logging.debug("No remote to tx to %s", self.name)
+            return False
+        # Key is (ip, port), Val is list of (buffer, sysid)
+        peerqueues = {}
+        for data, sysid in queue:
+            addr = self.sysidpeers.get(sysid)
+            for peer in ((addr,) if addr else self.peers):
+                peerqueues.setdefault(peer, []).append((data, sysid))
+        for addr, peerqueue in peerqueues.items():
+            if not self.sendDatagrams(peerqueue, addr):
+                return False
+        return True
+
+    def sendDatagrams(self, queue: list, addr) -> bool:
+        """Send buffers to a single remote, packed into datagrams"""
+        try:
+            datagram = bytearray()
+            for data, sysid in queue:
+                if datagram and len(datagram) + len(data) > self.mtu:
+                    self.transport.sendto(datagram, addr)
+                    datagram = bytearray()
+                datagram += data
+                self.recordTx(data, sysid)
+            self.transport.sendto(datagram, addr)
+            logging.debug("Tx %d packets %s", len(queue), self.name)
+            return True
+        except AttributeError:
+            # no transport - no current connection
+            self.closecallback(self.name)
+            return False
 
     def close(self):
+        self.flushTx()
         if self.transport:
             self.transport.close()
+
+
+class DatagramSocketTransport():
+    """
+    A minimal datagram transport for a non-blocking socket that is
+    read by it's BatchUDPConnection
+    """
+    def __init__(self, loop, sock, protocol) -> None:
+        self.loop = loop
+        self.sock = sock
+        self.protocol = protocol
+        self.closing = False
+
+    def sendto(self, data, addr=None):
+        """Send a datagram. It's dropped if the socket buffer is full"""
+        if self.closing:
+            return
+        try:
+            if addr is None or self.protocol.addr is not None:
+                # connected socket
+                self.sock.send(data)
+            else:
+                self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            logging.debug("Tx socket full %s", self.protocol.name)
+        except OSError as exc:
+            self.protocol.error_received(exc)
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+    def get_extra_info(self, name: str, default=None):
+        if name == 'socket':
+            return self.sock
+        if name == 'sockname':
+            return self.sock.getsockname()
+        return default
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.loop.call_soon(self.protocol.connection_lost, None)
+
+
+class BatchUDPConnection(UDPConnection):
+    """
+    A UDPConnection that reads it's own socket, draining up to
+    maxbatch datagrams each time the socket is readable rather than
+    one per event loop iteration. The socket receive buffer is raised
+    to rcvbuf bytes to absorb bursts, and the kernel's count of dropped
+    datagrams is kept. Linux only
+    """
+    def __init__(self, dialect: str, mavversion: float, name: str,
+                 srcsystem: int, srccomp: int, rxcallback, server: bool, clcallback=None,
+                 parser: str = 'python', mtu: int = 1400, rcvbuf: int = 4 * 1024 * 1024,
+                 maxbatch: int = 64) -> None:
+        UDPConnection.__init__(self, dialect, mavversion, name, srcsystem, srccomp,
+                               rxcallback, server, clcallback, parser, mtu)
+        self.rcvbuf = rcvbuf
+        self.maxbatch = maxbatch
+
+        # Receive buffer size given by the kernel. This can be capped
+        # by net.core.rmem_max
+        self.rcvbufsize = 0
+        # Datagrams dropped by the kernel, due to a full receive buffer
+        self.kerneldrops = 0
+        self.ancbufsize = socket.CMSG_SPACE(4)
+
+    def open(self, loop):
+        """Create the socket, bound to the local address (server) or
+        connected to the remote address (client), and start reading"""
+        constr = self.name.split(':')
+        family, socktype, proto, canonname, addr = socket.getaddrinfo(
+            constr[1], int(constr[2]), type=socket.SOCK_DGRAM)[0]
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            except OSError:
+                logging.debug("No kernel drop count %s", self.name)
+            if self.server:
+                sock.bind(addr)
+            else:
+                sock.connect(addr)
+        except OSError:
+            sock.close()
+            raise
+        self.rcvbufsize = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.connection_made(DatagramSocketTransport(loop, sock, self))
+        loop.add_reader(sock.fileno(), self.readDatagrams)
+
+    def readDatagrams(self):
+        """Read the waiting datagrams, up to maxbatch"""
+        transport = self.transport
+        for i in range(self.maxbatch):
+            if transport.is_closing():
+                return
+            try:
+                data, ancdata, flags, addr = transport.sock.recvmsg(65535, self.ancbufsize)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                self.error_received(exc)
+                return
+            for level, ctype, cdata in ancdata:
+                if level == socket.SOL_SOCKET and ctype == SO_RXQ_OVFL and len(cdata) >= 4:
+                    self.kerneldrops = struct.unpack('=I', cdata[:4])[0]
+            self.datagram_received(data, addr)
+
+    def getTxQueue(self) -> dict:
+        """
+        Get the depth of the tx queues, and the socket receive buffer
+        size and drops
+        """
+        depth = UDPConnection.getTxQueue(self)
+        depth['rxbuf'] = self.rcvbufsize
+        depth['rxdrops'] = self.kerneldrops
+        return depth
@@ -0,0 +1,305 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Module for links that are run in a worker process. The worker owns
+the socket or serial port and does the framing and CRC checks, then
+passes the valid frames to the main process via a FrameRing
+"""
+import asyncio
+import logging
+import multiprocessing
+import platform
+import sys
+
+from PaGS.connection.mavconnection import MAVConnection
+from PaGS.mavlink.framescanner import FrameScanner, frameFromBuf
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+# Link types that can be run in a worker
+WORKERTYPES = ('serial', 'tcpclient', 'udpclient')
+
+# Messages from the worker to the main process. Each is one
+# byte, followed by the reason for MSG_LOST
+MSG_FRAMES = b'F'
+MSG_CONNECTED = b'C'
+MSG_LOST = b'L'
+
+
+def workersAvailable() -> bool:
+    """Check if worker links can be used on this platform"""
+    # the Windows event loops can't wait on a pipe, and the
+    # FrameRing's shared memory needs Python 3.8
+    return platform.system() != 'Windows' and sys.version_info >= (3, 8)
+
+
+class IngestWorker(asyncio.Protocol):
+    """
+    Runs in the worker process. Keeps the link open, puts each valid
+    frame in the ring and sends the buffers from the main process
+    """
+
+    def __init__(self, loop, strconnection: str, dialect: str, mavversion: float,
+                 ring, pipe, retry: float):
+        self.loop = loop
+        self.strconnection = strconnection
+        self.scanner = FrameScanner(getpymavlinkpackage(dialect, mavversion))
+        self.ring = ring
+        self.pipe = pipe
+        self.retry = retry
+
+        self.transport = None
+        # set when the link is lost or the worker is to stop
+        self.lost = asyncio.Event()
+        self.stopping = False
+
+    async def openLink(self):
+        """Open the link"""
+        constr = self.strconnection.split(":")
+        if constr[0] == "serial":
+            import serial_asyncio
+            await serial_asyncio.create_serial_connection(self.loop, lambda: self, constr[1], int(constr[2]))
+        elif constr[0] == "tcpclient":
+            await self.loop.create_connection(lambda: self, constr[1], int(constr[2]))
+        else:
+            await self.loop.create_datagram_endpoint(lambda: self, remote_addr=(constr[1], int(constr[2])))
+
+    async def run(self):
+        """Keep the link open until told to stop"""
+        while not self.stopping:
+            self.lost.clear()
+            try:
+                await asyncio.wait_for(self.openLink(), self.retry)
+            except (OSError, asyncio.TimeoutError) as reason:
+                self.pipe.send_bytes(MSG_LOST + (str(reason) or "Timeout").encode())
+                await asyncio.sleep(self.retry)
+                continue
+            self.pipe.send_bytes(MSG_CONNECTED)
+            await self.lost.wait()
+            if not self.stopping:
+                await asyncio.sleep(self.retry)
+        if self.transport is not None:
+            self.transport.close()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        added = False
+        for frame in self.scanner.frames(data):
+            if self.scanner.validate(frame):
+                added = self.ring.put(frame.buf) or added
+            else:
+                self.scanner.reject()
+        if added:
+            self.pipe.send_bytes(MSG_FRAMES)
+
+    def datagram_received(self, data, addr):
+        self.data_received(data)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if not self.stopping:
+            self.pipe.send_bytes(MSG_LOST + b'Link closed')
+        self.lost.set()
+
+    def error_received(self, exc):
+        # UDP errors, such as nothing listening on the port, are ignored
+        logging.debug('Error Received - %s - %s', self.strconnection, str(exc))
+
+    def readMain(self):
+        """Handle the buffers from the main process. An empty
+        buffer is the signal to stop"""
+        try:
+            while self.pipe.poll():
+                data = self.pipe.recv_bytes()
+                if not data:
+                    self.stop()
+                    return
+                if self.transport is None:
+                    continue
+                if self.strconnection.startswith('udp'):
+                    self.transport.sendto(data)
+                else:
+                    self.transport.write(data)
+        except (EOFError, OSError):
+            # main process has gone
+            self.stop()
+
+    def stop(self):
+        """Stop the worker"""
+        self.stopping = True
+        self.lost.set()
+
+
+def runWorker(strconnection: str, dialect: str, mavversion: float, ringname: str,
+              ringsize: int, pipe, retry: float):
+    """Entry point of the worker process"""
+    # imported here, as shared memory needs Python 3.8
+    from PaGS.connection.framering import FrameRing
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    ring = FrameRing(ringsize, ringname)
+    worker = IngestWorker(loop, strconnection, dialect, mavversion, ring, pipe, retry)
+    loop.add_reader(pipe.fileno(), worker.readMain)
+    try:
+        loop.run_until_complete(worker.run())
+    finally:
+        loop.remove_reader(pipe.fileno())
+        ring.close()
+        loop.close()
+
+
+class WorkerConnection(MAVConnection):
+    """
+    A MAVLink link (serial, tcpclient or udpclient) run in a worker
+    process. The worker reconnects the link itself if it is lost. The
+    frames from the worker have been CRC checked, so are only decoded
+    if they pass the pre-filter
+    """
+    def __init__(self, dialect: str, mavversion: float, name: str,
+                 srcsystem: int, srccomp: int, rxcallback, clcallback=None,
+                 retry: float = 1, ringsize: int = 1 << 20) -> None:
+        constr = name.split(":")
+        if constr[0] not in WORKERTYPES:
+            raise ValueError('Link type cannot be run in a worker (must be one of ' +
+                             ', '.join(WORKERTYPES) + ')')
+        MAVConnection.__init__(self, dialect, mavversion, name,
+                               srcsystem, srccomp, rxcallback, clcallback, 'scanner')
+        self.dialect = dialect
+        self.mavversion = mavversion
+        self.retry = retry
+        self.ringsize = ringsize
+
+        # one packet per datagram on UDP links
+        if constr[0] == "udpclient":
+            self.txbatchsize = 1
+        elif constr[0] == "serial":
+            self.txbatchsize = 256
+
+        self.ring = None
+        self.pipe = None
+        self.process = None
+        # Task stopping the worker process, once closed
+        self.closing = None
+
+        # Set when the worker has the link open
+        self.connected = False
+        # Reason the worker last lost or failed to open the link
+        self.lasterror = None
+
+    def start(self):
+        """Start the worker process"""
+        # imported here, as shared memory needs Python 3.8
+        from PaGS.connection.framering import FrameRing
+
+        self.ring = FrameRing(self.ringsize)
+        self.pipe, workerpipe = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=runWorker, daemon=True,
+                                               args=(self.name, self.dialect, self.mavversion,
+                                                     self.ring.name, self.ringsize, workerpipe, self.retry))
+        self.process.start()
+        workerpipe.close()
+        self.loop = asyncio.get_event_loop()
+        self.loop.add_reader(self.pipe.fileno(), self.readWorker)
+
+    def readWorker(self):
+        """Handle the messages from the worker, then process
+        the frames in the ring"""
+        try:
+            while self.pipe.poll():
+                msg = self.pipe.recv_bytes()
+                if msg[:1] == MSG_CONNECTED:
+                    logging.debug("Worker connected - %s", self.name)
+                    self.connected = True
+                elif msg[:1] == MSG_LOST:
+                    logging.debug("Worker lost link - %s - %s", self.name, msg[1:].decode())
+                    self.connected = False
+                    self.lasterror = msg[1:].decode()
+        except (EOFError, OSError):
+            logging.debug("Worker stopped - %s", self.name)
+            self.processRing()
+            self.close()
+            if self.closecallback is not None:
+                self.closecallback(self.name)
+            return
+        self.processRing()
+
+    def processRing(self):
+        """Process the frames in the ring"""
+        if self.ring is None:
+            return
+        for buf in self.ring.get():
+            self.processFrame(frameFromBuf(buf), True)
+
+    def writeData(self, queue: list) -> bool:
+        """Pass the queued buffers to the worker"""
+        if self.pipe is None:
+            return False
+        if not self.connected:
+            # drop, as the worker has no link
+            return True
+        try:
+            self.pipe.send_bytes(b''.join(data for data, sysid in queue))
+        except OSError:
+            logging.debug("Tx send error %s", self.name)
+            return False
+        for data, sysid in queue:
+            self.recordTx(data, sysid)
+        return True
+
+    def getRingDropped(self) -> int:
+        """Get the number of frames the worker dropped as the ring was full"""
+        return self.ring.getDropped() if self.ring is not None else 0
+
+    def close(self):
+        """Stop the worker process. It's left to exit in a task, so
+        use waitClosed() to know when it has"""
+        self.flushTx()
+        if self.pipe is not None:
+            self.getLoop().remove_reader(self.pipe.fileno())
+            try:
+                self.pipe.send_bytes(b'')
+            except OSError:
+                pass
+            self.pipe.close()
+            self.pipe = None
+        if self.process is not None:
+            self.closing = self.getLoop().create_task(self.stopWorker(self.process, self.ring))
+            self.process = None
+            self.ring = None
+        elif self.ring is not None:
+            self.ring.close(unlink=True)
+            self.ring = None
+
+    async def stopWorker(self, process, ring, timeout: float = 1):
+        """Wait for the worker process to exit, without blocking
+        the loop, then free it's ring"""
+        await self.getLoop().run_in_executor(None, process.join, timeout)
+        if process.is_alive():
+            process.terminate()
+            await self.getLoop().run_in_executor(None, process.join, timeout)
+        ring.close(unlink=True)
+
+    async def waitClosed(self):
+        """Wait until the worker process has stopped"""
+        if self.closing is not None:
+            await self.closing
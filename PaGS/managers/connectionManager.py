@@ -22,16 +22,24 @@ Class for managing all links
 It takes in all data (serial/tcp/udp) from links and
 passes it on (via callbacks) to the relevant vehicles
 """
-import collections
 import asyncio
 import logging
+import time
 from contextlib import suppress
 
 import serial_asyncio
 
-from PaGS.connection.udplink import UDPConnection
-from PaGS.connection.tcplink import TCPConnection
+from PaGS.connection.udplink import UDPConnection, BatchUDPConnection, batchAvailable
+from PaGS.connection.tcplink import TCPConnection, BufferedTCPConnection, TCPServerConnection, bufferedAvailable
 from PaGS.connection.seriallink import SerialConnection
+from PaGS.connection.workerlink import WorkerConnection, WORKERTYPES, workersAvailable
+from PaGS.connection.dedupwindow import DedupWindow
+from PaGS.connection.ingestscheduler import IngestScheduler
+from PaGS.connection.linkbackoff import LinkBackoff
+from PaGS.connection.linkselect import LinkSelector
+from PaGS.connection.mavconnection import txPriorities, PRIORITY_BULK
+from PaGS.mavlink.framescanner import frameMsgId
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
 
 
 class ConnectionManager():
@@ -40,11 +48,24 @@ class ConnectionManager():
     """
 
     def __init__(self, loop, dialect: str, mavversion: float,
-                 srcsystem: int, srccomp: int, reconnecttimeout: float = 1):
+                 srcsystem: int, srccomp: int, reconnecttimeout: float = 1,
+                 parser: str = 'scanner', lazydecode: bool = True, udpmtu: int = 1400,
+                 maxreconnect: float = 30, txpolicy: str = 'broadcast', bulkmode: str = 'policy',
+                 workerlinks=(), ingestbudget: float = 0.005, ingestslice: int = 16):
         """init the class"""
         self.dialect = dialect
         self.mavversion = mavversion
 
+        # Parser backend for new links
+        self.parser = parser
+
+        # Only decode packet payloads when first used (scanner parser only)
+        self.lazydecode = lazydecode
+
+        # Max size of the datagrams that queued packets are packed into
+        # on UDP links. 0 for one packet per datagram
+        self.udpmtu = udpmtu
+
         # GCS ID
         self.sourceSystem = srcsystem
         self.sourceComponent = srccomp
@@ -52,10 +73,16 @@ class ConnectionManager():
         # event attachements
         self.processed_packet = None
 
-        # The last 255 packets a seq numbers
-        # Key is vehiclename, val is a deque(maxlen=256) of the data
-        self.last255pkts = {}
-        self.last255seq = {}
+        # Packet capture limits for links, kept across reconnects
+        # Key is linkname, Val is (maxpackets, maxbytes)
+        self.capturecfg = {}
+
+        # msgids to decode. None to decode all msgids
+        self.rxmsgids = None
+
+        # Multilink de-duplication of the last 256 packets
+        # Key is vehiclename, val is a DedupWindow
+        self.dedup = {}
 
         # All the connections (asyncio sockets)
         # Key is linkname
@@ -64,19 +91,61 @@ class ConnectionManager():
         # Val will be None if no current connection
         self.linkdict = {}
 
-        # 2D dict mapping links to vehicles via sysid.
-        # Dim1 is the linkname
-        # Dim2 is the Vehname
-        # Val is the sysID
-        # Key = linkname, Val = list of {Key=vehname, Val = sysid}
-        self.matrix = {}
+        # Routing index for incoming packets
+        # Key is (linkname, sysid), Val is the vehname
+        self.rxroute = {}
+
+        # Routing index for outgoing packets
+        # Key is vehname, Val is a list of (link class, sysid) for the
+        # live (connected) links
+        self.txroute = {}
+
+        # The links mapped to each vehicle
+        # Key is vehname, Val is a dict of {Key=linkname, Val=sysid}
+        self.vehlinks = {}
+
+        # The vehicles mapped to each link
+        # Key is linkname, Val is a set of vehnames
+        self.linkvehs = {}
+
+        # TX policy and bulk mode for new vehicles
+        self.txpolicy = txpolicy
+        self.bulkmode = bulkmode
+
+        # msgids of the bulk (parameter, mission, log and file transfer) packets
+        self.bulkmsgids = {msgid for msgid, priority in txPriorities(getpymavlinkpackage(dialect, mavversion)).items()
+                           if priority == PRIORITY_BULK}
+
+        # Selection of the links to send on, for each vehicle
+        # Key is vehname, Val is a LinkSelector
+        self.txselect = {}
 
         self.loop = loop
 
+        # Received packets from the links are queued, and passed on to
+        # incomingPacket() fairly across links. Each run takes up to
+        # ingestbudget seconds, in slices of ingestslice packets per link
+        self.ingest = IngestScheduler(loop, self.incomingPacket, ingestbudget, ingestslice)
+
         self.reconnecttimeout = reconnecttimeout
 
+        # Links to run in worker processes, like "serial:/dev/ttyUSB0:57600"
+        self.workerlinks = set(workerlinks)
+
+        # Max time between reconnection attempts of a link. The time
+        # starts at reconnecttimeout and doubles on each failed attempt
+        self.maxreconnect = maxreconnect
+
+        # Reconnection state of each link
+        # Key is linkname, Val is a LinkBackoff
+        self.linkbackoff = {}
+
+        # Running reconnection attempts
+        # Key is linkname, Val is the task
+        self.reconnecttasks = {}
+
         # create a function to try reconnecting all non-connected links
-        # once per n seconds
+        # when their backoff expires
         self.looptask = asyncio.ensure_future(self.reconnectLinks())
 
     def onPacketAttach(self, func):
@@ -93,24 +162,60 @@ class ConnectionManager():
         with suppress(asyncio.CancelledError):
             await self.looptask  # await for task cancellation
 
+        # and any running reconnection attempts
+        for task in list(self.reconnecttasks.values()):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+        # pass on anything already received
+        self.ingest.flush()
+
         # cleanly close all links
         for strconnection, link in self.linkdict.items():
             if link:
                 link.close()
 
+        # and wait for the worker processes to stop
+        for link in list(self.linkdict.values()):
+            if isinstance(link, WorkerConnection):
+                await link.waitClosed()
+
     async def reconnectLinks(self):
-        """Keep trying to reconnect any disconnected links"""
+        """Keep trying to reconnect any disconnected links. Each link
+        is retried concurrently, in it's own task, when it's backoff expires"""
         while True:
-            try:
-                for strconnection, link in self.linkdict.items():
-                    if link is None:
-                        logging.debug("trying to reconnect: %s",
-                                      strconnection)
-                        await asyncio.wait_for(self.initLink(strconnection),
-                                               self.reconnecttimeout)
-                await asyncio.sleep(self.reconnecttimeout)
-            except asyncio.TimeoutError:
-                pass
+            now = time.time()
+            wait = self.reconnecttimeout
+            for strconnection, link in self.linkdict.items():
+                if link is not None or strconnection in self.reconnecttasks:
+                    continue
+                backoff = self.getBackoff(strconnection)
+                if backoff.isReady(now):
+                    self.reconnecttasks[strconnection] = asyncio.ensure_future(
+                        self.reconnectLink(strconnection))
+                else:
+                    wait = min(wait, backoff.remaining(now))
+            await asyncio.sleep(wait)
+
+    async def reconnectLink(self, strconnection: str):
+        """Make a single attempt at reconnecting a link"""
+        logging.debug("trying to reconnect: %s", strconnection)
+        try:
+            await asyncio.wait_for(self.initLink(strconnection),
+                                   self.reconnecttimeout)
+        except asyncio.TimeoutError:
+            logging.debug("Reconnect timeout - %s", strconnection)
+            self.getBackoff(strconnection).failure("Timeout")
+        finally:
+            self.reconnecttasks.pop(strconnection, None)
+
+    def getBackoff(self, strconnection: str):
+        """Get the reconnection state of a link"""
+        if strconnection not in self.linkbackoff:
+            self.linkbackoff[strconnection] = LinkBackoff(strconnection, self.reconnecttimeout,
+                                                          self.maxreconnect)
+        return self.linkbackoff[strconnection]
 
     async def initLink(self, strconnection: str):
         """Try initialising a connection. returns True if connection
@@ -118,74 +223,102 @@ class ConnectionManager():
         constr = strconnection.split(":")
         newlink = None
         try:
-            if constr[0] == "udpserver":
-                newlink = UDPConnection(rxcallback=self.incomingPacket,
-                                        clcallback=self.closelinkcallback,
-                                        dialect=self.dialect,
-                                        mavversion=self.mavversion,
-                                        server=True,
-                                        srcsystem=self.sourceSystem,
-                                        srccomp=self.sourceComponent,
-                                        name=strconnection)
-                trans = self.loop.create_datagram_endpoint(
-                    lambda: newlink, local_addr=(constr[1], constr[2]))
-                await asyncio.wait_for(trans, timeout=0.2)
-            elif constr[0] == "udpclient":
-                newlink = UDPConnection(rxcallback=self.incomingPacket,
-                                        clcallback=self.closelinkcallback,
-                                        dialect=self.dialect,
-                                        mavversion=self.mavversion,
-                                        server=False,
-                                        srcsystem=self.sourceSystem,
-                                        srccomp=self.sourceComponent,
-                                        name=strconnection)
-                trans = self.loop.create_datagram_endpoint(
-                    lambda: newlink, remote_addr=(constr[1], constr[2]))
-                await asyncio.wait_for(trans, timeout=0.2)
+            if strconnection in self.workerlinks and constr[0] in WORKERTYPES and workersAvailable():
+                # the worker keeps the link open itself
+                newlink = WorkerConnection(rxcallback=self.ingest.put,
+                                           clcallback=self.closelinkcallback,
+                                           dialect=self.dialect,
+                                           mavversion=self.mavversion,
+                                           srcsystem=self.sourceSystem,
+                                           srccomp=self.sourceComponent,
+                                           name=strconnection,
+                                           retry=self.reconnecttimeout)
+                newlink.start()
+            elif constr[0] in ("udpserver", "udpclient"):
+                # on Linux, many datagrams are read per loop wakeup
+                linkclass = BatchUDPConnection if batchAvailable() else UDPConnection
+                newlink = linkclass(rxcallback=self.ingest.put,
+                                    clcallback=self.closelinkcallback,
+                                    dialect=self.dialect,
+                                    mavversion=self.mavversion,
+                                    server=(constr[0] == "udpserver"),
+                                    srcsystem=self.sourceSystem,
+                                    srccomp=self.sourceComponent,
+                                    name=strconnection,
+                                    parser=self.parser,
+                                    mtu=self.udpmtu)
+                if linkclass is BatchUDPConnection:
+                    newlink.open(self.loop)
+                elif newlink.server:
+                    trans = self.loop.create_datagram_endpoint(
+                        lambda: newlink, local_addr=(constr[1], constr[2]))
+                    await asyncio.wait_for(trans, timeout=0.2)
+                else:
+                    trans = self.loop.create_datagram_endpoint(
+                        lambda: newlink, remote_addr=(constr[1], constr[2]))
+                    await asyncio.wait_for(trans, timeout=0.2)
             elif constr[0] == "serial":
-                newlink = SerialConnection(rxcallback=self.incomingPacket,
+                newlink = SerialConnection(rxcallback=self.ingest.put,
                                            clcallback=self.closelinkcallback,
                                            dialect=self.dialect,
                                            mavversion=self.mavversion,
                                            srcsystem=self.sourceSystem,
                                            srccomp=self.sourceComponent,
-                                           name=strconnection)
+                                           name=strconnection,
+                                           parser=self.parser)
                 trans = serial_asyncio.create_serial_connection(self.loop, lambda: newlink,
                                                                 constr[1], int(constr[2]))
                 await asyncio.wait_for(trans, timeout=0.2)
             elif constr[0] == "tcpclient":
-                newlink = TCPConnection(rxcallback=self.incomingPacket,
-                                        clcallback=self.closelinkcallback,
-                                        dialect=self.dialect,
-                                        mavversion=self.mavversion,
-                                        server=False,
-                                        srcsystem=self.sourceSystem,
-                                        srccomp=self.sourceComponent,
-                                        name=strconnection)
+                # the scanner parser can receive straight into it's buffer, if available
+                if self.parser == 'scanner' and bufferedAvailable():
+                    linkclass = BufferedTCPConnection
+                else:
+                    linkclass = TCPConnection
+                newlink = linkclass(rxcallback=self.ingest.put,
+                                    clcallback=self.closelinkcallback,
+                                    dialect=self.dialect,
+                                    mavversion=self.mavversion,
+                                    server=False,
+                                    srcsystem=self.sourceSystem,
+                                    srccomp=self.sourceComponent,
+                                    name=strconnection,
+                                    parser=self.parser)
                 trans = self.loop.create_connection(
                     lambda: newlink, constr[1], int(constr[2]))
                 await asyncio.wait_for(trans, timeout=0.2)
             elif constr[0] == "tcpserver":
-                newlink = TCPConnection(rxcallback=self.incomingPacket,
-                                        clcallback=self.closelinkcallback,
-                                        dialect=self.dialect,
-                                        mavversion=self.mavversion,
-                                        server=True,
-                                        srcsystem=self.sourceSystem,
-                                        srccomp=self.sourceComponent,
-                                        name=strconnection)
-
-                await self.loop.create_server(lambda: newlink, constr[1], int(constr[2]))
+                newlink = TCPServerConnection(rxcallback=self.ingest.put,
+                                              clcallback=self.closelinkcallback,
+                                              dialect=self.dialect,
+                                              mavversion=self.mavversion,
+                                              srcsystem=self.sourceSystem,
+                                              srccomp=self.sourceComponent,
+                                              name=strconnection,
+                                              parser=self.parser)
+
+                # each client gets it's own protocol
+                newlink.listener = await self.loop.create_server(newlink.newClient, constr[1], int(constr[2]))
             else:
                 logging.debug("Bad link type: %s", constr)
                 return False
             # ok, we've got a link
+            newlink.setRxFilter(self.rxFrameFilter, self.rxFrameAccept)
+            newlink.lazydecode = self.lazydecode
+            if strconnection in self.capturecfg:
+                newlink.setCapture(*self.capturecfg[strconnection])
             self.linkdict[strconnection] = newlink
+            self.getBackoff(strconnection).success()
+            for vehicle in self.linkvehs.get(strconnection, ()):
+                self.updateTxRoute(vehicle)
             logging.debug("Added link - %s", strconnection)
             return True
-        except(OSError, asyncio.TimeoutError):
+        except(OSError, asyncio.TimeoutError) as reason:
             logging.debug("Can't connect - %s", strconnection)
             self.linkdict[strconnection] = None
+            self.getBackoff(strconnection).failure(str(reason) or "Timeout")
+            for vehicle in self.linkvehs.get(strconnection, ()):
+                self.updateTxRoute(vehicle)
             return False
 
     async def addVehicleLink(self, vehicle: str, sysid: int, strconnection: str):
@@ -204,46 +337,143 @@ class ConnectionManager():
 
             await self.initLink(strconnection)
 
+        sysid = int(sysid)
+
         # if it's a new vehicle, add it in the sequence dicts:
-        if vehicle not in self.getAllVeh():
-            # if vehicle.name not in self.last255pkts:
-            self.last255pkts[vehicle] = collections.deque(maxlen=256)
-            # if vehicle.name not in self.last255seq:
-            self.last255seq[vehicle] = collections.deque(maxlen=256)
-
-        # If it's a new link, add it in
-        if strconnection not in self.matrix:
-            # And create the matrix entry for this vehicle/link
-            tmpdict = {}
-            tmpdict[vehicle] = sysid
-            self.matrix[strconnection] = tmpdict
-        else:
-            # It's a new sysid on the existing link
-            olddict = self.matrix[strconnection]
-            olddict[vehicle] = sysid
-            self.matrix[strconnection] = olddict
+        if vehicle not in self.vehlinks:
+            self.vehlinks[vehicle] = {}
+            self.dedup[vehicle] = DedupWindow(256)
+            self.txselect[vehicle] = LinkSelector(self.txpolicy, bulkmode=self.bulkmode)
+
+        # And create the routing entries for this vehicle/link
+        self.vehlinks[vehicle][strconnection] = sysid
+        self.linkvehs.setdefault(strconnection, set()).add(vehicle)
+        self.rxroute.setdefault((strconnection, sysid), vehicle)
+        self.updateTxRoute(vehicle)
         return True
 
+    def updateTxRoute(self, vehicle: str):
+        """Rebuild the list of live links for a vehicle. Must be
+        called whenever a link to the vehicle changes state"""
+        if vehicle in self.vehlinks:
+            self.txroute[vehicle] = [(self.linkdict[strconnection], sysid)
+                                     for strconnection, sysid in self.vehlinks[vehicle].items()
+                                     if self.linkdict.get(strconnection) is not None]
+        elif vehicle in self.txroute:
+            del self.txroute[vehicle]
+
+    def setTxPolicy(self, vehicle: str, policy: str, quiet: float = None):
+        """Set the policy for selecting the links a vehicle's packets are
+        sent on (see linkselect.TXPOLICIES). A link with no packets received
+        for quiet seconds is not used, if there are other links"""
+        if vehicle not in self.txselect:
+            return False
+        old = self.txselect[vehicle]
+        self.txselect[vehicle] = LinkSelector(policy, old.quiet if quiet is None else quiet,
+                                              bulkmode=old.bulkmode)
+        return True
+
+    def setBulkMode(self, vehicle: str, mode: str):
+        """Set how a vehicle's bulk packets are spread across it's
+        links (see linkselect.BULKMODES)"""
+        if vehicle not in self.txselect:
+            return False
+        old = self.txselect[vehicle]
+        self.txselect[vehicle] = LinkSelector(old.policy, old.quiet, bulkmode=mode)
+        return True
+
+    def getTxPolicy(self, vehicle: str):
+        """Get the tx policy of a vehicle, and the link currently
+        selected (None if not one link)"""
+        selector = self.txselect.get(vehicle)
+        if selector is None:
+            return None
+        return selector.policy, selector.selected.name if selector.selected is not None else None
+
+    def getBulkMode(self, vehicle: str):
+        """Get the bulk mode of a vehicle"""
+        selector = self.txselect.get(vehicle)
+        return selector.bulkmode if selector is not None else None
+
+    def getDuplicateCounts(self):
+        """Get the number of duplicate packets dropped on each link.
+        Returns a dict of {Key=linkname, Val=count}"""
+        counts = {}
+        for window in self.dedup.values():
+            for linkname, count in window.dropped.items():
+                counts[linkname] = counts.get(linkname, 0) + count
+        return counts
+
+    def getLinkStats(self):
+        """Get the statistics of all live links.
+        Returns a dict of {Key=linkname, Val={Key=sysid, Val=dict of stats}}"""
+        stats = {}
+        for link in self.linkdict.values():
+            if link is not None:
+                stats.update(link.getStats())
+        return stats
+
+    def getTxQueues(self):
+        """Get the depth of the tx queues of all live links.
+        Returns a dict of {Key=linkname, Val=dict of queue depths}"""
+        queues = {}
+        for link in self.linkdict.values():
+            if link is not None:
+                queues.update(link.getTxQueues())
+        for linkname, depth in queues.items():
+            if linkname in self.linkdict:
+                depth.update(self.ingest.get(linkname))
+        return queues
+
+    def getLinkState(self):
+        """Get the reconnection state of all links.
+        Returns a dict of {Key=linkname, Val=dict of state}"""
+        now = time.time()
+        state = {}
+        for strconnection, link in self.linkdict.items():
+            state[strconnection] = self.getBackoff(strconnection).get(now)
+            if isinstance(link, WorkerConnection):
+                # the worker reconnects the link itself
+                state[strconnection]['connected'] = link.connected
+                state[strconnection]['lasterror'] = link.lasterror
+        return state
+
     def getAllVeh(self):
         """get a list of all vehicles in connection matrix"""
-        allveh = []
-        for strconnection, vehdict in self.matrix.items():
-            # Iterate through all links and add if not in list
-            for vehname, sysid in vehdict.items():
-                if vehname not in allveh:
-                    allveh.append(vehname)
-        return allveh
+        return list(self.vehlinks.keys())
+
+    def unmapVehicleLink(self, vehicle: str, strconnection: str):
+        """Remove the routing entries between a vehicle and link"""
+        sysid = self.vehlinks[vehicle].pop(strconnection)
+        if self.rxroute.get((strconnection, sysid)) == vehicle:
+            del self.rxroute[(strconnection, sysid)]
+        self.linkvehs[strconnection].discard(vehicle)
 
     async def removeLink(self, link):
         """Remove all connections to a single link"""
         if link in self.linkdict:
+            self.capturecfg.pop(link, None)
+            self.linkbackoff.pop(link, None)
+            if link in self.reconnecttasks:
+                self.reconnecttasks.pop(link).cancel()
             # remove vehicle mappings
-            if link in self.matrix:
-                del self.matrix[link]
+            for vehicle in list(self.linkvehs.get(link, ())):
+                self.unmapVehicleLink(vehicle, link)
+                # vehicles with no links left are removed too
+                if not self.vehlinks[vehicle]:
+                    del self.vehlinks[vehicle]
+                    del self.dedup[vehicle]
+                    del self.txselect[vehicle]
+                self.updateTxRoute(vehicle)
+            self.linkvehs.pop(link, None)
             # close link - if running link
             if self.linkdict[link] is not None:
                 self.linkdict[link].close()
-            del self.linkdict[link]
+            closing = self.linkdict.pop(link)
+            self.ingest.removeLink(link)
+            # wait for a worker process to stop
+            if isinstance(closing, WorkerConnection):
+                await closing.waitClosed()
             return True
         else:
             return False
@@ -255,24 +485,84 @@ class ConnectionManager():
                 logging.debug("Closing %s", strconnection)
                 self.linkdict[strconnection].close()
                 self.linkdict[strconnection] = None
+                self.getBackoff(strconnection).disconnected("Link closed")
+                for vehicle in self.linkvehs.get(strconnection, ()):
+                    self.updateTxRoute(vehicle)
 
     async def removeVehicle(self, vehicle: str):
         """Remove all links to a single vehicle and remove the vehicle itself"""
-        if vehicle in self.getAllVeh():
-            del self.last255pkts[vehicle]
-            del self.last255seq[vehicle]
-            for strconnection, vehdict in self.matrix.items():
-                # Iterate through all links
-                if vehicle in vehdict:
-                    del vehdict[vehicle]
-            # close any empty links
-            for strconnection, vehdict in self.matrix.items():
-                if not vehdict:
+        if vehicle in self.vehlinks:
+            del self.dedup[vehicle]
+            del self.txselect[vehicle]
+            for strconnection in list(self.vehlinks[vehicle]):
+                self.unmapVehicleLink(vehicle, strconnection)
+                # close any empty links
+                if not self.linkvehs[strconnection]:
                     await self.removeLink(strconnection)
+            del self.vehlinks[vehicle]
+            self.updateTxRoute(vehicle)
             return True
 
         return False
 
+    def setLinkCapture(self, strconnection: str, maxpackets: int = None, maxbytes: int = None):
+        """Capture the most recent packets on a link, limited to maxpackets
+        and/or maxbytes. If both are None, stop capturing"""
+        if maxpackets is None and maxbytes is None:
+            self.capturecfg.pop(strconnection, None)
+        else:
+            self.capturecfg[strconnection] = (maxpackets, maxbytes)
+        if self.linkdict.get(strconnection) is not None:
+            self.linkdict[strconnection].setCapture(maxpackets, maxbytes)
+
+    def getLinkCapture(self, strconnection: str, drain: bool = False):
+        """Get a list of the captured (time, direction, packet) entries
+        on a link. If drain is True, the capture is emptied"""
+        link = self.linkdict.get(strconnection)
+        if link is None:
+            return []
+        return link.drainCapture() if drain else link.snapshotCapture()
+
+    def setRxMsgFilter(self, msgids):
+        """Only decode incoming packets with a msgid in msgids.
+        None to decode all packets"""
+        self.rxmsgids = set(msgids) if msgids is not None else None
+
+    def setRxMsgTypes(self, msgtypes):
+        """Only decode incoming packets with a type (ie 'HEARTBEAT') in
+        msgtypes. None to decode all packets"""
+        if msgtypes is None:
+            self.setRxMsgFilter(None)
+            return
+        mod = getpymavlinkpackage(self.dialect, self.mavversion)
+        self.setRxMsgFilter(getattr(mod, 'MAVLINK_MSG_ID_' + msgtype) for msgtype in msgtypes
+                            if hasattr(mod, 'MAVLINK_MSG_ID_' + msgtype))
+
+    def rxFrameFilter(self, frame, linkname: str):
+        """Pre-filter a raw frame from a link before it's decoded. Returns
+        False for unknown sysids, duplicates and unwanted msgids"""
+        vehname = self.rxroute.get((linkname, frame.srcSystem))
+        if vehname is None:
+            return False
+        if self.rxmsgids is not None and frame.msgId not in self.rxmsgids:
+            return False
+        key = (frame.srcSystem, frame.srcComponent, frame.seq, frame.crc)
+        if self.dedup[vehname].seen(key, linkname):
+            logging.debug("Got dup rx frame %s, %u", linkname, frame.srcSystem)
+            if self.linkdict.get(linkname) is not None:
+                self.linkdict[linkname].duplicate(frame.srcSystem, time.time() - self.dedup[vehname].arrival(key))
+            return False
+        return True
+
+    def rxFrameAccept(self, frame, linkname: str):
+        """Add a frame that passed the pre-filter to the dedup window,
+        once it's known to be valid. A corrupt copy of a packet does not
+        cause the good copy on another link to be dropped. Duplicates
+        later in the same chunk are dropped by the pre-filter"""
+        vehname = self.rxroute.get((linkname, frame.srcSystem))
+        if vehname is not None:
+            self.dedup[vehname].check((frame.srcSystem, frame.srcComponent, frame.seq, frame.crc), linkname)
+
     def incomingPacket(self, pkt, linkname: str):
         """we have a mavlink packet from a linkname, and need to send it to the
         vehicle manager's callback"""
@@ -280,34 +570,40 @@ class ConnectionManager():
         # Don't pass on if bad packet
         if pkt.get_type() == 'BAD_DATA':
             return
-        try:
-            for vehname, sysid in self.matrix[linkname].items():
-                if int(pkt._header.srcSystem) == int(sysid):
-                    # Check if we've alreay go that packet from a different link
-                    if pkt.get_crc() not in self.last255pkts[vehname]:
-                        self.last255pkts[vehname].append(pkt.get_crc())
-                        self.last255seq[vehname].append(pkt.get_seq())
-
-                        #  Send the packet up to the callback
-                        logging.debug("Rx packet %s, %u", linkname, sysid)
-                        if self.processed_packet:
-                            self.processed_packet(vehname, pkt, linkname)
-                        return
-                    else:
-                        logging.debug(
-                            "Got dup rx packet %s, %u", linkname, sysid)
-                        return
-            logging.debug("no packet for sysid %u", pkt._header.srcSystem)
-        except KeyError:
+        if linkname not in self.linkvehs:
             logging.debug("No link with name %s", linkname)
+            return
+        sysid = pkt.get_srcSystem()
+        vehname = self.rxroute.get((linkname, sysid))
+        if vehname is None:
+            logging.debug("no packet for sysid %u", sysid)
+            return
+        # Check if we've alreay go that packet from a different link.
+        # Packets from the scanner parser were checked by the pre-filter
+        link = self.linkdict.get(linkname)
+        key = DedupWindow.packetKey(pkt)
+        now = time.time()
+        if (link is None or link.parser != 'scanner') and self.dedup[vehname].check(key, linkname, now):
+            logging.debug("Got dup rx packet %s, %u", linkname, sysid)
+            if link is not None:
+                link.duplicate(sysid, now - self.dedup[vehname].arrival(key))
+            return
+
+        #  Send the packet up to the callback
+        logging.debug("Rx packet %s, %u", linkname, sysid)
+        if self.processed_packet:
+            self.processed_packet(vehname, pkt, linkname)
 
     def outgoingPacket(self, buf: bytes, vehname: str):
-        """send a databuffer from a vehicle to all it's
-        current connections"""
-        for strconnection, vehdict in self.matrix.items():
-            # Iterate through all links
-            for vehnamedict, sysid in vehdict.items():
-                if vehnamedict == vehname and self.linkdict[strconnection] is not None:
-                    # Yes, it's a link to the vehicle
-                    logging.debug("Tx packet %s, %s", vehname, strconnection)
-                    self.linkdict[strconnection].send_data(buf)
+        """send a databuffer from a vehicle to it's current
+        connections, as selected by the vehicle's tx policy and
+        bulk mode"""
+        links = self.txroute.get(vehname, ())
+        if len(links) > 1:
+            if frameMsgId(buf) in self.bulkmsgids:
+                links = self.txselect[vehname].selectBulk(links)
+            else:
+                links = self.txselect[vehname].select(links)
+        for link, sysid in links:
+            logging.debug("Tx packet %s, %s", vehname, link.name)
+            link.send_data(buf, sysid)
@@ -34,22 +34,40 @@ import os
 from importlib import import_module
 from contextlib import suppress
 
+from PaGS.modulesupport.module import ALL_MSGS
+from PaGS.modulesupport.moduleexec import EXECMODES, execModeAvailable, newRunner, threadSafe, ProcessModule
+
 
 class moduleManager():
     """
     Manage a set of modules
     """
 
-    def __init__(self, loop, settingsDir, useGUI):
+    def __init__(self, loop, settingsDir, useGUI, eventloop: str = 'asyncio'):
         # dict of modules. Key is module name
         self.multiModules = {}
 
+        # dict of the modules that are starting in a worker process.
+        # Key is module name, Val is the ProcessModule
+        self.startingModules = {}
+
+        # dict of the runners of the modules' incomingPacket(). Key is module name
+        self.runners = {}
+
+        # incomingPacket() functions of the modules for each message
+        # type, and for the message types with no module asking for them
+        self.pktHandlers = {}
+        self.allPktHandlers = []
+
         # are we using a GUI?
         self.useGUI = useGUI
 
         # asyncio event loop
         self.loop = loop
 
+        # event loop (see LOOPS) for modules run in a process
+        self.eventloop = eventloop
+
         # PaGS settings dir
         self.settingsDir = settingsDir
 
@@ -63,11 +81,27 @@ class moduleManager():
         self.vehListCallback = None
         self.getVehCallback = None
 
+        # Callbacks to the link statistics and tx queues
+        self.linkStatsCallback = None
+        self.linkQueuesCallback = None
+        self.linkStateCallback = None
+        self.getLinkPolicyCallback = None
+        self.setLinkPolicyCallback = None
+        self.getLinkBulkCallback = None
+        self.setLinkBulkCallback = None
+        self.conflationCallback = None
+        self.msgTypesCallback = None
+
         # Dict of current terminal commands?
         self.commands = {}
 
         # add in module managment commands
-        self.commands['module'] = {'load': self.load, 'list': self.list}
+        self.commands['module'] = {'load': self.load, 'list': self.list, 'queues': self.queues}
+
+        # add in link commands
+        self.commands['link'] = {'stats': self.linkstats, 'queues': self.linkqueues,
+                                 'state': self.linkstate, 'policy': self.linkpolicy,
+                                 'bulk': self.linkbulk, 'conflation': self.linkconflation}
 
         # Dict of modules that print text
         self.printers = {}
@@ -105,16 +139,83 @@ class moduleManager():
         """
         self.getVehCallback = func
 
-    def load(self, vehname: str, module: str):
+    def onLinkStatsAttach(self, func):
+        """
+        Attach a callback to get the link statistics
+        """
+        self.linkStatsCallback = func
+
+    def onLinkQueuesAttach(self, func):
+        """
+        Attach a callback to get the depth of the link tx queues
+        """
+        self.linkQueuesCallback = func
+
+    def onLinkStateAttach(self, func):
+        """
+        Attach a callback to get the reconnection state of the links
+        """
+        self.linkStateCallback = func
+
+    def onGetLinkPolicyAttach(self, func):
+        """
+        Attach a callback to get the tx policy of a vehicle
+        """
+        self.getLinkPolicyCallback = func
+
+    def onSetLinkPolicyAttach(self, func):
         """
-        Command handler for "module load xxx" command
+        Attach a callback to set the tx policy of a vehicle
         """
-        if module in self.multiModules or "PaGS." + module in self.multiModules:
+        self.setLinkPolicyCallback = func
+
+    def onGetLinkBulkAttach(self, func):
+        """
+        Attach a callback to get the bulk mode of a vehicle
+        """
+        self.getLinkBulkCallback = func
+
+    def onSetLinkBulkAttach(self, func):
+        """
+        Attach a callback to set the bulk mode of a vehicle
+        """
+        self.setLinkBulkCallback = func
+
+    def onConflationAttach(self, func):
+        """
+        Attach a callback to get the conflation counters of a vehicle
+        """
+        self.conflationCallback = func
+
+    def onMsgTypesAttach(self, func):
+        """
+        Attach a callback for the message types the modules use. It's
+        called with a set of types, or None for all types, when modules
+        are loaded or removed
+        """
+        self.msgTypesCallback = func
+
+    def load(self, vehname: str, module: str, execmode: str = 'inline', droppolicy: str = 'oldest'):
+        """
+        Command handler for "module load xxx [execmode] [droppolicy]" command
+        """
+        loaded = list(self.multiModules) + list(self.startingModules)
+        if module in loaded or "PaGS." + module in loaded:
             self.printVeh(vehname, "Module already loaded")
+        elif execmode not in EXECMODES:
+            self.printVeh(vehname, "Unknown execution mode: " + execmode)
         else:
             try:
-                self.addModule(module)
-                if module in self.multiModules or "PaGS." + module in self.multiModules:
+                starting = self.addModule(module, execmode, droppolicy)
+                if starting is not None:
+                    # the result is known once the worker process has started
+                    def started(task):
+                        if not task.cancelled() and task.result():
+                            self.printVeh(vehname, "Loaded module " + module)
+                        else:
+                            self.printVeh(vehname, "Cannot load module " + module)
+                    starting.add_done_callback(started)
+                elif module in self.multiModules or "PaGS." + module in self.multiModules:
                     self.printVeh(vehname, "Loaded module " + module)
                 else:
                     self.printVeh(vehname, "Cannot load module " + module)
@@ -129,6 +230,125 @@ class moduleManager():
         for key in self.multiModules:
             self.printVeh(vehname, key)
 
+    def queues(self, vehname: str):
+        """
+        Command handler for "module queues" command
+        """
+        for name, runner in self.runners.items():
+            counters = runner.get()
+            self.printVeh(vehname, "{0}: {1}, queue {2} (max {3}), {4} handled, {5} dropped ({6}), {7} errors, "
+                          "slowest {8:.1f} ms".format(
+                              name, counters['mode'], counters['queued'], counters['maxdepth'], counters['handled'],
+                              counters['dropped'], counters['policy'], counters['errors'],
+                              counters['maxtime'] * 1000))
+
+    def linkstats(self, vehname: str):
+        """
+        Command handler for "link stats" command
+        """
+        if not self.linkStatsCallback:
+            self.printVeh(vehname, "No link statistics available")
+            return
+        for linkname, sysids in self.linkStatsCallback().items():
+            self.printVeh(vehname, linkname)
+            for sysid, stats in sysids.items():
+                self.printVeh(vehname, "  sysid {0}: rx {1:.0f} B/s {2:.1f} pkt/s, tx {3:.0f} B/s {4:.1f} pkt/s, "
+                              "loss {5:.1f}% ({6} lost), {7} duplicates".format(
+                                  sysid, stats['rxbytespersec'], stats['rxpktspersec'],
+                                  stats['txbytespersec'], stats['txpktspersec'],
+                                  stats['loss'] * 100, stats['lost'], stats['duplicates']))
+
+    def linkqueues(self, vehname: str):
+        """
+        Command handler for "link queues" command
+        """
+        if not self.linkQueuesCallback:
+            self.printVeh(vehname, "No link queues available")
+            return
+        for linkname, depth in self.linkQueuesCallback().items():
+            self.printVeh(vehname, "{0}: control {1}, command {2}, bulk {3} ({4} bytes), transport {5} bytes, "
+                          "{6}paused {7} times".format(
+                              linkname, depth['control'], depth['command'], depth['bulk'], depth['bytes'],
+                              depth['transport'], "" if depth['paused'] else "not ", depth['pauses']))
+            if depth.get('bulkrate') is not None:
+                self.printVeh(vehname, "  radio txbuf {0}%, bulk limited to {1:.0f} B/s".format(
+                    depth['txbuf'], depth['bulkrate']))
+            if depth.get('rxqueue') is not None:
+                self.printVeh(vehname, "  rx queue {0}, {1} dropped".format(depth['rxqueue'], depth['rxdropped']))
+            if depth.get('rxdrops') is not None:
+                self.printVeh(vehname, "  socket rx buffer {0} bytes, {1} datagrams dropped".format(
+                    depth['rxbuf'], depth['rxdrops']))
+
+    def linkstate(self, vehname: str):
+        """
+        Command handler for "link state" command
+        """
+        if not self.linkStateCallback:
+            self.printVeh(vehname, "No link state available")
+            return
+        for linkname, state in self.linkStateCallback().items():
+            if state['connected']:
+                self.printVeh(vehname, "{0}: connected".format(linkname))
+            else:
+                self.printVeh(vehname, "{0}: disconnected, {1} failed attempts, retry in {2:.1f} sec ({3})".format(
+                    linkname, state['failures'], state['retryin'], state['lasterror']))
+
+    def linkpolicy(self, vehname: str, policy: str = None):
+        """
+        Command handler for "link policy [policy]" command
+        """
+        if not self.getLinkPolicyCallback or not self.setLinkPolicyCallback:
+            self.printVeh(vehname, "No link policy available")
+            return
+        if policy is not None:
+            try:
+                self.setLinkPolicyCallback(vehname, policy)
+            except ValueError as reason:
+                self.printVeh(vehname, str(reason))
+                return
+        current = self.getLinkPolicyCallback(vehname)
+        if current is None:
+            self.printVeh(vehname, "No links for vehicle")
+            return
+        self.printVeh(vehname, "TX policy {0}, sending on {1}".format(
+            current[0], current[1] if current[1] is not None else "all links"))
+
+    def linkbulk(self, vehname: str, mode: str = None):
+        """
+        Command handler for "link bulk [mode]" command
+        """
+        if not self.getLinkBulkCallback or not self.setLinkBulkCallback:
+            self.printVeh(vehname, "No link bulk mode available")
+            return
+        if mode is not None:
+            try:
+                self.setLinkBulkCallback(vehname, mode)
+            except ValueError as reason:
+                self.printVeh(vehname, str(reason))
+                return
+        current = self.getLinkBulkCallback(vehname)
+        if current is None:
+            self.printVeh(vehname, "No links for vehicle")
+            return
+        self.printVeh(vehname, "Bulk mode " + current)
+
+    def linkconflation(self, vehname: str):
+        """
+        Command handler for "link conflation" command
+        """
+        if not self.conflationCallback:
+            self.printVeh(vehname, "No conflation available")
+            return
+        counters = self.conflationCallback(vehname)
+        if counters is None:
+            self.printVeh(vehname, "Conflation not enabled")
+            return
+        self.printVeh(vehname, "Queue {0} (max {1}), {2}overloaded {3} times, {4} packets conflated".format(
+            counters['queued'], counters['maxdepth'], "" if counters['overloaded'] else "not ",
+            counters['overloads'], counters['conflated']))
+        for name, count in sorted(counters['types'].items()):
+            self.printVeh(vehname, "  {0}: {1}".format(name, count))
+
     def onModuleCommandCallback(self, vehname, cmd):
         """
         Process a user command from vehicle
@@ -175,10 +395,19 @@ class moduleManager():
             self.settingsDir, "persistGUI.cfg")
         self.wxAppPersistMgr.SetPersistenceFile(_configFile)
 
-    def addModule(self, name: str):
+    def addModule(self, name: str, execmode: str = 'inline', droppolicy: str = 'oldest', queuesize: int = 1000,
+                  workers: int = 1):
         """
-        Initialise a module
+        Initialise a module. It's incomingPacket() is run in execmode
+        (see EXECMODES), with a queue of up to queuesize packets.
+        In the process mode, the module is added once it has started
+        in the worker, and the task doing that is returned
         """
+        if execmode not in EXECMODES:
+            raise ValueError('Unknown execution mode')
+        if not execModeAvailable(execmode):
+            logging.warning("Module execution mode %s not available, using thread", execmode)
+            execmode = 'thread'
         mod = None
         try:
             mod = import_module(name)
@@ -189,14 +418,51 @@ class moduleManager():
             except ImportError:
                 raise ValueError('No module with that name')
 
+        if execmode == 'process':
+            # the module's commands and msgTypes are known once it's started
+            runner = ProcessModule(self.loop, name, self.settingsDir, self.outgoingPacket, self.printVeh,
+                                   self.getVehCallback, droppolicy, queuesize, eventloop=self.eventloop)
+            self.startingModules[name] = runner
+            return self.loop.create_task(self.startProcessModule(name, runner))
+
+        txCallback, cmdCallback, printer = self.outgoingPacket, self.onModuleCommandCallback, self.printVeh
+        if execmode == 'thread':
+            # the module may call these from it's worker threads
+            txCallback, cmdCallback, printer = [threadSafe(self.loop, func) for func in (txCallback, cmdCallback,
+                                                                                         printer)]
         self.multiModules[name] = mod.Module(
-            self.loop, self.outgoingPacket, self.vehListCallback,
-            self.getVehCallback, self.onModuleCommandCallback,
-            self.printVeh, self.settingsDir, self.useGUI, self.wxAppPersistMgr)
+            self.loop, txCallback, self.vehListCallback,
+            self.getVehCallback, cmdCallback,
+            printer, self.settingsDir, self.useGUI, self.wxAppPersistMgr)
+        self.runners[name] = newRunner(self.loop, execmode, self.multiModules[name].incomingPacket, self.printVeh,
+                                       droppolicy, queuesize, workers)
         # and add any vehicles from beforehand
         for vehname in self.vehListCallback():
             self.multiModules[name].addVehicle(vehname)
 
+        self.registerModule(name)
+
+    async def startProcessModule(self, name: str, runner) -> bool:
+        """
+        Add a module run in a worker process, once it has started.
+        Returns False if it could not be started
+        """
+        ready = await runner.waitReady()
+        self.startingModules.pop(name, None)
+        if not ready:
+            return False
+        self.multiModules[name] = self.runners[name] = runner
+        for vehname in self.vehListCallback():
+            runner.addVehicle(vehname)
+        self.registerModule(name)
+        return True
+
+    def registerModule(self, name: str):
+        """
+        Add the commands, printer and packet subscriptions of a module
+        """
+        self.indexPktHandlers()
+
         # add any command callbacks
         self.commands[self.multiModules[name].shortName] = {}
         for key, val in self.multiModules[name].commandDict.items():
@@ -219,11 +485,15 @@ class moduleManager():
         else:
             if name in self.printers.keys():
                 del self.printers[name]
-            del self.commands[self.multiModules[name].shortName]
+            self.commands.pop(self.multiModules[name].shortName, None)
 
+            runner = self.runners.pop(name)
+            runner.close()
+            await runner.waitClosed()
             await self.multiModules[name].closeModule()
 
             del self.multiModules[name]
+            self.indexPktHandlers()
             return
 
     async def closeAllModules(self):
@@ -231,7 +501,11 @@ class moduleManager():
         Close all modules cleanly
         """
         for modulename in self.multiModules:
+            self.runners[modulename].close()
+            await self.runners[modulename].waitClosed()
             await self.multiModules[modulename].closeModule()
+        for runner in list(self.startingModules.values()):
+            await runner.closeModule()
 
         # Close the wxAsync GUI if required
         if self.wxGUITask:
@@ -253,16 +527,40 @@ class moduleManager():
         for modulename in self.multiModules:
             self.multiModules[modulename].removeVehicle(vehName)
 
+    def indexPktHandlers(self):
+        """
+        Rebuild the message type -> module runner index from the
+        msgTypes of the modules. Modules without a msgTypes get every
+        packet
+        """
+        self.pktHandlers = {}
+        self.allPktHandlers = []
+        for name, module in self.multiModules.items():
+            msgTypes = getattr(module, 'msgTypes', [ALL_MSGS])
+            handler = self.runners[name].put
+            if ALL_MSGS in msgTypes:
+                self.allPktHandlers.append(handler)
+                # keep the modules in load order for each message type
+                for handlers in self.pktHandlers.values():
+                    handlers.append(handler)
+                continue
+            for msgType in msgTypes:
+                if msgType not in self.pktHandlers:
+                    self.pktHandlers[msgType] = list(self.allPktHandlers)
+                self.pktHandlers[msgType].append(handler)
+
+        if self.msgTypesCallback:
+            self.msgTypesCallback(None if self.allPktHandlers else set(self.pktHandlers.keys()))
+
     def incomingPacket(self, vehname: str, pkt, strconnection: str):
         """
-        Pass incoming packets onto modules
+        Pass incoming packets onto the runners of the modules that
+        want it's type
         """
-        for modulename in self.multiModules:
-            logging.debug("Packet from " + vehname +
-                          " going to module " + modulename)
+        for handler in self.pktHandlers.get(pkt.get_type(), self.allPktHandlers):
             try:
                 # then send it onwards, with handled exceptions
-                self.multiModules[modulename].incomingPacket(vehname, pkt)
+                handler(vehname, pkt)
             except Exception:
                 self.printVeh(vehname, traceback.format_exc())
 
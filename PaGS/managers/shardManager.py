@@ -0,0 +1,296 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Sharded PaGS, with the vehicles split across worker processes. Each
+shard runs it's own connection, vehicle and module managers. The
+coordinator runs the user interface modules, routing commands to the
+shard of each vehicle and merging the shards' output
+"""
+import asyncio
+import logging
+import multiprocessing
+
+from PaGS.connection.eventloop import newEventLoop
+from PaGS.managers import moduleManager
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+from PaGS.mavlink.x25crc import installCRC, removeCRC
+
+# Messages passed on to the coordinator's modules
+FORWARD_MSGS = ('HEARTBEAT', 'STATUSTEXT')
+
+
+def sourceLink(source: str) -> str:
+    """Get the link of a source, like "udpserver:127.0.0.1:14550"
+    from "udpserver:127.0.0.1:14550:1:0" """
+    return ":".join(source.split(":")[:3])
+
+
+def assignShards(sources: list, nshards: int) -> list:
+    """Split the sources ("type:constr:port:sysid:compid") across nshards.
+    All sources on the same link are kept in the same shard. Returns a
+    list of the sources in each shard"""
+    # group the sources by link, in order
+    groups = {}
+    for source in sources:
+        groups.setdefault(sourceLink(source), []).append(source)
+
+    # largest groups first, each to the shard with the fewest sources
+    shards = [[] for i in range(nshards)]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(group)
+    return shards
+
+
+class ShardWorker():
+    """
+    Runs in a shard process. Passes the vehicle changes, module output
+    and FORWARD_MSGS to the coordinator, and the coordinator's
+    commands to the modules
+    """
+
+    def __init__(self, pags, pipe):
+        self.pags = pags
+        self.pipe = pipe
+        self.stopped = asyncio.Event()
+
+        self.pags.allvehicles.onAddVehicleAttach(self.addVehicle)
+        self.pags.allvehicles.onRemoveVehicleAttach(self.removeVehicle)
+        self.pags.allvehicles.onPacketRxAttach(self.incomingPacket)
+        self.pags.modules.printers['shard'] = self.printVeh
+        # the coordinator's modules need these decoded too
+        self.pags.extraMsgTypes.update(FORWARD_MSGS)
+        self.pags.modules.indexPktHandlers()
+
+    def addVehicle(self, vehname: str):
+        self.pags.modules.addVehicle(vehname)
+        self.pipe.send(('add', vehname))
+
+    def removeVehicle(self, vehname: str):
+        self.pags.modules.removeVehicle(vehname)
+        self.pipe.send(('remove', vehname))
+
+    def incomingPacket(self, vehname: str, pkt, strconnection: str):
+        self.pags.modules.incomingPacket(vehname, pkt, strconnection)
+        if pkt.get_type() in FORWARD_MSGS:
+            self.pipe.send(('packet', vehname, bytes(pkt.get_msgbuf())))
+
+    def printVeh(self, text: str, vehname: str):
+        self.pipe.send(('print', vehname, text))
+
+    def readCoordinator(self):
+        """Handle the messages from the coordinator"""
+        try:
+            while self.pipe.poll():
+                msg = self.pipe.recv()
+                if msg[0] == 'command':
+                    self.pags.modules.onModuleCommandCallback(msg[1], msg[2])
+                elif msg[0] == 'stop':
+                    self.stopped.set()
+        except (EOFError, OSError):
+            # coordinator has gone
+            self.stopped.set()
+
+
+def runShard(sources: list, pipe, dialect: str, mav: float, source_system: int, source_component: int,
+             initialModules: list, parser: str, txpolicy: str, bulkmode: str, workerlinks: list,
+             eventloop: str, ingestbudget: float, conflate: bool, moduleexec: dict, nogui: bool, multi: str,
+             rxfilter: bool, fastcrc: bool):
+    """Entry point of a shard process"""
+    from PaGS.pags import pags
+
+    loop = newEventLoop(eventloop)
+    shard = pags(dialect, mav, source_system, source_component, nogui, multi, loop, initialModules,
+                 parser, txpolicy, bulkmode, workerlinks, ingestbudget, conflate, moduleexec, eventloop, rxfilter,
+                 fastcrc)
+    worker = ShardWorker(shard, pipe)
+    loop.add_reader(pipe.fileno(), worker.readCoordinator)
+    asyncio.ensure_future(shard.addVehicles(sources))
+    loop.run_until_complete(worker.stopped.wait())
+    loop.remove_reader(pipe.fileno())
+    shard.close()
+    loop.close()
+
+
+class ShardVehicle():
+    """
+    The coordinator's copy of a vehicle in a shard. It has the
+    vehicle attributes used by the user interface modules
+    """
+
+    def __init__(self, name: str, shard: int, dialect: str, mavversion: float):
+        self.name = name
+        self.shard = shard
+        self.dialect = dialect
+        self.mavversion = mavversion
+        self.mod = getpymavlinkpackage(dialect, mavversion)
+        self.mav = self.mod.MAVLink(self, srcSystem=0, srcComponent=0, use_native=False)
+        self.mav.robust_parsing = True
+        # True if the vehicle has rx'd >0 hb pkts
+        self.hasInitial = False
+
+
+class ShardModuleManager(moduleManager.moduleManager):
+    """
+    The coordinator's module manager. All commands are
+    passed on to the vehicle's shard
+    """
+
+    def __init__(self, loop, settingsDir, useGUI, cmdCallback, eventloop: str = 'asyncio'):
+        moduleManager.moduleManager.__init__(self, loop, settingsDir, useGUI, eventloop)
+        self.cmdCallback = cmdCallback
+
+    def onModuleCommandCallback(self, vehname, cmd):
+        """
+        Pass a user command to the vehicle's shard
+        """
+        if cmd == "":
+            self.printVeh(vehname, cmd)
+            return
+        self.cmdCallback(vehname, cmd)
+
+
+class ShardCoordinator():
+    """
+    Starts the shard processes, each with a share of the sources, and
+    presents their vehicles to the user interface modules
+    """
+
+    def __init__(self, loop, settingsDir: str, nshards: int, dialect: str, mav: float,
+                 source_system: int, source_component: int, frontModules: list, shardModules: list,
+                 parser: str = 'scanner', txpolicy: str = 'broadcast', bulkmode: str = 'policy',
+                 workerlinks=(), eventloop: str = 'asyncio', ingestbudget: float = 0.005,
+                 conflate: bool = False, moduleexec: dict = None, nogui: bool = True, multi: str = "",
+                 rxfilter: bool = False, fastcrc: bool = False):
+        self.loop = loop
+        self.nshards = nshards
+        self.dialect = dialect
+        self.mav = mav
+        self.fastcrc = fastcrc
+        if self.fastcrc:
+            installCRC(getpymavlinkpackage(dialect, mav))
+        # Arguments for the shards' pags instances
+        self.shardargs = (dialect, mav, source_system, source_component, shardModules,
+                          parser, txpolicy, bulkmode, list(workerlinks), eventloop, ingestbudget,
+                          conflate, moduleexec or {}, nogui, multi, rxfilter, fastcrc)
+
+        # The shard processes and the pipes to them
+        self.processes = []
+        self.pipes = []
+
+        # The vehicles in all shards
+        # Key is vehname, Val is the ShardVehicle
+        self.vehicles = {}
+
+        # Number of packets from the shards that could not be decoded
+        self.badframes = 0
+
+        self.modules = ShardModuleManager(loop, settingsDir, False, self.sendCommand, eventloop)
+        self.modules.onVehListAttach(self.getVehicleList)
+        self.modules.onVehGetAttach(self.getVehicle)
+        for m in frontModules:
+            self.modules.addModule(m, *(moduleexec or {}).get(m, ()))
+
+    def start(self, sources: list):
+        """Start the shards, splitting the sources between them"""
+        for index, shardsources in enumerate(assignShards(sources, self.nshards)):
+            if not shardsources:
+                continue
+            logging.debug("Shard %d has %s", index, shardsources)
+            pipe, shardpipe = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=runShard, daemon=True,
+                                              args=(shardsources, shardpipe) + self.shardargs)
+            process.start()
+            shardpipe.close()
+            self.loop.add_reader(pipe.fileno(), self.readShard, len(self.pipes))
+            self.processes.append(process)
+            self.pipes.append(pipe)
+
+    def getVehicleList(self):
+        """Get the names of the vehicles in all shards"""
+        return list(self.vehicles.keys())
+
+    def getVehicle(self, vehname: str):
+        """Get the copy of a vehicle"""
+        if vehname not in self.vehicles:
+            raise ValueError('No vehicle with that name')
+        return self.vehicles[vehname]
+
+    def sendCommand(self, vehname: str, cmd: str):
+        """Pass a command to the shard of a vehicle"""
+        if vehname not in self.vehicles:
+            self.modules.printVeh(vehname, "No vehicle with that name")
+            return
+        self.pipes[self.vehicles[vehname].shard].send(('command', vehname, cmd))
+
+    def readShard(self, shard: int):
+        """Handle the messages from a shard"""
+        pipe = self.pipes[shard]
+        try:
+            while pipe.poll():
+                self.handleMessage(shard, pipe.recv())
+        except (EOFError, OSError):
+            logging.debug("Shard %d stopped", shard)
+            self.loop.remove_reader(pipe.fileno())
+            for vehname in [name for name, veh in self.vehicles.items() if veh.shard == shard]:
+                self.handleMessage(shard, ('remove', vehname))
+
+    def handleMessage(self, shard: int, msg):
+        """Handle a single message from a shard"""
+        if msg[0] == 'add':
+            self.vehicles[msg[1]] = ShardVehicle(msg[1], shard, self.dialect, self.mav)
+            self.modules.addVehicle(msg[1])
+        elif msg[0] == 'remove':
+            if msg[1] in self.vehicles:
+                del self.vehicles[msg[1]]
+                self.modules.removeVehicle(msg[1])
+        elif msg[0] == 'print':
+            self.modules.printVeh(msg[1], msg[2])
+        elif msg[0] == 'packet':
+            vehicle = self.vehicles.get(msg[1])
+            if vehicle is None:
+                return
+            try:
+                pkt = vehicle.mav.decode(bytearray(msg[2]))
+            except vehicle.mod.MAVError as reason:
+                self.badframes += 1
+                logging.debug("Bad frame from shard - %s - %s", msg[1], reason.message)
+                return
+            if pkt.get_type() == 'HEARTBEAT':
+                vehicle.hasInitial = True
+            self.modules.incomingPacket(msg[1], pkt, None)
+
+    def close(self):
+        """
+        Cleanly shutdown the shards and modules
+        """
+        self.loop.run_until_complete(self.modules.closeAllModules())
+        for pipe in self.pipes:
+            self.loop.remove_reader(pipe.fileno())
+            try:
+                pipe.send(('stop',))
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        if self.fastcrc:
+            removeCRC(getpymavlinkpackage(self.dialect, self.mav))
@@ -26,6 +26,7 @@ A bit more complex than a dict!
 import asyncio
 
 from PaGS.vehicle.vehicle import Vehicle
+from PaGS.vehicle.conflationqueue import ConflationQueue
 
 
 class VehicleManager():
@@ -33,10 +34,15 @@ class VehicleManager():
     Manage a set of vehicle
     """
 
-    def __init__(self, loop):
+    def __init__(self, loop, conflate: bool = False):
         # list of current vehicle objects (by-ref) name key
         self.veh_list = {}
 
+        # If set, packets are passed to the modules through a
+        # ConflationQueue for each vehicle (by name key)
+        self.conflate = conflate
+        self.conflation = {}
+
         # asyncio event loop
         self.loop = loop
 
@@ -105,6 +111,9 @@ class VehicleManager():
             # Connect packet TX from vehicle to connectionManager
             self.veh_list[name].onPacketTxAttach(self.outgoingPacketBuffer)
 
+            if self.conflate:
+                self.conflation[name] = ConflationQueue(self.loop, name, self.modulePacket)
+
             # tell the modulemanager
             if self.add_vehicle_callback:
                 self.add_vehicle_callback(name)
@@ -133,6 +142,8 @@ class VehicleManager():
             await self.veh_list[name].stopheartbeat()
             await self.veh_list[name].stoprxtimeout()
             del self.veh_list[name]
+            if name in self.conflation:
+                self.conflation.pop(name).close()
             # tell the modulemanager
             if self.remove_vehicle_callback:
                 self.remove_vehicle_callback(name)
@@ -163,5 +174,19 @@ class VehicleManager():
         if vehname in self.veh_list:
             self.veh_list[vehname].newPacketCallback(pkt)
             # and send through to the modules
-            if self.incoming_packet_callback:
-                self.incoming_packet_callback(vehname, pkt, strconnection)
+            if vehname in self.conflation:
+                self.conflation[vehname].put(pkt, strconnection)
+            else:
+                self.modulePacket(vehname, pkt, strconnection)
+
+    def modulePacket(self, vehname, pkt, strconnection):
+        """Send a packet through to the modules"""
+        if self.incoming_packet_callback:
+            self.incoming_packet_callback(vehname, pkt, strconnection)
+
+    def get_conflation(self, name: str):
+        """Get the conflation queue counters of a vehicle.
+        None if conflation is not enabled"""
+        if name not in self.conflation:
+            return None
+        return self.conflation[name].get()
@@ -0,0 +1,214 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Splits a stream of bytes into raw MAVLink frames, reading the
+header fields directly from the bytes without decoding the payload
+"""
+import collections
+
+from PaGS.mavlink.x25crc import crcAccumulate
+
+PROTOCOL_MARKER_V1 = 0xFE
+PROTOCOL_MARKER_V2 = 0xFD
+HEADER_LEN_V1 = 6
+HEADER_LEN_V2 = 10
+SIGNATURE_LEN = 13
+IFLAG_SIGNED = 0x01
+MAX_FRAME_LEN = HEADER_LEN_V2 + 255 + 2 + SIGNATURE_LEN
+
+MAVFrame = collections.namedtuple(
+    'MAVFrame', ['buf', 'seq', 'srcSystem', 'srcComponent', 'msgId', 'crc', 'crcend'])
+
+
+def frameMsgId(buf) -> int:
+    """Get the msgid from the header of a packed frame.
+    None if buf does not start with a frame header"""
+    if len(buf) >= HEADER_LEN_V2 and buf[0] == PROTOCOL_MARKER_V2:
+        return buf[7] | (buf[8] << 8) | (buf[9] << 16)
+    if len(buf) >= HEADER_LEN_V1 and buf[0] == PROTOCOL_MARKER_V1:
+        return buf[5]
+    return None
+
+
+def frameFromBuf(buf) -> MAVFrame:
+    """Get the MAVFrame of a buffer holding exactly one
+    complete frame"""
+    if buf[0] == PROTOCOL_MARKER_V2:
+        crcend = HEADER_LEN_V2 + buf[1]
+        return MAVFrame(buf, buf[4], buf[5], buf[6], buf[7] | (buf[8] << 8) | (buf[9] << 16),
+                        buf[crcend] | (buf[crcend + 1] << 8), crcend)
+    crcend = HEADER_LEN_V1 + buf[1]
+    return MAVFrame(buf, buf[2], buf[3], buf[4], buf[5],
+                    buf[crcend] | (buf[crcend + 1] << 8), crcend)
+
+
+class FrameScanner():
+    """
+    Finds MAVLink v1/v2 frames in a byte stream. Partial frames are
+    held until the rest of the frame arrives
+    """
+
+    def __init__(self, mod):
+        self.mod = mod
+        self.buf = bytearray()
+
+        # crc_extra (as a byte) for each msgid in the dialect
+        self.crcextra = {msgid: bytes((msgtype.crc_extra,)) for msgid, msgtype in mod.mavlink_map.items()}
+
+        # set by reject() while iterating frames
+        self.rejected = False
+
+        # Number of bytes skipped while looking for a frame start
+        self.badbytes = 0
+
+    def reject(self):
+        """Mark the last frame from frames() as not being a valid frame.
+        Scanning resumes from the byte after it's start marker"""
+        self.rejected = True
+
+    def validate(self, frame) -> bool:
+        """Check the CRC of a frame"""
+        crcextra = self.crcextra.get(frame.msgId)
+        if crcextra is None:
+            return False
+        return crcAccumulate(bytes(frame.buf[1:frame.crcend]) + crcextra) == frame.crc
+
+    def keep(self, frame) -> MAVFrame:
+        """Get a frame that owns it's bytes, for a frame that is still
+        used after the scanner's buffer is reused"""
+        if isinstance(frame.buf, memoryview):
+            return frame._replace(buf=bytearray(frame.buf))
+        return frame
+
+    def frames(self, data):
+        """Generator of all complete frames in the stream, after
+        adding data"""
+        buf = self.buf
+        buf.extend(data)
+        self.used = 0
+        try:
+            yield from self.scan(buf, buf, 0, len(buf))
+        finally:
+            del buf[:self.used]
+
+    def scan(self, buf, view, pos: int, buflen: int):
+        """Generator of all complete frames in buf[pos:buflen]. The
+        buf of each frame is a slice of view. self.used is set to the
+        end of the bytes that have been handled"""
+        # If the caller raises an exception while handling a
+        # frame, that frame is dropped
+        self.used = pos
+        while buflen - pos >= 3:
+            magic = buf[pos]
+            if magic == PROTOCOL_MARKER_V2:
+                incompat = buf[pos + 2]
+                crcend = HEADER_LEN_V2 + buf[pos + 1]
+                framelen = crcend + 2
+                if incompat & IFLAG_SIGNED:
+                    framelen += SIGNATURE_LEN
+                if incompat & ~IFLAG_SIGNED:
+                    # not a valid frame start
+                    pos += 1
+                    self.used = pos
+                    self.badbytes += 1
+                    continue
+                if buflen - pos < framelen:
+                    break
+                frame = MAVFrame(view[pos:pos + framelen], buf[pos + 4], buf[pos + 5], buf[pos + 6],
+                                 buf[pos + 7] | (buf[pos + 8] << 8) | (buf[pos + 9] << 16),
+                                 buf[pos + crcend] | (buf[pos + crcend + 1] << 8), crcend)
+            elif magic == PROTOCOL_MARKER_V1:
+                crcend = HEADER_LEN_V1 + buf[pos + 1]
+                framelen = crcend + 2
+                if buflen - pos < framelen:
+                    break
+                frame = MAVFrame(view[pos:pos + framelen], buf[pos + 2], buf[pos + 3], buf[pos + 4], buf[pos + 5],
+                                 buf[pos + crcend] | (buf[pos + crcend + 1] << 8), crcend)
+            else:
+                # skip forward to the next possible frame start
+                nextv1 = buf.find(PROTOCOL_MARKER_V1, pos + 1, buflen)
+                nextv2 = buf.find(PROTOCOL_MARKER_V2, pos + 1, buflen)
+                nextpos = min(p for p in (nextv1, nextv2, buflen) if p != -1)
+                self.badbytes += nextpos - pos
+                pos = nextpos
+                self.used = pos
+                continue
+
+            self.rejected = False
+            self.used = pos + framelen
+            yield frame
+            if self.rejected:
+                pos += 1
+                self.badbytes += 1
+            else:
+                pos += framelen
+            self.used = pos
+
+
+class BufferedFrameScanner(FrameScanner):
+    """
+    A FrameScanner with a fixed receive buffer that a transport can
+    write into directly (see getBuffer()). Frames are found in place,
+    and the buf of each frame is a memoryview into the buffer. It is
+    only valid until the next getBuffer(), so use keep() to hold on to
+    a frame
+    """
+
+    def __init__(self, mod, size: int = 65536):
+        FrameScanner.__init__(self, mod)
+        self.rxbuf = bytearray(size)
+        self.view = memoryview(self.rxbuf)
+        # rxbuf[start:end] is the received data that is not yet handled
+        self.start = 0
+        self.end = 0
+
+    def getBuffer(self) -> memoryview:
+        """Get the free space at the end of the buffer. Any partial
+        frame is moved to the start of the buffer first, if space is
+        short"""
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif len(self.rxbuf) - self.end < MAX_FRAME_LEN:
+            size = self.end - self.start
+            self.rxbuf[:size] = bytes(self.view[self.start:self.end])
+            self.start = 0
+            self.end = size
+        return self.view[self.end:]
+
+    def bufferFrames(self, nbytes: int):
+        """Generator of all complete frames in the buffer, after
+        nbytes were written into getBuffer()"""
+        self.end += nbytes
+        try:
+            yield from self.scan(self.rxbuf, self.view, self.start, self.end)
+        finally:
+            self.start = self.used
+
+    def frames(self, data):
+        """Generator of all complete frames in the stream, after
+        copying data into the buffer"""
+        data = memoryview(data)
+        pos = 0
+        while pos < len(data):
+            buf = self.getBuffer()
+            size = min(len(buf), len(data) - pos)
+            buf[:size] = data[pos:pos + size]
+            pos += size
+            yield from self.bufferFrames(size)
@@ -0,0 +1,95 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+A MAVLink message that only decodes it's payload when a field
+is first accessed
+"""
+
+
+class LazyMessage():
+    """
+    Wraps a raw (CRC checked) frame from the FrameScanner. The header
+    is available straight away, the payload is decoded by pymavlink
+    on first access to any other attribute
+    """
+    __slots__ = ('_frame', '_mav', '_msgtype', '_msg')
+
+    def __init__(self, frame, mav, msgtype):
+        self._frame = frame
+        self._mav = mav
+        self._msgtype = msgtype
+        self._msg = None
+
+    @property
+    def name(self):
+        return self._msgtype.name
+
+    @property
+    def isDecoded(self) -> bool:
+        """True if the payload has been decoded"""
+        return self._msg is not None
+
+    def decoded(self):
+        """Get the decoded pymavlink message"""
+        if self._msg is None:
+            self._msg = self._mav.decode(bytearray(self._frame.buf))
+        return self._msg
+
+    def get_type(self):
+        return self._msgtype.name
+
+    def get_msgId(self):
+        return self._frame.msgId
+
+    def get_srcSystem(self):
+        return self._frame.srcSystem
+
+    def get_srcComponent(self):
+        return self._frame.srcComponent
+
+    def get_seq(self):
+        return self._frame.seq
+
+    def get_crc(self):
+        return self._frame.crc
+
+    def get_msgbuf(self):
+        return bytearray(self._frame.buf)
+
+    def __getattr__(self, attr):
+        # only called for attributes that are not defined above
+        return getattr(self.decoded(), attr)
+
+    def __setattr__(self, attr, value):
+        if attr in LazyMessage.__slots__:
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self.decoded(), attr, value)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyMessage):
+            other = other.decoded()
+        return self.decoded() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        return str(self.decoded())
@@ -0,0 +1,83 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+A fast MAVLink X.25 (CRC-16/MCRF4XX) checksum. This is the CCITT
+CRC with the bits of each byte reversed, so the bytes are reversed with
+a lookup table (bytes.translate) and the table-driven CCITT CRC in
+binascii is used. Both run over whole buffers in C
+"""
+import binascii
+
+# Each byte value with it's bits reversed
+REVERSE = bytes(int('{0:08b}'.format(i)[::-1], 2) for i in range(256))
+
+
+def reverse16(value: int) -> int:
+    """Reverse the bits of a 16 bit value"""
+    return (REVERSE[value & 0xFF] << 8) | REVERSE[value >> 8]
+
+
+def crcAccumulate(buf, crc: int = 0xFFFF) -> int:
+    """Get the X.25 CRC of buf (bytes, bytearray, memoryview or a
+    sequence of ints), continuing on from crc"""
+    return reverse16(binascii.crc_hqx(bytes(buf).translate(REVERSE), reverse16(crc)))
+
+
+class X25CRC():
+    """
+    Drop-in replacement for pymavlink's x25crc class
+    """
+    __slots__ = ('crc',)
+
+    def __init__(self, buf=None):
+        self.crc = 0xFFFF
+        if buf is not None:
+            if isinstance(buf, str):
+                self.accumulate_str(buf)
+            else:
+                self.accumulate(buf)
+
+    def accumulate(self, buf):
+        """Add in some more bytes"""
+        self.crc = crcAccumulate(buf, self.crc)
+
+    def accumulate_str(self, buf):
+        """Add in some more bytes, from a str or bytes"""
+        if isinstance(buf, str):
+            buf = buf.encode()
+        self.crc = crcAccumulate(buf, self.crc)
+
+
+def installCRC(mod):
+    """Use X25CRC for the CRCs in a pymavlink dialect module, for both
+    packing and decoding messages. This changes the module for everything
+    in the process that uses it, so it's opt-in. Undo with removeCRC()"""
+    if getattr(mod, 'x25crc', None) is not X25CRC:
+        mod.x25crc_python = mod.x25crc
+        mod.x25crc = X25CRC
+
+
+def removeCRC(mod):
+    """Put back pymavlink's own CRC in a dialect module, if
+    installCRC() was used on it"""
+    if getattr(mod, 'x25crc', None) is X25CRC:
+        mod.x25crc = mod.x25crc_python
+        del mod.x25crc_python
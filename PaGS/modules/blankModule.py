@@ -16,6 +16,9 @@ class Module(BaseModule):
 
         # The short name of the module.
         self.shortName = ""
+        # The MAVLink message types to get in incomingPacket(). The default
+        # (from BaseModule) is every packet
+        self.msgTypes = ["HEARTBEAT"]
 
     def addVehicle(self, name: str):
         """
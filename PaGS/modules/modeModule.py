@@ -24,6 +24,7 @@ class Module(BaseModule):
                             "arm": self.arm,
                             "disarm": self.disarm,
                             "reboot": self.reboot}
+        self.msgTypes = ["HEARTBEAT"]
 
         # for detecting mode change
         self.lastMode = {}
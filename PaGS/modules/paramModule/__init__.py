@@ -51,6 +51,8 @@ class Module(BaseModule):
                             'set': self.set,
                             'save': self.save,
                             'load': self.load}
+        # only the GUI needs the PARAM_VALUE's
+        self.msgTypes = ["PARAM_VALUE"] if self.isGUI else []
 
         if self.isGUI:
             from PaGS.modules.paramModule.paramModule_gui import ParamGUIFrame
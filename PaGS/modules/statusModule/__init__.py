@@ -29,6 +29,9 @@ class Module(BaseModule):
         # The short name of the module.
         self.shortName = "status"
         self.commandDict = {"status": self.status}
+        # the status command reads the vehicle's latest SYS_STATUS, so
+        # it's always needed
+        self.msgTypes = ["SYS_STATUS"]
 
         self.GUITasks = []
 
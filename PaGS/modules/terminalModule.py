@@ -90,6 +90,7 @@ class Module(BaseModule):
 
         # commands
         self.shortName = "terminal"
+        self.msgTypes = ["STATUSTEXT", "HEARTBEAT"]
 
         self.tabbar = []
 
@@ -3,6 +3,9 @@ Module Class. Subclass this in your
 own modules
 """
 
+# Put in msgTypes to get every packet
+ALL_MSGS = '*'
+
 
 class BaseModule():
     """
@@ -21,6 +24,10 @@ class BaseModule():
         self.shortName = None
         self.commandDict = {}
 
+        # The MAVLink message types (ie 'HEARTBEAT') passed to
+        # incomingPacket(). ALL_MSGS is every packet
+        self.msgTypes = [ALL_MSGS]
+
     def getMav(self, name: str):
         """
         Get the mavlink ref from a vehicle
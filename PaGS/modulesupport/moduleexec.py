@@ -0,0 +1,512 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Running of a module's incomingPacket(), either inline on the ingest
+path or isolated from it with a bounded queue: in scheduled runs on
+the event loop, in worker threads or in a worker process
+"""
+import asyncio
+import collections
+import functools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from contextlib import suppress
+
+from PaGS.connection.eventloop import newEventLoop
+from PaGS.connection.workerlink import workersAvailable
+from PaGS.modulesupport.module import ALL_MSGS
+
+EXECMODES = ('inline', 'task', 'thread', 'process')
+DROPPOLICIES = ('oldest', 'newest')
+
+
+def execModeAvailable(mode: str) -> bool:
+    """Check if a module execution mode can be used on this platform"""
+    if mode == 'process':
+        return workersAvailable()
+    return mode in EXECMODES
+
+
+def threadSafe(loop, func):
+    """Wrap func so it can be called from any thread. The call is run
+    in the event loop"""
+    def call(*args, **kwargs):
+        loop.call_soon_threadsafe(functools.partial(func, *args, **kwargs))
+    return call
+
+
+class InlineRunner():
+    """
+    Calls the handler for each packet straight away, on the ingest path
+    """
+    mode = 'inline'
+
+    def __init__(self, loop, handler, errback, policy: str = 'oldest', size: int = 1000):
+        if policy not in DROPPOLICIES:
+            raise ValueError("Unknown drop policy: " + str(policy))
+        self.loop = loop
+        # Called with (vehname, pkt) for each packet
+        self.handler = handler
+        # Called with (vehname, text) for any exception in the handler
+        self.errback = errback
+        # When the queue is full, drop the oldest waiting packet or
+        # the newest (incoming) packet
+        self.policy = policy
+        self.size = size
+
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.maxdepth = 0
+        # Longest time (sec) the handler has taken for a packet
+        self.maxtime = 0
+
+    def call(self, vehname: str, pkt):
+        """Run the handler for a packet"""
+        start = time.perf_counter()
+        failed = False
+        try:
+            self.handler(vehname, pkt)
+        except Exception:
+            failed = True
+            self.errback(vehname, traceback.format_exc())
+        self.count(time.perf_counter() - start, failed)
+
+    def count(self, elapsed: float, failed: bool):
+        """Update the counters after a packet is handled"""
+        self.handled += 1
+        if failed:
+            self.errors += 1
+        if elapsed > self.maxtime:
+            self.maxtime = elapsed
+
+    def put(self, vehname: str, pkt):
+        """Pass on a packet"""
+        self.call(vehname, pkt)
+
+    def depth(self) -> int:
+        """Number of packets waiting"""
+        return 0
+
+    def close(self):
+        """Stop passing on packets"""
+        pass
+
+    async def waitClosed(self):
+        """Wait until the handler is no longer being called"""
+        pass
+
+    def get(self) -> dict:
+        """Get the queue depth and counters"""
+        return {'mode': self.mode, 'policy': self.policy, 'queued': self.depth(), 'maxdepth': self.maxdepth,
+                'handled': self.handled, 'dropped': self.dropped, 'errors': self.errors,
+                'maxtime': self.maxtime}
+
+
+class TaskRunner(InlineRunner):
+    """
+    Queues packets, and calls the handler from the event loop up to
+    budget seconds at a time. Other events (such as the links) are
+    handled between each run
+    """
+    mode = 'task'
+
+    def __init__(self, loop, handler, errback, policy: str = 'oldest', size: int = 1000, budget: float = 0.005):
+        InlineRunner.__init__(self, loop, handler, errback, policy, size)
+        self.budget = budget
+        # Waiting packets, as (vehname, pkt)
+        self.queue = collections.deque()
+        # The scheduled run, if any
+        self.handle = None
+
+    def enqueue(self, vehname: str, pkt) -> bool:
+        """Add a packet to the queue, dropping a packet if it's full.
+        False if the packet was dropped"""
+        if len(self.queue) >= self.size:
+            self.dropped += 1
+            if self.policy == 'newest':
+                return False
+            self.queue.popleft()
+        self.queue.append((vehname, pkt))
+        self.maxdepth = max(self.maxdepth, len(self.queue))
+        return True
+
+    def put(self, vehname: str, pkt):
+        """Queue a packet for the handler"""
+        if self.enqueue(vehname, pkt) and self.handle is None:
+            self.handle = self.loop.call_soon(self.run)
+
+    def run(self):
+        """Pass on waiting packets, until the queue is empty or the
+        budget is used"""
+        self.handle = None
+        deadline = time.perf_counter() + self.budget
+        while self.queue:
+            self.call(*self.queue.popleft())
+            if time.perf_counter() >= deadline:
+                break
+        if self.queue and self.handle is None:
+            self.handle = self.loop.call_soon(self.run)
+
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def close(self):
+        """Stop any scheduled run and drop the waiting packets"""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.queue.clear()
+
+
+class ThreadRunner(InlineRunner):
+    """
+    Calls the handler from worker threads, each with it's own queue.
+    Each vehicle's packets all go to the same worker, so are handled
+    in order
+    """
+    mode = 'thread'
+
+    def __init__(self, loop, handler, errback, policy: str = 'oldest', size: int = 1000, workers: int = 1):
+        InlineRunner.__init__(self, loop, handler, threadSafe(loop, errback), policy, size)
+        # guards the counters updated by the workers
+        self.lock = threading.Lock()
+        self.queues = [queue.Queue(size) for i in range(max(1, workers))]
+        # Key is vehname, Val is the index of it's worker
+        self.vehworkers = {}
+        self.threads = []
+        for pktqueue in self.queues:
+            thread = threading.Thread(target=self.work, args=(pktqueue,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def count(self, elapsed: float, failed: bool):
+        with self.lock:
+            InlineRunner.count(self, elapsed, failed)
+
+    def work(self, pktqueue):
+        """Worker thread. Handles packets until a None is queued"""
+        while True:
+            item = pktqueue.get()
+            if item is None:
+                return
+            self.call(*item)
+
+    def put(self, vehname: str, pkt):
+        """Queue a packet for the vehicle's worker"""
+        worker = self.vehworkers.get(vehname)
+        if worker is None:
+            worker = self.vehworkers[vehname] = len(self.vehworkers) % len(self.queues)
+        pktqueue = self.queues[worker]
+        try:
+            pktqueue.put_nowait((vehname, pkt))
+        except queue.Full:
+            self.dropped += 1
+            if self.policy == 'newest':
+                return
+            with suppress(queue.Empty):
+                pktqueue.get_nowait()
+            with suppress(queue.Full):
+                pktqueue.put_nowait((vehname, pkt))
+        self.maxdepth = max(self.maxdepth, pktqueue.qsize())
+
+    def depth(self) -> int:
+        return sum(pktqueue.qsize() for pktqueue in self.queues)
+
+    def close(self):
+        """Drop the waiting packets and tell the workers to stop"""
+        for pktqueue in self.queues:
+            with suppress(queue.Empty):
+                while True:
+                    pktqueue.get_nowait()
+            pktqueue.put_nowait(None)
+
+    async def waitClosed(self, timeout: float = 1):
+        """Wait for the workers to stop, without blocking the loop.
+        A worker that is stuck in the handler is left behind"""
+        for thread in self.threads:
+            await self.loop.run_in_executor(None, thread.join, timeout)
+
+
+def newRunner(loop, mode: str, handler, errback, policy: str = 'oldest', size: int = 1000, workers: int = 1):
+    """Get the runner for a module's incomingPacket() in an execution
+    mode, other than 'process' (see ProcessModule)"""
+    if mode == 'inline':
+        return InlineRunner(loop, handler, errback, policy, size)
+    if mode == 'task':
+        return TaskRunner(loop, handler, errback, policy, size)
+    if mode == 'thread':
+        return ThreadRunner(loop, handler, errback, policy, size, workers)
+    raise ValueError("Unknown module execution mode: " + str(mode))
+
+
+class ProcessModule(TaskRunner):
+    """
+    Runs a module in a worker process, and stands in for it in this
+    process. Packets are passed on over a pipe as their bytes, up to
+    window packets at a time. Any more wait in the queue. The module's
+    commands, printed text and sent packets are passed back
+    """
+    mode = 'process'
+
+    def __init__(self, loop, name: str, settingsDir: str, txCallback, printer, vehObj,
+                 policy: str = 'oldest', size: int = 1000, window: int = 64, eventloop: str = 'asyncio'):
+        TaskRunner.__init__(self, loop, None, printer, policy, size)
+        self.name = name
+        self.txCallback = txCallback
+        self.printer = printer
+        self.vehObj = vehObj
+        self.window = window
+
+        # Packets sent to the worker and not yet handled
+        self.inflight = 0
+
+        # These are set by the module in the worker
+        self.shortName = None
+        self.commandDict = {}
+        self.msgTypes = []
+
+        self.pipe, workerpipe = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=runModuleProcess, daemon=True,
+                                               args=(name, workerpipe, settingsDir, eventloop))
+        self.process.start()
+        workerpipe.close()
+
+    async def waitReady(self, timeout: float = 10) -> bool:
+        """
+        Wait for the module to start in the worker. Returns False, and
+        stops the worker, if it could not be loaded
+        """
+        endtime = time.monotonic() + timeout
+        try:
+            while self.shortName is None:
+                # the pipe is polled in an executor, so the loop keeps running
+                if not await self.loop.run_in_executor(None, self.pipe.poll, max(0, endtime - time.monotonic())):
+                    raise EOFError("Module did not start in time")
+                msg = self.pipe.recv()
+                if msg[0] == 'error':
+                    raise EOFError(msg[1])
+                self.handleMessage(msg)
+        except (EOFError, OSError) as reason:
+            self.printer(None, "Cannot start module {0} - {1}".format(self.name, str(reason) or "process stopped"))
+            await self.loop.run_in_executor(None, self.process.join, 1)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.pipe.close()
+            return False
+        self.loop.add_reader(self.pipe.fileno(), self.readWorker)
+        return True
+
+    def send(self, msg) -> bool:
+        """Send a message to the worker. False if it's gone"""
+        try:
+            self.pipe.send(msg)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def sendPacket(self, vehname: str, pkt):
+        """Pass a packet on to the worker"""
+        try:
+            buf = bytes(pkt.get_msgbuf())
+        except TypeError:
+            # only packets that were received or packed have their bytes
+            logging.debug("Packet %s for %s was never packed - dropped", pkt.get_type(), self.name)
+            self.dropped += 1
+            return
+        if self.send(('packet', vehname, buf)):
+            self.inflight += 1
+        else:
+            self.dropped += 1
+
+    def put(self, vehname: str, pkt):
+        """Pass on a packet, or queue it if the window is full"""
+        if self.inflight < self.window and not self.queue:
+            self.sendPacket(vehname, pkt)
+        else:
+            self.enqueue(vehname, pkt)
+
+    def run(self):
+        """Pass on waiting packets, until the window is full"""
+        while self.queue and self.inflight < self.window:
+            self.sendPacket(*self.queue.popleft())
+
+    def incomingPacket(self, vehname: str, pkt):
+        self.put(vehname, pkt)
+
+    def depth(self) -> int:
+        return len(self.queue) + self.inflight
+
+    def sendCommand(self, cmd: str, vehname: str, *args):
+        """Pass a user command to the module"""
+        self.send(('command', vehname, cmd, args))
+
+    def readWorker(self):
+        """Handle the messages from the worker"""
+        try:
+            while self.pipe.poll():
+                self.handleMessage(self.pipe.recv())
+        except (EOFError, OSError):
+            logging.debug("Module process %s stopped", self.name)
+            self.loop.remove_reader(self.pipe.fileno())
+            self.dropped += self.inflight
+            self.inflight = 0
+
+    def handleMessage(self, msg):
+        """Handle a single message from the worker"""
+        if msg[0] == 'done':
+            self.inflight = max(0, self.inflight - msg[1])
+            self.handled, self.errors, self.maxtime = msg[2:5]
+            self.run()
+        elif msg[0] == 'tx':
+            self.txCallback(msg[1], msg[2], **msg[3])
+        elif msg[0] == 'print':
+            self.printer(msg[1], msg[2])
+        elif msg[0] == 'ready':
+            self.shortName = msg[1]
+            self.commandDict = {cmd: functools.partial(self.sendCommand, cmd) for cmd in msg[2]}
+            self.msgTypes = msg[3]
+
+    def addVehicle(self, name: str):
+        vehicle = self.vehObj(name)
+        self.send(('add', name, vehicle.dialect, vehicle.mavversion))
+
+    def removeVehicle(self, name: str):
+        self.send(('remove', name))
+
+    def close(self):
+        TaskRunner.close(self)
+        self.inflight = 0
+
+    async def closeModule(self):
+        """Stop the worker, once it has closed the module"""
+        self.send(('stop',))
+        await self.loop.run_in_executor(None, self.process.join, 2)
+        if self.process.is_alive():
+            self.process.terminate()
+        with suppress(ValueError, OSError):
+            self.loop.remove_reader(self.pipe.fileno())
+        self.pipe.close()
+
+
+class ModuleWorker():
+    """
+    Runs in a module's worker process. Holds a copy of each vehicle to
+    decode the packets, and passes the module's output back
+    """
+
+    def __init__(self, loop, name: str, pipe, settingsDir: str):
+        # imported here, as the managers import this module
+        from PaGS.managers.moduleManager import moduleManager
+        from PaGS.managers.shardManager import ShardVehicle
+        self.newVehicle = ShardVehicle
+
+        self.pipe = pipe
+        self.stopped = asyncio.Event()
+
+        # Key is vehname, Val is the ShardVehicle
+        self.vehicles = {}
+
+        self.modules = moduleManager(loop, settingsDir, False)
+        self.modules.onVehListAttach(lambda: list(self.vehicles.keys()))
+        self.modules.onVehGetAttach(self.getVehicle)
+        self.modules.onPktTxAttach(self.sendPacket)
+        self.modules.printers['process'] = self.printVeh
+        try:
+            self.modules.addModule(name)
+        except Exception:
+            self.pipe.send(('error', traceback.format_exc().strip().splitlines()[-1]))
+            self.module = None
+            return
+        self.module = self.modules.multiModules[name]
+        self.runner = self.modules.runners[name]
+
+        self.pipe.send(('ready', self.module.shortName, list(self.module.commandDict.keys()),
+                        list(getattr(self.module, 'msgTypes', [ALL_MSGS]))))
+
+    def getVehicle(self, vehname: str):
+        """Get the copy of a vehicle"""
+        if vehname not in self.vehicles:
+            raise ValueError('No vehicle with that name')
+        return self.vehicles[vehname]
+
+    def sendPacket(self, vehname: str, pktType, **kwargs):
+        self.pipe.send(('tx', vehname, pktType, kwargs))
+
+    def printVeh(self, text: str, vehname: str):
+        self.pipe.send(('print', vehname, text))
+
+    def readManager(self):
+        """Handle the messages from the module manager"""
+        pkts = 0
+        try:
+            while self.pipe.poll():
+                msg = self.pipe.recv()
+                if msg[0] == 'packet':
+                    pkts += 1
+                    vehicle = self.vehicles.get(msg[1])
+                    if vehicle is None:
+                        continue
+                    try:
+                        pkt = vehicle.mav.decode(bytearray(msg[2]))
+                    except Exception:
+                        continue
+                    self.modules.incomingPacket(msg[1], pkt, None)
+                elif msg[0] == 'add':
+                    self.vehicles[msg[1]] = self.newVehicle(msg[1], None, msg[2], msg[3])
+                    self.vehicles[msg[1]].hasInitial = True
+                    self.modules.addVehicle(msg[1])
+                elif msg[0] == 'remove':
+                    if msg[1] in self.vehicles:
+                        del self.vehicles[msg[1]]
+                        self.modules.removeVehicle(msg[1])
+                elif msg[0] == 'command':
+                    try:
+                        self.module.commandDict[msg[2]](msg[1], *msg[3])
+                    except Exception:
+                        self.modules.printVeh(msg[1], traceback.format_exc())
+                elif msg[0] == 'stop':
+                    self.stopped.set()
+        except (EOFError, OSError):
+            # module manager has gone
+            self.stopped.set()
+            return
+        if pkts:
+            runner = self.runner
+            self.pipe.send(('done', pkts, runner.handled, runner.errors, runner.maxtime))
+
+
+def runModuleProcess(name: str, pipe, settingsDir: str, eventloop: str):
+    """Entry point of a module's worker process"""
+    loop = newEventLoop(eventloop)
+    worker = ModuleWorker(loop, name, pipe, settingsDir)
+    if worker.module is None:
+        loop.close()
+        return
+    loop.add_reader(pipe.fileno(), worker.readManager)
+    loop.run_until_complete(worker.stopped.wait())
+    loop.remove_reader(pipe.fileno())
+    loop.run_until_complete(worker.modules.closeAllModules())
+    loop.close()
@@ -22,6 +22,7 @@ from __future__ import unicode_literals
 
 import asyncio
 import argparse
+import logging
 import sys
 import os
 import platform
@@ -35,8 +36,17 @@ if platform.system() == 'Windows' and sys.version_info >= (3, 8):
 
 from PaGS.managers.connectionManager import ConnectionManager
 from PaGS.managers.vehicleManager import VehicleManager
+from PaGS.vehicle.vehicle import VEHICLE_MSGS
 from PaGS.managers import moduleManager
+from PaGS.managers.shardManager import ShardCoordinator
 from PaGS.connection.seriallink import findserial
+from PaGS.connection.mavconnection import PARSERS
+from PaGS.connection.linkselect import TXPOLICIES, BULKMODES
+from PaGS.connection.workerlink import workersAvailable
+from PaGS.connection.eventloop import LOOPS, newEventLoop
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+from PaGS.mavlink.x25crc import installCRC, removeCRC
+from PaGS.modulesupport.moduleexec import EXECMODES, DROPPOLICIES
 
 
 class RedirPrint(object):
@@ -60,7 +70,9 @@ class pags():
     """
     A single PaGS instance
     """
-    def __init__(self, dialect, mav, source_system, source_component, nogui, multi, loop, initialModules):
+    def __init__(self, dialect, mav, source_system, source_component, nogui, multi, loop, initialModules,
+                 parser='scanner', txpolicy='broadcast', bulkmode='policy', workerlinks=(), ingestbudget=0.005,
+                 conflate=False, moduleexec=None, eventloop='asyncio', rxfilter=False, fastcrc=False):
         """
         Start up PaGS
         """
@@ -70,6 +82,12 @@ class pags():
         self.dialect = dialect
         self.mav = mav
 
+        # With fastcrc, pymavlink's CRC is swapped for the faster X25CRC
+        # while this instance is running
+        self.fastcrc = fastcrc
+        if self.fastcrc:
+            installCRC(getpymavlinkpackage(dialect, mav))
+
         # The PaGS settings dir
         self.settingsdir = os.path.join(str(Path.home()), ".PaGS")
         if not os.path.exists(self.settingsdir):
@@ -79,13 +97,15 @@ class pags():
         self.loop = loop
 
         # Start the connection maxtrix
-        self.connmtrx = ConnectionManager(self.loop, dialect, mav, source_system, source_component)
+        self.connmtrx = ConnectionManager(self.loop, dialect, mav, source_system, source_component,
+                                          parser=parser, txpolicy=txpolicy, bulkmode=bulkmode,
+                                          workerlinks=workerlinks, ingestbudget=ingestbudget)
 
         # Dict of vehicles
-        self.allvehicles = VehicleManager(self.loop)
+        self.allvehicles = VehicleManager(self.loop, conflate)
 
         # Module manager
-        self.modules = moduleManager.moduleManager(self.loop, self.settingsdir, not nogui)
+        self.modules = moduleManager.moduleManager(self.loop, self.settingsdir, not nogui, eventloop)
 
         # event links from connmaxtrix -> vehicle manager
         self.connmtrx.onPacketAttach(self.allvehicles.onPacketRecieved)
@@ -99,21 +119,48 @@ class pags():
         self.modules.onPktTxAttach(self.allvehicles.send_message)
         self.modules.onVehListAttach(self.allvehicles.get_vehiclelist)
         self.modules.onVehGetAttach(self.allvehicles.get_vehicle)
+        self.modules.onConflationAttach(self.allvehicles.get_conflation)
+
+        # event links from module manager -> connmatrix
+        # With rxfilter, only the message types the modules and vehicles
+        # use are decoded, so the vehicles' getPacket() only has those
+        self.rxfilter = rxfilter
+        self.extraMsgTypes = set()
+        self.modules.onMsgTypesAttach(self.setRxMsgTypes)
+        self.modules.onLinkStatsAttach(self.connmtrx.getLinkStats)
+        self.modules.onLinkQueuesAttach(self.connmtrx.getTxQueues)
+        self.modules.onLinkStateAttach(self.connmtrx.getLinkState)
+        self.modules.onGetLinkPolicyAttach(self.connmtrx.getTxPolicy)
+        self.modules.onSetLinkPolicyAttach(self.connmtrx.setTxPolicy)
+        self.modules.onGetLinkBulkAttach(self.connmtrx.getBulkMode)
+        self.modules.onSetLinkBulkAttach(self.connmtrx.setBulkMode)
 
         # event links vehicle manager -> module manager
         self.allvehicles.onAddVehicleAttach(self.modules.addVehicle)
         self.allvehicles.onRemoveVehicleAttach(self.modules.removeVehicle)
         self.allvehicles.onPacketRxAttach(self.modules.incomingPacket)
 
-        # Need to load initial modules
+        # Need to load initial modules, each in it's execution mode
+        # Key of moduleexec is module name, Val is the addModule() args
         for m in initialModules:
-            self.modules.addModule(m)
+            self.modules.addModule(m, *(moduleexec or {}).get(m, ()))
 
         # redirect stdout to the terminal printer, if loaded
         # Thus print() can be used properly
         if self.modules.multiModules.get('modules.terminalModule'):
             sys.stdout = RedirPrint(self.modules.multiModules.get('modules.terminalModule').print)
 
+    def setRxMsgTypes(self, msgTypes):
+        """
+        Only decode the message types in msgTypes (None for all), plus
+        the ones the vehicles use and extraMsgTypes. Everything is
+        decoded if rxfilter is off
+        """
+        if msgTypes is None or not self.rxfilter:
+            self.connmtrx.setRxMsgTypes(None)
+        else:
+            self.connmtrx.setRxMsgTypes(set(msgTypes) | set(VEHICLE_MSGS) | self.extraMsgTypes)
+
     async def addVehicles(self, source):
         # Create vehicles and links
         # Each sysID is assumed to be a different vehicle
@@ -140,6 +187,9 @@ class pags():
 
         self.loop.run_until_complete(self.connmtrx.stoploop())
 
+        if self.fastcrc:
+            removeCRC(getpymavlinkpackage(self.dialect, self.mav))
+
 
 if __name__ == '__main__':
 
@@ -164,10 +214,40 @@ if __name__ == '__main__':
                         help="Use connection file for multivehicle")
     parser.add_argument("--nogui", help="Disable useage of a GUI",
                         action="store_true")
+    parser.add_argument("--parser", default="scanner", choices=PARSERS,
+                        help="MAVLink parser backend for links. Falls back to python if not available")
+    parser.add_argument("--txpolicy", default="broadcast", choices=TXPOLICIES,
+                        help="Links to send on, for vehicles with multiple links")
+    parser.add_argument("--bulkmode", default="policy", choices=BULKMODES,
+                        help="Links to send bulk transfers on, for vehicles with multiple links")
+    parser.add_argument("--worker", action='append',
+                        metavar="CONTYPE:CONSTR",
+                        help="Run a serial, tcpclient or udpclient connection in a worker process, "
+                             "ie --worker=serial:/dev/ttyUSB0:57600",
+                        default=[])
+    parser.add_argument("--ingestbudget", default=5, type=float,
+                        help="Max time (ms) to spend passing on received packets before handling other events")
+    parser.add_argument("--conflate", action="store_true",
+                        help="When the modules fall behind, only pass on the newest of each telemetry message")
+    parser.add_argument("--moduleexec", action='append',
+                        metavar="MODULE:MODE[:POLICY[:SIZE[:WORKERS]]]",
+                        help="Run a module's packet handling in one of " + ", ".join(EXECMODES) +
+                             ", dropping the " + " or ".join(DROPPOLICIES) + " packets when it's queue is full, "
+                             "ie --moduleexec=modules.statusModule:task:oldest:1000",
+                        default=[])
+    parser.add_argument("--loop", default="asyncio", choices=LOOPS,
+                        help="Event loop to use. Falls back to asyncio if not available")
+    parser.add_argument("--rxfilter", action="store_true",
+                        help="Only decode the message types the modules use. The vehicles then only have "
+                             "the latest packet of those types")
+    parser.add_argument("--fastcrc", action="store_true",
+                        help="Use a faster CRC for packing and decoding messages")
+    parser.add_argument("--shards", default=0, type=int,
+                        help="Split the vehicles across this many processes")
     args = parser.parse_args()
 
     # Start asyncio, if needed
-    loop = asyncio.get_event_loop()
+    loop = newEventLoop(args.loop)
     loop.set_default_executor(ThreadPoolExecutor(1000))
 
     # Any modules to load on startup
@@ -190,9 +270,47 @@ if __name__ == '__main__':
     if len(args.source) == 0:
         args.source.append("udpserver:127.0.0.1:14550:1:0")
 
-    main = pags(args.dialect, args.mav, args.source_system, args.source_component, args.nogui, args.multi, loop, initialModules)
-
-    asyncio.ensure_future(main.addVehicles(args.source))
+    # Execution modes of the modules
+    moduleexec = {}
+    for spec in args.moduleexec:
+        fields = spec.split(':')
+        if len(fields) < 2 or len(fields) > 5:
+            parser.error("--moduleexec must be MODULE:MODE[:POLICY[:SIZE[:WORKERS]]], not " + spec)
+        if fields[1] not in EXECMODES:
+            parser.error("--moduleexec mode must be one of " + ", ".join(EXECMODES) + ", not " + fields[1])
+        if len(fields) > 2 and fields[2] not in DROPPOLICIES:
+            parser.error("--moduleexec policy must be one of " + ", ".join(DROPPOLICIES) + ", not " + fields[2])
+        try:
+            sizes = tuple(int(field) for field in fields[3:5])
+        except ValueError:
+            parser.error("--moduleexec queue size and workers must be numbers, not " + spec)
+        if any(size < 1 for size in sizes):
+            parser.error("--moduleexec queue size and workers must be at least 1, not " + spec)
+        moduleexec[fields[0]] = tuple(fields[1:3]) + sizes
+
+    if args.shards > 0 and not workersAvailable():
+        logging.warning("Shards are not available on this platform, running in a single process")
+
+    if args.shards > 0 and workersAvailable():
+        # the user interface modules run here, the rest in the shards
+        frontModules = [m for m in initialModules if m == "modules.terminalModule"]
+        shardModules = [m for m in initialModules if m != "modules.terminalModule"]
+        settingsdir = os.path.join(str(Path.home()), ".PaGS")
+        if not os.path.exists(settingsdir):
+            os.makedirs(settingsdir)
+        main = ShardCoordinator(loop, settingsdir, args.shards, args.dialect, args.mav, args.source_system,
+                                args.source_component, frontModules, shardModules, args.parser,
+                                args.txpolicy, args.bulkmode, args.worker, args.loop, args.ingestbudget / 1000,
+                                args.conflate, moduleexec, args.nogui, args.multi, args.rxfilter, args.fastcrc)
+        if main.modules.multiModules.get('modules.terminalModule'):
+            sys.stdout = RedirPrint(main.modules.multiModules.get('modules.terminalModule').print)
+        main.start(args.source)
+    else:
+        main = pags(args.dialect, args.mav, args.source_system, args.source_component, args.nogui, args.multi, loop,
+                    initialModules, args.parser, args.txpolicy, args.bulkmode, args.worker, args.ingestbudget / 1000,
+                    args.conflate, moduleexec, args.loop, args.rxfilter, args.fastcrc)
+
+        asyncio.ensure_future(main.addVehicles(args.source))
 
     # Enter the asyncio event loop and wait for a
     # ctrl+c to exit
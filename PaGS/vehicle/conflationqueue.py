@@ -0,0 +1,130 @@
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+"""
+Conflation of a vehicle's packets to the modules, when overloaded
+"""
+import collections
+import time
+
+# Messages where only the newest is needed. Any others are
+# never dropped
+CONFLATE_MSGS = ('ATTITUDE', 'ATTITUDE_QUATERNION', 'AHRS', 'AHRS2', 'AHRS3', 'VFR_HUD',
+                 'GLOBAL_POSITION_INT', 'LOCAL_POSITION_NED', 'GPS_RAW_INT', 'GPS2_RAW',
+                 'SYS_STATUS', 'RAW_IMU', 'SCALED_IMU', 'SCALED_IMU2', 'SCALED_IMU3',
+                 'SCALED_PRESSURE', 'SCALED_PRESSURE2', 'SERVO_OUTPUT_RAW', 'RC_CHANNELS',
+                 'RC_CHANNELS_RAW', 'NAV_CONTROLLER_OUTPUT', 'VIBRATION', 'BATTERY_STATUS',
+                 'HWSTATUS', 'MEMINFO', 'POWER_STATUS', 'SYSTEM_TIME', 'TERRAIN_REPORT',
+                 'EKF_STATUS_REPORT', 'WIND', 'RANGEFINDER', 'DISTANCE_SENSOR', 'SIMSTATE',
+                 'ESC_TELEMETRY_1_TO_4', 'RADIO_STATUS', 'ALTITUDE', 'HIGHRES_IMU')
+
+
+class ConflationQueue():
+    """
+    Passes a vehicle's packets on to the handler from the event loop,
+    up to budget seconds at a time. While overload or more packets are
+    waiting, a CONFLATE_MSGS packet replaces the waiting packet of the
+    same type and component, so only the newest is passed on
+    """
+
+    def __init__(self, loop, vehname: str, handler, overload: int = 100, budget: float = 0.005):
+        self.loop = loop
+        self.vehname = vehname
+        # Called with (vehname, pkt, strconnection) for each packet
+        self.handler = handler
+        self.overload = overload
+        self.budget = budget
+
+        # Waiting packets, as [pkt, strconnection, key]
+        self.queue = collections.deque()
+        # The waiting CONFLATE_MSGS packets
+        # Key is (msg type, srcComponent), Val is the queue entry
+        self.latest = {}
+
+        # The scheduled run, if any
+        self.handle = None
+
+        self.overloaded = False
+        # Number of times the queue has become overloaded
+        self.overloads = 0
+        # Packets replaced by a newer one, by type
+        self.conflated = collections.Counter()
+        self.maxdepth = 0
+
+    def put(self, pkt, strconnection: str):
+        """Queue a packet for the handler"""
+        name = pkt.get_type()
+        key = (name, pkt.get_srcComponent()) if name in CONFLATE_MSGS else None
+        if len(self.queue) >= self.overload:
+            if not self.overloaded:
+                self.overloaded = True
+                self.overloads += 1
+            entry = self.latest.get(key) if key else None
+            if entry is not None:
+                entry[0] = pkt
+                entry[1] = strconnection
+                self.conflated[name] += 1
+                return
+        entry = [pkt, strconnection, key]
+        self.queue.append(entry)
+        if key:
+            self.latest[key] = entry
+        self.maxdepth = max(self.maxdepth, len(self.queue))
+        if self.handle is None:
+            self.handle = self.loop.call_soon(self.run)
+
+    def run(self):
+        """Pass on waiting packets, until the queue is empty or the
+        budget is used"""
+        self.handle = None
+        deadline = time.perf_counter() + self.budget
+        while self.queue:
+            self.pop()
+            if time.perf_counter() >= deadline:
+                break
+        if len(self.queue) < self.overload:
+            self.overloaded = False
+        if self.queue and self.handle is None:
+            self.handle = self.loop.call_soon(self.run)
+
+    def pop(self):
+        """Pass on the oldest waiting packet"""
+        pkt, strconnection, key = entry = self.queue.popleft()
+        if key and self.latest.get(key) is entry:
+            del self.latest[key]
+        self.handler(self.vehname, pkt, strconnection)
+
+    def flush(self):
+        """Pass on all waiting packets now"""
+        self.close()
+        while self.queue:
+            self.pop()
+
+    def close(self):
+        """Stop any scheduled run"""
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def get(self) -> dict:
+        """Get the queue depth and overload counters"""
+        return {'queued': len(self.queue), 'maxdepth': self.maxdepth, 'overloaded': self.overloaded,
+                'overloads': self.overloads, 'conflated': sum(self.conflated.values()),
+                'types': dict(self.conflated)}
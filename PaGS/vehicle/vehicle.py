@@ -43,6 +43,9 @@ from contextlib import suppress
 
 from PaGS.mavlink.pymavutil import getpymavlinkpackage
 
+# Message types the vehicle itself uses
+VEHICLE_MSGS = ('HEARTBEAT', 'PARAM_VALUE')
+
 
 class Vehicle():
     """
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Benchmark of the MAVLink X.25 CRC. Compares pymavlink's python CRC
+with the PaGS CRC on raw frames, and the packing and decoding of
+messages with each
+"""
+import argparse
+import time
+
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+from PaGS.mavlink.x25crc import X25CRC
+
+
+def maketraffic(mod, count: int) -> list:
+    """Make a list of typical telemetry messages"""
+    msgs = [mod.MAVLink_heartbeat_message(2, 3, 81, 0, 4, 3),
+            mod.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0.01, 0.02, 0.03),
+            mod.MAVLink_global_position_int_message(1000, -353621474, 1491651746, 584000, 10000, 10, 20, 30, 9000),
+            mod.MAVLink_param_value_message(b'SYSID_THISMAV', 1.0, 9, 500, 1),
+            mod.MAVLink_statustext_message(6, b'PreArm: Compass not calibrated')]
+    return [msgs[n % len(msgs)] for n in range(count)]
+
+
+def runcrc(crcclass, mod, msgs: list, bufs: list) -> tuple:
+    """Time the raw CRCs, packing and decoding with a CRC class.
+    Returns the (crcs/sec, packs/sec, decodes/sec)"""
+    original = mod.x25crc
+    mod.x25crc = crcclass
+    mav = mod.MAVLink(None, srcSystem=1, srcComponent=1, use_native=False)
+
+    start = time.perf_counter()
+    for buf in bufs:
+        crcclass(buf)
+    crctime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for msg in msgs:
+        msg.pack(mav)
+    packtime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for buf in bufs:
+        mav.decode(bytearray(buf))
+    decodetime = time.perf_counter() - start
+
+    mod.x25crc = original
+    return (len(bufs) / crctime, len(msgs) / packtime, len(bufs) / decodetime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MAVLink X.25 CRC")
+    parser.add_argument("--mav", default=2, type=int, help="Mavlink Version (1 or 2)")
+    parser.add_argument("--count", default=20000, type=int, help="Number of messages")
+    args = parser.parse_args()
+
+    mod = getpymavlinkpackage('ardupilotmega', float(args.mav))
+    msgs = maketraffic(mod, args.count)
+    mav = mod.MAVLink(None, srcSystem=1, srcComponent=1, use_native=False)
+    bufs = [bytes(msg.pack(mav)) for msg in msgs]
+
+    print("{0:<10}{1:>14}{2:>14}{3:>14}".format("crc", "crcs/sec", "packs/sec", "decodes/sec"))
+    for name, crcclass in [('pymavlink', mod.x25crc), ('pags', X25CRC)]:
+        crcs, packs, decodes = runcrc(crcclass, mod, msgs, bufs)
+        print("{0:<10}{1:>14.0f}{2:>14.0f}{3:>14.0f}".format(name, crcs, packs, decodes))
+
+
+if __name__ == '__main__':
+    main()
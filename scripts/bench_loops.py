@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Benchmark of the event loops. Sends generated telemetry over UDP
+to a udpserver link and measures the packet throughput and how late
+the loop runs a 1 ms timer while the traffic is flowing.
+"""
+import argparse
+import asyncio
+import time
+
+from PaGS.connection.eventloop import LOOPS, loopAvailable, newEventLoop
+from PaGS.connection.udplink import UDPConnection
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+class Sender(asyncio.DatagramProtocol):
+    """Sends datagrams to the link"""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+
+async def ticker(lateness: list, stop: asyncio.Event, period: float):
+    """Record how late each timer tick is"""
+    loop = asyncio.get_event_loop()
+    while not stop.is_set():
+        due = loop.time() + period
+        await asyncio.sleep(period)
+        lateness.append(loop.time() - due)
+
+
+async def runbench(mod, mavversion: float, port: int, count: int, batch: int):
+    """Send count packets to a link, batch packets between each
+    loop iteration. Returns the packets received, time taken and
+    timer lateness"""
+    loop = asyncio.get_event_loop()
+    received = []
+    link = UDPConnection('ardupilotmega', mavversion, "udpserver:127.0.0.1:" + str(port), 255, 0,
+                         lambda msg, name: received.append(msg), server=True, parser='scanner')
+    link.lazydecode = True
+    await loop.create_datagram_endpoint(lambda: link, local_addr=('127.0.0.1', port))
+    transport, sender = await loop.create_datagram_endpoint(Sender, remote_addr=('127.0.0.1', port))
+
+    mav = mod.MAVLink(None, srcSystem=1, srcComponent=1)
+    packets = []
+    for n in range(256):
+        packets.append(mod.MAVLink_attitude_message(1000 * n, 0.1, 0.2, 0.3, 0.01, 0.02, 0.03).pack(
+            mav, force_mavlink1=(mavversion == 1.0)))
+        mav.seq = (mav.seq + 1) % 256
+
+    lateness = []
+    stop = asyncio.Event()
+    tick = asyncio.ensure_future(ticker(lateness, stop, 0.001))
+
+    start = time.perf_counter()
+    for n in range(count):
+        transport.sendto(packets[n % 256])
+        if n % batch == batch - 1:
+            await asyncio.sleep(0)
+    # wait for the last packets to arrive
+    lastcount = -1
+    while len(received) != lastcount:
+        lastcount = len(received)
+        await asyncio.sleep(0.05)
+    duration = time.perf_counter() - start - 0.05
+
+    stop.set()
+    await tick
+    transport.close()
+    link.close()
+    return (len(received), duration, lateness)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PaGS event loops")
+    parser.add_argument("--mav", default=2, type=int, help="Mavlink Version (1 or 2)")
+    parser.add_argument("--count", default=100000, type=int, help="Number of packets to send")
+    parser.add_argument("--batch", default=20, type=int, help="Packets sent per loop iteration")
+    parser.add_argument("--port", default=15700, type=int, help="Local UDP port to use")
+    args = parser.parse_args()
+
+    mavversion = float(args.mav)
+    mod = getpymavlinkpackage('ardupilotmega', mavversion)
+
+    print("{0:<10}{1:>12}{2:>14}{3:>14}{4:>14}".format("loop", "received", "pkts/sec", "mean lag ms", "max lag ms"))
+    for name in LOOPS:
+        if not loopAvailable(name):
+            print("{0:<10}not available".format(name))
+            continue
+        loop = newEventLoop(name)
+        received, duration, lateness = loop.run_until_complete(
+            runbench(mod, mavversion, args.port, args.count, args.batch))
+        loop.close()
+        lateness = lateness or [0]
+        print("{0:<10}{1:>12}{2:>14.0f}{3:>14.3f}{4:>14.3f}".format(
+            name, received, received / duration, 1000 * sum(lateness) / len(lateness), 1000 * max(lateness)))
+
+
+if __name__ == '__main__':
+    main()
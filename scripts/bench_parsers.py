@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Benchmark of the parser backends (messages/sec). Uses a recorded
+telemetry log (.tlog) if given, otherwise generated telemetry.
+
+Each backend's decoded messages are compared against the python
+parser, so a backend that is fast but wrong for the dialect is shown.
+"""
+import argparse
+import random
+import time
+
+from PaGS.connection.mavconnection import MAVConnection, PARSERS
+from PaGS.mavlink.framescanner import FrameScanner
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+def loadtlog(filename: str, mod) -> bytes:
+    """Get the MAVLink frames from a tlog. Each frame in a tlog
+    is preceded by an 8 byte timestamp"""
+    with open(filename, 'rb') as f:
+        data = f.read()
+    scanner = FrameScanner(mod)
+    frames = []
+    for frame in scanner.frames(data):
+        if scanner.validate(frame):
+            frames.append(bytes(frame.buf))
+        else:
+            # resync from the next byte, as the decoders do
+            scanner.reject()
+    return b''.join(frames)
+
+
+def maketraffic(mod, mavversion: float, count: int) -> bytes:
+    """Make a stream of typical telemetry from a vehicle"""
+    mav = mod.MAVLink(None, srcSystem=1, srcComponent=1)
+    msgs = [mod.MAVLink_heartbeat_message(2, 3, 81, 0, 4, 3),
+            mod.MAVLink_sys_status_message(1, 1, 1, 500, 12000, 100, 50, 0, 0, 0, 0, 0, 0),
+            mod.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0.01, 0.02, 0.03),
+            mod.MAVLink_global_position_int_message(1000, -353621474, 1491651746, 584000, 10000, 10, 20, 30, 9000),
+            mod.MAVLink_vfr_hud_message(12.0, 12.5, 90, 50, 10.0, 0.5),
+            mod.MAVLink_gps_raw_int_message(1000, 3, -353621474, 1491651746, 584000, 100, 200, 1200, 9000, 10),
+            mod.MAVLink_param_value_message(b'SYSID_THISMAV', 1.0, 9, 500, 1),
+            mod.MAVLink_statustext_message(6, b'PreArm: Compass not calibrated')]
+    buf = bytearray()
+    random.seed(0)
+    for n in range(count):
+        buf += random.choice(msgs).pack(mav, force_mavlink1=(mavversion == 1.0))
+        mav.seq = (mav.seq + 1) % 256
+    return bytes(buf)
+
+
+def runparser(parser: str, data: bytes, dialect: str, mavversion: float, chunksize: int,
+              lazydecode: bool = False):
+    """Run data through a parser in chunks. Returns the
+    decoded messages and time taken"""
+    msgs = []
+    link = MAVConnection(dialect, mavversion, "bench:" + parser, 255, 0,
+                         lambda msg, name: msgs.append(msg), parser=parser)
+    link.lazydecode = lazydecode
+    chunks = [data[i:i + chunksize] for i in range(0, len(data), chunksize)]
+    start = time.perf_counter()
+    for chunk in chunks:
+        link.processPackets(chunk)
+    return (link.parser, msgs, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PaGS MAVLink parser backends")
+    parser.add_argument("--tlog", default=None, help="Recorded telemetry log to use")
+    parser.add_argument("--mav", default=2, type=int, help="Mavlink Version (1 or 2)")
+    parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
+    parser.add_argument("--count", default=20000, type=int, help="Number of generated messages")
+    parser.add_argument("--chunk", default=512, type=int, help="Bytes per data_received() call")
+    args = parser.parse_args()
+
+    mavversion = float(args.mav)
+    mod = getpymavlinkpackage(args.dialect, mavversion)
+    if args.tlog:
+        data = loadtlog(args.tlog, mod)
+    else:
+        data = maketraffic(mod, mavversion, args.count)
+
+    reference = None
+    print("{0:<10}{1:<10}{2:>12}{3:>14}  {4}".format("parser", "used", "messages", "msgs/sec", "correct"))
+    # the scanner parser is also run with lazy decoding, where no fields are read
+    for name, lazydecode in [(p, False) for p in PARSERS] + [('scanner', True)]:
+        used, msgs, duration = runparser(name, data, args.dialect, mavversion, args.chunk, lazydecode)
+        if lazydecode:
+            name = 'lazy'
+        msgs = [m for m in msgs if m.get_type() != 'BAD_DATA']
+        if reference is None:
+            reference = msgs
+        correct = (len(msgs) == len(reference) and
+                   all(a.get_msgbuf() == b.get_msgbuf() for a, b in zip(msgs, reference)))
+        print("{0:<10}{1:<10}{2:>12}{3:>14.0f}  {4}".format(name, used, len(msgs), len(msgs) / duration, correct))
+
+
+if __name__ == '__main__':
+    main()
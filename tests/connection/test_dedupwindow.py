@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+'''DedupWindow tests
+
+Duplicate keys are detected and counted per link
+The link each key was added from is kept
+Old keys are evicted when the window is full
+Repeated packets with a different seq are not duplicates
+
+'''
+
+import unittest
+
+from PaGS.connection.dedupwindow import DedupWindow
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+class DedupWindowTest(unittest.TestCase):
+
+    """
+    Class to test DedupWindow
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.mod = getpymavlinkpackage('ardupilotmega', 2.0)
+        self.mav = self.mod.MAVLink(
+            self, srcSystem=4, srcComponent=0, use_native=False)
+
+    def test_duplicates(self):
+        """Test duplicates are detected and counted per link"""
+        window = DedupWindow(4)
+
+        assert not window.check((1, 0, 5, 1234), 'linkA')
+        assert window.check((1, 0, 5, 1234), 'linkB')
+        assert window.check((1, 0, 5, 1234), 'linkB')
+        assert not window.check((1, 0, 6, 1234), 'linkA')
+
+        assert window.dropped == {'linkB': 2}
+
+    def test_arrival(self):
+        """Test the arrival time of the first copy is kept"""
+        window = DedupWindow(4)
+
+        assert not window.check((1, 0, 5, 1234), 'linkA', now=10)
+        assert window.check((1, 0, 5, 1234), 'linkB', now=10.3)
+        assert window.arrival((1, 0, 5, 1234)) == 10
+        assert window.arrival((1, 0, 6, 1234)) is None
+
+    def test_eviction(self):
+        """Test the oldest keys are evicted"""
+        window = DedupWindow(4)
+
+        for seq in range(6):
+            assert not window.check((1, 0, seq, 0), 'linkA')
+
+        assert len(window.keys) == 4
+        assert not window.seen((1, 0, 0, 0))
+        assert not window.seen((1, 0, 1, 0))
+        assert window.seen((1, 0, 5, 0))
+        assert not window.check((1, 0, 0, 0), 'linkA')
+
+    def test_repeatedpackets(self):
+        """Test identical packets with different seq are not dropped"""
+        window = DedupWindow()
+
+        pkt = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, 2)
+        pkt.pack(self.mav)
+        keyA = DedupWindow.packetKey(pkt)
+        self.mav.seq += 1
+        pkt.pack(self.mav)
+        keyB = DedupWindow.packetKey(pkt)
+
+        assert not window.check(keyA, 'linkA')
+        assert not window.check(keyB, 'linkA')
+        assert window.check(keyB, 'linkB')
+
+
+if __name__ == '__main__':
+    unittest.main()
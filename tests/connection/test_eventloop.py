@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''Event loop selection tests
+
+asyncio is always available
+Unavailable loops fall back to asyncio
+The private reader functions are mapped to the public ones
+
+'''
+
+import asyncio
+import unittest
+
+from PaGS.connection.eventloop import loopAvailable, newEventLoop, addPrivateReaders
+
+from fakeloop import FakeLoop
+
+
+class EventLoopTest(unittest.TestCase):
+
+    """
+    Class to test event loop selection
+    """
+
+    def setUp(self):
+        """newEventLoop() sets the current loop, so keep the old one"""
+        self.oldloop = asyncio.get_event_loop()
+
+    def tearDown(self):
+        """Put back the current loop, so later tests don't get a
+        closed loop"""
+        asyncio.set_event_loop(self.oldloop)
+
+    def test_asyncio(self):
+        """Test the asyncio loop is created and set"""
+        assert loopAvailable('asyncio')
+        loop = newEventLoop('asyncio')
+        assert asyncio.get_event_loop() is loop
+        assert loop.run_until_complete(asyncio.sleep(0, result=1)) == 1
+        loop.close()
+
+    def test_fallback(self):
+        """Test a usable loop is returned, even if uvloop is not installed"""
+        loop = newEventLoop('uvloop')
+        assert loop.run_until_complete(asyncio.sleep(0, result=1)) == 1
+        loop.close()
+
+        assert not loopAvailable('trio')
+        with self.assertRaises(ValueError):
+            newEventLoop('trio')
+
+    def test_privateReaders(self):
+        """Test the private reader functions are added"""
+        loop = FakeLoop()
+        addPrivateReaders(loop)
+        assert loop._add_reader(3, None) == ('add_reader', 3)
+        assert loop._remove_writer(4) == ('remove_writer', 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
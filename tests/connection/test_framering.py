@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''FrameRing tests
+
+Frames are passed between two attached rings in order
+Frames wrap around the end of the ring
+Frames are dropped when the ring is full
+
+'''
+
+import sys
+import unittest
+
+# shared memory needs Python 3.8
+if sys.version_info >= (3, 8):
+    from PaGS.connection.framering import FrameRing
+
+
+@unittest.skipIf(sys.version_info < (3, 8), "Shared memory needs Python 3.8")
+class FrameRingTest(unittest.TestCase):
+
+    """
+    Class to test FrameRing
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.consumer = FrameRing(100)
+        self.producer = FrameRing(100, self.consumer.name)
+
+    def tearDown(self):
+        """Called at the end of each test"""
+        self.producer.close()
+        self.consumer.close(unlink=True)
+
+    def test_frames(self):
+        """Test frames are passed in order"""
+        assert self.consumer.get() == []
+
+        assert self.producer.put(b'\xfd\x01\x02')
+        assert self.producer.put(b'\xfe' * 20)
+        assert self.consumer.get() == [bytearray(b'\xfd\x01\x02'), bytearray(b'\xfe' * 20)]
+        assert self.consumer.get() == []
+
+    def test_wrap(self):
+        """Test frames wrap around the end of the ring"""
+        for n in range(50):
+            frame = bytes([n]) * (n % 30 + 1)
+            assert self.producer.put(frame)
+            assert self.consumer.get() == [bytearray(frame)]
+
+    def test_full(self):
+        """Test frames are dropped when the ring is full"""
+        for n in range(4):
+            assert self.producer.put(bytes([n]) * 23)
+        assert not self.producer.put(b'\x01')
+        assert self.consumer.getDropped() == 1
+
+        assert len(self.consumer.get()) == 4
+        assert self.producer.put(b'\x01')
+
+
+if __name__ == '__main__':
+    unittest.main()
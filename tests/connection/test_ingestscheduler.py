@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''IngestScheduler tests
+
+Packets are passed on in slices from each link in turn
+A run stops when the time budget is used, and continues later
+Full queues drop their oldest packets
+Flushing passes on all packets, and removed links are dropped
+An exception in the handler only loses that packet
+
+'''
+
+import unittest
+
+from PaGS.connection.ingestscheduler import IngestScheduler
+
+from fakeloop import FakeLoop
+
+
+class IngestSchedulerTest(unittest.TestCase):
+
+    """
+    Class to test IngestScheduler
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.loop = FakeLoop()
+        self.handled = []
+
+    def handler(self, pkt, linkname):
+        """Record the packets passed on"""
+        self.handled.append((linkname, pkt))
+
+    def test_roundrobin(self):
+        """Test each link gets a slice in turn"""
+        scheduler = IngestScheduler(self.loop, self.handler, budget=10, slicesize=16)
+        for i in range(40):
+            scheduler.put(i, 'linkA')
+        scheduler.put(0, 'linkB')
+        scheduler.put(1, 'linkB')
+
+        # only a single run is scheduled
+        assert len(self.loop.scheduled) == 1
+        assert scheduler.get('linkA') == {'rxqueue': 40, 'rxdropped': 0}
+
+        self.loop.runOnce()
+        links = [linkname for linkname, pkt in self.handled]
+        assert links == ['linkA'] * 16 + ['linkB'] * 2 + ['linkA'] * 24
+        assert [pkt for linkname, pkt in self.handled if linkname == 'linkA'] == list(range(40))
+        assert self.loop.scheduled == []
+
+    def test_budget(self):
+        """Test a run yields to the loop when the budget is used"""
+        scheduler = IngestScheduler(self.loop, self.handler, budget=0, slicesize=10)
+        for i in range(25):
+            scheduler.put(i, 'linkA')
+        scheduler.put(0, 'linkB')
+
+        self.loop.runOnce()
+        assert len(self.handled) == 10
+        self.loop.runOnce()
+        assert self.handled[10] == ('linkB', 0)
+        assert len(self.handled) == 11
+        self.loop.runOnce()
+        self.loop.runOnce()
+        assert len(self.handled) == 26
+        assert self.loop.runOnce() == 0
+
+    def test_maxqueue(self):
+        """Test the oldest packets are dropped from a full queue"""
+        scheduler = IngestScheduler(self.loop, self.handler, maxqueue=5)
+        for i in range(8):
+            scheduler.put(i, 'linkA')
+
+        assert scheduler.get('linkA') == {'rxqueue': 5, 'rxdropped': 3}
+        self.loop.runOnce()
+        assert [pkt for linkname, pkt in self.handled] == [3, 4, 5, 6, 7]
+
+    def test_handlerError(self):
+        """Test an exception in the handler doesn't stop the link's
+        queue being passed on"""
+        def handler(pkt, linkname):
+            if pkt == 1:
+                raise ValueError("bad packet")
+            self.handled.append((linkname, pkt))
+
+        # a budget long enough for the logged traceback, so it's one run
+        scheduler = IngestScheduler(self.loop, handler, budget=10, slicesize=2)
+        for i in range(5):
+            scheduler.put(i, 'linkA')
+
+        with self.assertLogs(level='ERROR'):
+            self.loop.runOnce()
+        assert self.handled == [('linkA', i) for i in (0, 2, 3, 4)]
+        assert scheduler.get('linkA')['rxqueue'] == 0
+
+        # and the link is still scheduled for new packets
+        scheduler.put(5, 'linkA')
+        self.loop.runOnce()
+        assert self.handled[-1] == ('linkA', 5)
+
+    def test_flush(self):
+        """Test flushing and removing links"""
+        scheduler = IngestScheduler(self.loop, self.handler)
+        for i in range(5):
+            scheduler.put(i, 'linkA')
+            scheduler.put(i, 'linkB')
+        scheduler.removeLink('linkB')
+        scheduler.flush()
+
+        assert self.handled == [('linkA', i) for i in range(5)]
+        assert scheduler.get('linkB') == {'rxqueue': 0, 'rxdropped': 0}
+        # the scheduled run was cancelled
+        assert self.loop.runOnce() == 1
+        assert len(self.handled) == 5
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''LinkBackoff tests
+
+The delay between attempts doubles on each failure, up to the max
+The delay is shortened by the jitter
+A lost link is reconnected straight away
+
+'''
+
+import unittest
+
+from PaGS.connection.linkbackoff import LinkBackoff
+
+
+class LinkBackoffTest(unittest.TestCase):
+
+    """
+    Class to test LinkBackoff
+    """
+
+    def test_backoff(self):
+        """Test the delay doubles on each failure, up to the max"""
+        backoff = LinkBackoff("test", mindelay=1, maxdelay=8, jitter=0)
+
+        assert backoff.isReady(now=0)
+
+        delays = []
+        for i in range(6):
+            backoff.failure("Timeout", now=100)
+            delays.append(backoff.remaining(now=100))
+        assert delays == [1, 2, 4, 8, 8, 8]
+        assert not backoff.isReady(now=107)
+        assert backoff.isReady(now=108)
+        assert backoff.get(now=104) == {'connected': False, 'failures': 6,
+                                        'retryin': 4, 'lasterror': 'Timeout'}
+
+        # and reset when connected
+        backoff.success()
+        assert not backoff.isReady(now=200)
+        assert backoff.remaining(now=0) == 0
+        backoff.failure("Connection refused", now=200)
+        assert backoff.remaining(now=200) == 1
+        assert backoff.get(now=200)['lasterror'] == "Connection refused"
+
+    def test_jitter(self):
+        """Test the delay is shortened by up to the jitter"""
+        backoff = LinkBackoff("test", mindelay=10, maxdelay=10, jitter=0.5)
+
+        delays = set()
+        for i in range(50):
+            backoff.failure("Timeout", now=0)
+            assert 5 <= backoff.remaining(now=0) <= 10
+            delays.add(backoff.remaining(now=0))
+        assert len(delays) > 1
+
+    def test_disconnected(self):
+        """Test a lost link is reconnected straight away"""
+        backoff = LinkBackoff("test", mindelay=1, maxdelay=8, jitter=0)
+
+        backoff.success()
+        backoff.disconnected("Link closed", now=50)
+        assert backoff.isReady(now=50)
+        assert backoff.get(now=50) == {'connected': False, 'failures': 0,
+                                       'retryin': 0, 'lasterror': 'Link closed'}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''LinkSelector tests
+
+Broadcast sends on all links
+Best sends on the link with the lowest loss and lag, with hysteresis
+Failover sends on the first link that is receiving
+Quiet links are not used, unless all links are quiet
+Bulk packets are striped across the receiving links, evenly or weighted
+
+'''
+
+import unittest
+
+from PaGS.connection.linkstats import LinkStats
+from PaGS.connection.linkselect import LinkSelector
+
+
+class FakeLink():
+    """A link with statistics only"""
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = LinkStats()
+
+    def getSysidStats(self, sysid):
+        return self.stats.sysids.get(sysid)
+
+
+class LinkSelectorTest(unittest.TestCase):
+
+    """
+    Class to test LinkSelector
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.linkA = FakeLink('linkA')
+        self.linkB = FakeLink('linkB')
+        self.links = [(self.linkA, 1), (self.linkB, 1)]
+
+    def test_badpolicy(self):
+        """Test an unknown policy is rejected"""
+        with self.assertRaises(ValueError):
+            LinkSelector('cheapest')
+        with self.assertRaises(ValueError):
+            LinkSelector('best', bulkmode='fastest')
+
+    def test_broadcast(self):
+        """Test all links are used"""
+        selector = LinkSelector('broadcast')
+
+        self.linkA.stats.rxPacket(1, 0, 0, 20, now=0)
+        assert selector.select(self.links, now=0) == self.links
+
+    def test_best(self):
+        """Test the link with the lowest score is used"""
+        selector = LinkSelector('best', quiet=2, hysteresis=0.05)
+
+        # nothing received yet, so send on all
+        assert selector.select(self.links, now=0) == self.links
+
+        # only linkB has lag
+        for n in range(10):
+            self.linkA.stats.rxPacket(1, 0, n, 20, now=n * 0.1)
+            self.linkB.stats.rxPacket(1, 0, n, 20, now=n * 0.1)
+            self.linkB.stats.duplicate(1, 0.5, now=n * 0.1)
+        assert selector.select(self.links, now=1) == [(self.linkA, 1)]
+        assert selector.selected is self.linkA
+
+        # a little loss on linkA isn't enough to switch
+        self.linkA.stats.rxPacket(1, 0, 11, 20, now=1)
+        assert self.linkA.stats.sysids[1].loss < 0.05 + self.linkB.stats.sysids[1].getLag(1)
+        assert selector.select(self.links, now=1) == [(self.linkA, 1)]
+
+    def test_quiet(self):
+        """Test quiet links are not used"""
+        selector = LinkSelector('best', quiet=2)
+
+        self.linkA.stats.rxPacket(1, 0, 0, 20, now=0)
+        self.linkB.stats.rxPacket(1, 0, 0, 20, now=0)
+        self.linkB.stats.duplicate(1, 0.5, now=0)
+        assert selector.select(self.links, now=1) == [(self.linkA, 1)]
+
+        # linkA goes quiet
+        self.linkB.stats.rxPacket(1, 0, 1, 20, now=2)
+        assert selector.select(self.links, now=2.5) == [(self.linkB, 1)]
+
+        # both quiet, so use the last link received on
+        assert selector.select(self.links, now=10) == [(self.linkB, 1)]
+
+    def test_failover(self):
+        """Test the first receiving link is used"""
+        selector = LinkSelector('failover', quiet=2)
+
+        self.linkA.stats.rxPacket(1, 0, 0, 20, now=0)
+        self.linkB.stats.rxPacket(1, 0, 0, 20, now=0)
+        self.linkA.stats.duplicate(1, 0.5, now=0)
+        assert selector.select(self.links, now=1) == [(self.linkA, 1)]
+
+        # primary goes quiet, then comes back
+        self.linkB.stats.rxPacket(1, 0, 1, 20, now=3)
+        assert selector.select(self.links, now=3) == [(self.linkB, 1)]
+        self.linkA.stats.rxPacket(1, 0, 2, 20, now=4)
+        assert selector.select(self.links, now=4) == [(self.linkA, 1)]
+
+    def test_bulkstripe(self):
+        """Test bulk packets are sent round-robin on the receiving links"""
+        selector = LinkSelector('failover', quiet=2, bulkmode='stripe')
+        linkC = FakeLink('linkC')
+        links = self.links + [(linkC, 1)]
+
+        # nothing received, so the tx policy is used
+        assert selector.selectBulk(links, now=0) == links
+
+        for link, sysid in links:
+            link.stats.rxPacket(1, 0, 0, 20, now=0)
+        sent = [selector.selectBulk(links, now=1)[0][0].name for i in range(6)]
+        assert sent == ['linkA', 'linkB', 'linkC', 'linkA', 'linkB', 'linkC']
+
+        # linkB goes quiet
+        self.linkA.stats.rxPacket(1, 0, 1, 20, now=2)
+        linkC.stats.rxPacket(1, 0, 1, 20, now=2)
+        sent = [selector.selectBulk(links, now=3)[0][0].name for i in range(4)]
+        assert sorted(sent) == ['linkA', 'linkA', 'linkC', 'linkC']
+
+    def test_bulkweighted(self):
+        """Test bulk packets are sent in proportion to the rx rates"""
+        selector = LinkSelector('best', quiet=2, bulkmode='weighted')
+
+        # linkA is receiving 3 times the rate of linkB
+        for n in range(100):
+            self.linkA.stats.rxPacket(1, 0, n % 256, 60, now=n * 0.05)
+            self.linkB.stats.rxPacket(1, 0, n % 256, 20, now=n * 0.05)
+
+        sent = [selector.selectBulk(self.links, now=5)[0][0].name for i in range(40)]
+        assert sent.count('linkA') == 30
+        assert sent.count('linkB') == 10
+        # and spread out, not in a block
+        assert 'linkB' in sent[:4]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+'''LinkStats tests
+
+Rx and tx rates are tracked per sysid
+Packet loss is found from gaps in the seq numbers
+Duplicates are counted
+The lag behind other links is averaged from duplicates, and decays without them
+
+'''
+
+import unittest
+
+from PaGS.connection.linkstats import LinkStats
+
+
+class LinkStatsTest(unittest.TestCase):
+
+    """
+    Class to test LinkStats
+    """
+
+    def test_rates(self):
+        """Test the rx and tx rates settle to the actual rates"""
+        stats = LinkStats(tau=1)
+
+        # 10 packets/sec of 20 bytes for sysid 1, 5 seconds
+        for n in range(50):
+            stats.rxPacket(1, 0, n, 20, now=n * 0.1)
+            stats.txPacket(1, 10, now=n * 0.1)
+
+        result = stats.get(now=4.9)
+        assert abs(result[1]['rxpktspersec'] - 10) < 1
+        assert abs(result[1]['rxbytespersec'] - 200) < 20
+        assert abs(result[1]['txbytespersec'] - 100) < 10
+        assert result[1]['received'] == 50
+        assert result[1]['sent'] == 50
+        assert result[1]['lost'] == 0
+        assert result[1]['lastrx'] == 4.9
+
+        # and decays when nothing is received
+        result = stats.get(now=20)
+        assert result[1]['rxpktspersec'] < 0.1
+
+    def test_loss(self):
+        """Test loss is found from seq gaps, per component"""
+        stats = LinkStats()
+
+        # every second packet lost on comp 1, none on comp 2, so
+        # 1 in 3 packets are lost overall.
+        # seq wraps around at 255
+        for n in range(0, 400, 2):
+            stats.rxPacket(1, 1, n % 256, 20, now=n)
+            stats.rxPacket(1, 2, (n // 2) % 256, 20, now=n)
+
+        result = stats.get(now=400)
+        assert result[1]['received'] == 400
+        assert result[1]['lost'] == 199
+        assert 0.25 < result[1]['loss'] < 0.4
+
+    def test_duplicates(self):
+        """Test duplicates are counted, and a repeated seq is not loss"""
+        stats = LinkStats()
+
+        stats.rxPacket(2, 0, 5, 20)
+        stats.rxPacket(2, 0, 5, 20)
+        stats.duplicate(2)
+
+        result = stats.get()
+        assert result[2]['duplicates'] == 1
+        assert result[2]['lost'] == 0
+        assert result[2]['loss'] == 0
+
+    def test_lag(self):
+        """Test the lag is averaged from duplicates, and decays to 0"""
+        stats = LinkStats(tau=1, lossalpha=0.1)
+
+        assert stats.get(now=0) == {}
+        for n in range(100):
+            stats.duplicate(3, 0.2, now=n * 0.1)
+
+        result = stats.get(now=9.9)
+        assert result[3]['duplicates'] == 100
+        assert abs(result[3]['lag'] - 0.2) < 0.02
+
+        # no duplicates, so it's now the fastest link
+        result = stats.get(now=20)
+        assert result[3]['lag'] < 0.001
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+'''MAVConnection tests
+
+Each parser backend decodes the same packets
+Unavailable parser backends fall back to python
+Packets are lazily decoded if required
+Packet capture is off by default and bounded by count or bytes
+Queued packets are sent highest priority first, and not while paused
+Bulk packets are rate limited by the local radio's RADIO_STATUS
+
+'''
+
+import asyncio
+import unittest
+
+from PaGS.connection.mavconnection import MAVConnection, PARSERS, PRIORITY_BULK
+from PaGS.mavlink.lazymessage import LazyMessage
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+class MAVConnectionTest(unittest.TestCase):
+
+    """
+    Class to test MAVConnection
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.dialect = 'ardupilotmega'
+        self.version = 2.0
+        self.mod = getpymavlinkpackage(self.dialect, self.version)
+        self.mav = self.mod.MAVLink(
+            self, srcSystem=4, srcComponent=0, use_native=False)
+        self.rxpkts = []
+        # the tx queues are flushed in this loop, not the current one
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        """Close the loop, and any flushes still waiting in it"""
+        self.loop.close()
+
+    def newpacketcallback(self, pkt, strconnection):
+        """Callback when a link has a new packet"""
+        if pkt.get_type() != 'BAD_DATA':
+            self.rxpkts.append(pkt)
+
+    def test_parsers(self):
+        """Test each parser backend decodes the same packets"""
+        pkt = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, 2)
+        pktbytes = pkt.pack(self.mav, force_mavlink1=False)
+        pktparam = self.mod.MAVLink_param_value_message(b'SYSID_THISMAV', 1.0, 9, 500, 1)
+        pktbytesparam = pktparam.pack(self.mav, force_mavlink1=False)
+
+        for parser in PARSERS:
+            self.rxpkts = []
+            link = MAVConnection(self.dialect, self.version, "test", 0, 0,
+                                 self.newpacketcallback, parser=parser)
+            data = b'q837ot4c' + pktbytes + pktbytesparam + pktbytes
+            link.processPackets(data[:20])
+            link.processPackets(data[20:])
+
+            assert len(self.rxpkts) == 3
+            assert self.rxpkts[0].get_msgbuf() == pktbytes
+            assert self.rxpkts[1].param_id == 'SYSID_THISMAV'
+            assert self.rxpkts[2].get_msgbuf() == pktbytes
+
+    def test_parserfallback(self):
+        """Test the native parser falls back to python when not available,
+        and bad parsers are rejected"""
+        # mavnative does not support MAVLink2
+        link = MAVConnection(self.dialect, 2.0, "test", 0, 0,
+                             self.newpacketcallback, parser='native')
+        assert link.parser == 'python'
+        assert link.mav.native is None
+
+        with self.assertRaises(ValueError):
+            MAVConnection(self.dialect, 2.0, "test", 0, 0,
+                          self.newpacketcallback, parser='bad')
+
+    def test_lazydecode(self):
+        """Test the scanner parser can lazily decode packets"""
+        pkt = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, 2)
+        pktbytes = pkt.pack(self.mav, force_mavlink1=False)
+        corruptbytes = bytearray(pktbytes)
+        corruptbytes[-1] ^= 0xFF
+
+        link = MAVConnection(self.dialect, self.version, "test", 0, 0,
+                             self.newpacketcallback, parser='scanner')
+        link.lazydecode = True
+        link.processPackets(bytes(corruptbytes) + pktbytes)
+
+        # the corrupt packet is not passed on
+        assert len(self.rxpkts) == 1
+        assert isinstance(self.rxpkts[0], LazyMessage)
+        assert not self.rxpkts[0].isDecoded
+        assert self.rxpkts[0].type == 5
+        assert self.rxpkts[0].isDecoded
+
+    def test_capture(self):
+        """Test the packet capture is bounded and can be drained"""
+        pkt = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, 2)
+        pktbytes = pkt.pack(self.mav, force_mavlink1=False)
+
+        link = MAVConnection(self.dialect, self.version, "test", 0, 0,
+                             self.newpacketcallback, parser='scanner')
+
+        # off by default
+        link.processPackets(pktbytes)
+        assert link.capture is None
+        assert link.snapshotCapture() == []
+
+        # bounded by number of packets
+        link.setCapture(maxpackets=3)
+        for i in range(5):
+            link.processPackets(pktbytes)
+        link.recordTx(b'1234')
+        entries = link.snapshotCapture()
+        assert len(entries) == 3
+        assert [e[1] for e in entries] == ['rx', 'rx', 'tx']
+        assert entries[0][2].get_type() == 'HEARTBEAT'
+        assert entries[2][2] == b'1234'
+        assert link.capture.dropped == 3
+
+        # stored as raw bytes, decoded on snapshot
+        assert link.capture.packets[0][2] == bytes(pktbytes)
+        assert link.capture.bytes == len(pktbytes) * 2 + 4
+        link.capture.add('rx', b'\xfd\x00')
+        assert link.snapshotCapture()[-1][2] == b'\xfd\x00'
+
+        # draining empties the capture
+        assert len(link.drainCapture()) == 3
+        assert link.snapshotCapture() == []
+
+        # bounded by bytes
+        link.setCapture(maxbytes=len(pktbytes) * 2)
+        for i in range(5):
+            link.processPackets(pktbytes)
+        assert len(link.snapshotCapture()) == 2
+        assert link.capture.bytes == len(pktbytes) * 2
+
+        # and disabled again
+        link.setCapture()
+        assert link.capture is None
+
+    def test_txqueue(self):
+        """Test the tx queues are sent highest priority first,
+        and are held while writing is paused"""
+        self.txbatches = []
+        link = MAVConnection(self.dialect, self.version, "test", 255, 0, None)
+        link.loop = self.loop
+        link.writeData = lambda queue: self.txbatches.append(queue) or True
+        link.txbatchsize = 100
+
+        hbbytes = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, 2).pack(self.mav)
+        parambytes = self.mod.MAVLink_param_request_list_message(1, 1).pack(self.mav)
+        cmdbytes = self.mod.MAVLink_command_long_message(1, 1, 400, 0, 1, 0, 0, 0, 0, 0, 0).pack(self.mav)
+
+        # bulk and command packets wait behind a pause
+        link.pause_writing()
+        for i in range(5):
+            link.send_data(parambytes, 1)
+        link.send_data(cmdbytes, 1)
+        link.send_data(hbbytes, 1)
+        link.send_data(b'1234', 1, PRIORITY_BULK)
+        link.flushTx()
+        assert self.txbatches == []
+        assert link.getTxQueue() == {'control': 1, 'command': 1, 'bulk': 6, 'bytes': 5 * len(parambytes) +
+                                     len(cmdbytes) + len(hbbytes) + 4, 'transport': 0, 'paused': True,
+                                     'pauses': 1, 'txbuf': None, 'bulkrate': None}
+
+        # then go out highest priority first, in batches
+        link.resume_writing()
+        sent = [data for batch in self.txbatches for data, sysid in batch]
+        assert sent == [hbbytes, cmdbytes] + [parambytes] * 5 + [b'1234']
+        assert len(self.txbatches) > 1
+        assert link.getTxQueue()['bytes'] == 0
+
+    def test_radioflow(self):
+        """Test bulk packets are held back by the radio rate limit,
+        but control and command packets are not"""
+        self.txbatches = []
+        link = MAVConnection(self.dialect, self.version, "test", 255, 0, None, parser='scanner')
+        link.loop = self.loop
+        link.writeData = lambda queue: self.txbatches.append(queue) or True
+
+        # radio buffer is filling
+        mavradio = self.mod.MAVLink(self, srcSystem=51, srcComponent=68, use_native=False)
+        radiobytes = self.mod.MAVLink_radio_status_message(200, 180, 30, 50, 40, 0, 0).pack(mavradio)
+        link.processPackets(radiobytes)
+        assert link.getTxQueue()['txbuf'] == 30
+        assert link.getTxQueue()['bulkrate'] < 2000
+
+        # a RADIO_STATUS from a vehicle is ignored
+        link.processPackets(self.mod.MAVLink_radio_status_message(200, 180, 5, 50, 40, 0, 0).pack(self.mav))
+        assert link.getTxQueue()['txbuf'] == 30
+
+        parambytes = self.mod.MAVLink_param_request_list_message(1, 1).pack(self.mav)
+        cmdbytes = self.mod.MAVLink_command_long_message(1, 1, 400, 0, 1, 0, 0, 0, 0, 0, 0).pack(self.mav)
+        for i in range(100):
+            link.send_data(parambytes, 1)
+        link.send_data(cmdbytes, 1)
+        link.flushTx()
+
+        sent = [data for batch in self.txbatches for data, sysid in batch]
+        assert sent[0] == cmdbytes
+        assert 0 < sent.count(parambytes) < 100
+        assert link.txflushdelayed
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+'''RadioFlowControl tests
+
+No rate limit until a RADIO_STATUS is received, or after they time out
+The rate backs off as the radio's tx buffer fills, and recovers as it empties
+Bytes are sent at the rate limit
+
+'''
+
+import unittest
+
+from PaGS.connection.radioflow import RadioFlowControl
+
+
+class RadioFlowControlTest(unittest.TestCase):
+
+    """
+    Class to test RadioFlowControl
+    """
+
+    def test_inactive(self):
+        """Test there is no limit without RADIO_STATUS"""
+        flow = RadioFlowControl("test", timeout=5)
+
+        assert flow.getRate(now=0) is None
+        for i in range(100):
+            assert flow.take(1000, now=0)
+        assert flow.delay(1000, now=0) == 0
+
+        # and after they time out
+        flow.radioStatus(100, now=0)
+        assert flow.getRate(now=1) is not None
+        assert flow.getRate(now=6) is None
+        assert flow.take(100000, now=6)
+
+    def test_adapt(self):
+        """Test the rate follows the radio's tx buffer"""
+        flow = RadioFlowControl("test", startrate=2000, minrate=100, maxrate=3000)
+
+        # buffer filling - back off
+        flow.radioStatus(40, now=0)
+        assert flow.getRate(now=0) == 1800
+        flow.radioStatus(10, now=1)
+        assert flow.getRate(now=1) == 900
+        for i in range(10):
+            flow.radioStatus(10, now=2 + i)
+        assert flow.getRate(now=11) == 100
+
+        # steady in the middle
+        flow.radioStatus(60, now=12)
+        assert flow.getRate(now=12) == 100
+
+        # buffer empty - recover up to the max
+        flow.radioStatus(95, now=13)
+        assert flow.getRate(now=13) == 300
+        for i in range(20):
+            flow.radioStatus(95, now=14 + i)
+        assert flow.getRate(now=33) == 3000
+
+    def test_tokenbucket(self):
+        """Test bytes are sent at the rate limit"""
+        flow = RadioFlowControl("test", startrate=1000, burst=500)
+        flow.radioStatus(60, now=0)
+
+        # burst, then limited
+        assert flow.take(500, now=0)
+        assert not flow.take(100, now=0)
+        assert flow.delay(100, now=0) == 0.1
+        assert flow.take(100, now=0.1)
+
+        # 4 seconds of 100 byte packets
+        sent = 0
+        for i in range(4000):
+            if flow.take(100, now=0.1 + i * 0.001):
+                sent += 100
+        assert 3800 <= sent <= 4100
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,19 +24,25 @@ Can send and recieve data (client/server)
 
 If a link fails (disconnected) the link should not crash.
 
+A server with many clients parses each client separately and
+sends to the client of each sysid
+
+The buffered (scanner parser) links receive straight into the scanner
+
 '''
 
 import asyncio
 import asynctest
 import platform
 import sys
+import unittest
 
 # Python 3.8 defaults to Proactor for asyncio, which doesn't work for PaGS
 # So we force to Selector instead.
 if platform.system() == 'Windows' and sys.version_info >= (3, 8):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from PaGS.connection.tcplink import TCPConnection
+from PaGS.connection.tcplink import TCPConnection, BufferedTCPConnection, TCPServerConnection, bufferedAvailable
 from PaGS.mavlink.pymavutil import getpymavlinkpackage
 
 
@@ -98,6 +104,40 @@ class TCPLinkTest(asynctest.TestCase):
         assert self.cnum == 1
         assert self.snum == 1
 
+    @unittest.skipIf(not bufferedAvailable(), "Buffered protocols not available")
+    async def test_link_tcp_buffered(self):
+        """Test passing data between two buffered tcplink connections"""
+        client = BufferedTCPConnection(rxcallback=self.newpacketcallback,
+                                       dialect=self.dialect, mavversion=self.version,
+                                       srcsystem=0, srccomp=0, server=False, name=self.cname,
+                                       parser='scanner')
+
+        server = BufferedTCPConnection(rxcallback=self.newpacketcallback,
+                                       dialect=self.dialect, mavversion=self.version,
+                                       srcsystem=0, srccomp=0, server=True, name=self.sname,
+                                       parser='scanner')
+
+        await self.loop.create_server(lambda: server, self.ip, self.port)
+        await self.loop.create_connection(lambda: client, self.ip, self.port)
+
+        # send a few mavlink packets each way:
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        for i in range(3):
+            client.send_data(pkt.pack(self.mav, force_mavlink1=False))
+            server.send_data(pkt.pack(self.mav, force_mavlink1=False))
+
+        # wait for 0.10 sec
+        await asyncio.sleep(0.10)
+
+        client.close()
+        server.close()
+
+        # Assert the packets were sent, and nothing was left in the scanner
+        assert self.cnum == 3
+        assert self.snum == 3
+        assert client.scanner.start == client.scanner.end
+
     async def test_link_tcp_server(self):
         """Test passing data when there's only a server present"""
         server = TCPConnection(rxcallback=self.newpacketcallback,
@@ -182,6 +222,104 @@ class TCPLinkTest(asynctest.TestCase):
         assert self.cnum == 1
         assert self.snum == 1
 
+    async def test_link_coalesce(self):
+        """Test packets queued together are sent in one write"""
+        client = TCPConnection(rxcallback=self.newpacketcallback,
+                               dialect=self.dialect, mavversion=self.version,
+                               srcsystem=0, srccomp=0, server=False, name=self.cname)
+
+        server = TCPConnection(rxcallback=self.newpacketcallback,
+                               dialect=self.dialect, mavversion=self.version,
+                               srcsystem=0, srccomp=0, server=True, name=self.sname)
+
+        await self.loop.create_server(lambda: server, self.ip, self.port)
+        await self.loop.create_connection(lambda: client, self.ip, self.port)
+
+        # count the writes to the transport
+        writes = []
+        writefunc = client.transport.write
+
+        def countwrite(data):
+            writes.append(data)
+            writefunc(data)
+        client.transport.write = countwrite
+
+        # send 5 packets in the same event loop iteration
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        for i in range(5):
+            client.send_data(pkt.pack(self.mav, force_mavlink1=False), 5)
+
+        # wait for 0.10 sec
+        await asyncio.sleep(0.10)
+
+        client.close()
+        server.close()
+
+        # Assert all the packets were sent, in a single write
+        assert self.snum == 5
+        assert len(writes) == 1
+        assert client.stats.get()[5]['sent'] == 5
+
+    async def test_link_multiclient(self):
+        """Test a server has a parser per client, and sends to the
+        client of each sysid"""
+        server = TCPServerConnection(rxcallback=self.newpacketcallback,
+                                     dialect=self.dialect, mavversion=self.version,
+                                     srcsystem=0, srccomp=0, name=self.sname)
+        server.listener = await self.loop.create_server(server.newClient, self.ip, self.port)
+
+        # 3 clients, with sysids 1, 2 and 3
+        clientpkts = {1: [], 2: [], 3: []}
+        clients = {}
+        for sysid in clientpkts:
+            clients[sysid] = TCPConnection(rxcallback=lambda pkt, name, sysid=sysid: clientpkts[sysid].append(pkt),
+                                           dialect=self.dialect, mavversion=self.version,
+                                           srcsystem=sysid, srccomp=0, server=False, name=self.cname)
+            await self.loop.create_connection(lambda: clients[sysid], self.ip, self.port)
+
+        await asyncio.sleep(0.10)
+        assert len(server.clients) == 3
+
+        # send half a packet from each client, then the other halves,
+        # so the byte streams are interleaved at the server
+        packets = {}
+        for sysid in clients:
+            mav = self.mod.MAVLink(self, srcSystem=sysid, srcComponent=1, use_native=False)
+            pkt = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, int(self.version))
+            packets[sysid] = pkt.pack(mav, force_mavlink1=False)
+        for half in (slice(0, 6), slice(6, None)):
+            for sysid in clients:
+                clients[sysid].transport.write(packets[sysid][half])
+            await asyncio.sleep(0.05)
+
+        await asyncio.sleep(0.05)
+        assert self.snum == 3
+        assert sorted(server.sysidclients) == [1, 2, 3]
+        assert len(server.getStats()) == 3
+
+        # targeted and broadcast packets. The heartbeat is sent first, as
+        # it is a higher priority
+        pkt = self.mod.MAVLink_command_long_message(2, 1, 400, 0, 1, 0, 0, 0, 0, 0, 0)
+        server.send_data(pkt.pack(self.mav, force_mavlink1=False), 2)
+        pkt = self.mod.MAVLink_heartbeat_message(6, 8, 0, 0, 0, int(self.version))
+        server.send_data(pkt.pack(self.mav, force_mavlink1=False))
+
+        await asyncio.sleep(0.10)
+        assert [p.get_type() for p in clientpkts[1]] == ['HEARTBEAT']
+        assert [p.get_type() for p in clientpkts[2]] == ['HEARTBEAT', 'COMMAND_LONG']
+        assert [p.get_type() for p in clientpkts[3]] == ['HEARTBEAT']
+
+        # disconnecting a client removes it and it's sysids
+        clients[1].close()
+        await asyncio.sleep(0.10)
+        assert len(server.clients) == 2
+        assert sorted(server.sysidclients) == [2, 3]
+
+        for client in clients.values():
+            client.close()
+        server.close()
+
 
 if __name__ == '__main__':
     asynctest.main()
@@ -24,12 +24,17 @@ Can send and recieve data (client/server)
 
 If a link fails (disconnected) the link should not crash.
 
+A server with many peers sends to the peer of each sysid
+
+The batched (Linux) link reads many datagrams per wakeup
+
 '''
 
 import asyncio
 import asynctest
+import unittest
 
-from PaGS.connection.udplink import UDPConnection
+from PaGS.connection.udplink import UDPConnection, BatchUDPConnection, batchAvailable
 from PaGS.mavlink.pymavutil import getpymavlinkpackage
 
 
@@ -96,6 +101,44 @@ class UDPLinkTest(asynctest.TestCase):
         assert self.cnum == 1
         assert self.snum == 1
 
+    @unittest.skipIf(not batchAvailable(), "Batched UDP links not available")
+    async def test_link_udp_batch(self):
+        """Test passing bursts of data between two batched udp connections"""
+        client = BatchUDPConnection(rxcallback=self.newpacketcallback,
+                                    dialect=self.dialect, mavversion=self.version,
+                                    srcsystem=0, srccomp=0, server=False, name=self.cname, mtu=0)
+
+        server = BatchUDPConnection(rxcallback=self.newpacketcallback,
+                                    dialect=self.dialect, mavversion=self.version,
+                                    srcsystem=0, srccomp=0, server=True, name=self.sname,
+                                    maxbatch=4)
+
+        server.open(self.loop)
+        client.open(self.loop)
+        assert server.rcvbufsize > 0
+
+        # send a burst of mavlink packets, one per datagram
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        for i in range(10):
+            client.send_data(pkt.pack(self.mav, force_mavlink1=False))
+
+        # need to wait for server to get the packets and the peer
+        await asyncio.sleep(0.10)
+        server.send_data(pkt.pack(self.mav, force_mavlink1=False))
+
+        # wait for 0.10 sec
+        await asyncio.sleep(0.10)
+
+        assert server.getTxQueue()['rxdrops'] == 0
+
+        client.close()
+        server.close()
+
+        # Assert the packets were sent
+        assert self.cnum == 1
+        assert self.snum == 10
+
     async def test_link_udp_server(self):
         """Test passing data when there's only a server present"""
         server = UDPConnection(rxcallback=self.newpacketcallback,
@@ -180,6 +223,99 @@ class UDPLinkTest(asynctest.TestCase):
         assert self.cnum == 1
         assert self.snum == 1
 
+    async def test_link_coalesce(self):
+        """Test packets queued together are packed into datagrams
+        of up to the mtu"""
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        packeddata = pkt.pack(self.mav, force_mavlink1=False)
+
+        client = UDPConnection(rxcallback=self.newpacketcallback,
+                               dialect=self.dialect, mavversion=self.version,
+                               srcsystem=0, srccomp=0, server=False, name=self.cname,
+                               mtu=2 * len(packeddata))
+
+        server = UDPConnection(rxcallback=self.newpacketcallback,
+                               dialect=self.dialect, mavversion=self.version,
+                               srcsystem=0, srccomp=0, server=True, name=self.sname)
+
+        await self.loop.create_datagram_endpoint(lambda: server,
+                                                 local_addr=(self.ip, self.port))
+        await self.loop.create_datagram_endpoint(lambda: client,
+                                                 remote_addr=(self.ip, self.port))
+
+        # count the datagrams received by the server
+        datagrams = []
+        rxfunc = server.datagram_received
+
+        def countdatagram(data, addr):
+            datagrams.append(data)
+            rxfunc(data, addr)
+        server.datagram_received = countdatagram
+
+        # send 5 packets in the same event loop iteration
+        for i in range(5):
+            client.send_data(packeddata, 5)
+
+        # wait for 0.10 sec
+        await asyncio.sleep(0.10)
+
+        client.close()
+        server.close()
+
+        # Assert all the packets were sent, 2 per datagram
+        assert self.snum == 5
+        assert [len(d) for d in datagrams] == [2 * len(packeddata), 2 * len(packeddata), len(packeddata)]
+        assert client.stats.get()[5]['sent'] == 5
+
+    async def test_link_multipeer(self):
+        """Test a server sends to the peer of each sysid, and
+        peers expire"""
+        server = UDPConnection(rxcallback=self.newpacketcallback,
+                               dialect=self.dialect, mavversion=self.version,
+                               srcsystem=0, srccomp=0, server=True, name=self.sname)
+        await self.loop.create_datagram_endpoint(lambda: server,
+                                                 local_addr=(self.ip, self.port))
+
+        # 3 peers, with sysids 1, 2 and 3
+        peerpkts = {1: [], 2: [], 3: []}
+        clients = {}
+        for sysid in peerpkts:
+            clients[sysid] = UDPConnection(rxcallback=lambda pkt, name, sysid=sysid: peerpkts[sysid].append(pkt),
+                                           dialect=self.dialect, mavversion=self.version,
+                                           srcsystem=sysid, srccomp=0, server=False, name=self.cname)
+            await self.loop.create_datagram_endpoint(lambda: clients[sysid],
+                                                     remote_addr=(self.ip, self.port))
+            mav = self.mod.MAVLink(self, srcSystem=sysid, srcComponent=1, use_native=False)
+            pkt = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, int(self.version))
+            clients[sysid].send_data(pkt.pack(mav, force_mavlink1=False))
+
+        await asyncio.sleep(0.10)
+        assert len(server.getPeers()) == 3
+        assert sorted(sysids for lastrx, sysids in server.getPeers().values()) == [[1], [2], [3]]
+
+        # targeted and broadcast packets. The heartbeat is sent first, as
+        # it is a higher priority
+        pkt = self.mod.MAVLink_command_long_message(2, 1, 400, 0, 1, 0, 0, 0, 0, 0, 0)
+        server.send_data(pkt.pack(self.mav, force_mavlink1=False), 2)
+        pkt = self.mod.MAVLink_heartbeat_message(6, 8, 0, 0, 0, int(self.version))
+        server.send_data(pkt.pack(self.mav, force_mavlink1=False))
+
+        await asyncio.sleep(0.10)
+        assert [p.get_type() for p in peerpkts[1]] == ['HEARTBEAT']
+        assert [p.get_type() for p in peerpkts[2]] == ['HEARTBEAT', 'COMMAND_LONG']
+        assert [p.get_type() for p in peerpkts[3]] == ['HEARTBEAT']
+
+        # peers expire
+        server.peertimeout = 0
+        server.lastexpire = 0
+        assert server.getPeers() == {}
+        assert server.sysidpeers == {}
+
+        for client in clients.values():
+            client.close()
+        server.close()
+
 
 if __name__ == '__main__':
     asynctest.main()
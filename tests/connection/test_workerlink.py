@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+'''WorkerLink tests
+
+Can send and recieve data via a worker process
+
+If the link can't be opened, the worker keeps retrying
+
+'''
+
+import asyncio
+import asynctest
+import unittest
+
+from PaGS.connection.udplink import UDPConnection
+from PaGS.connection.workerlink import WorkerConnection, workersAvailable
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+@unittest.skipIf(not workersAvailable(), "Worker links not available")
+class WorkerLinkTest(asynctest.TestCase):
+
+    """
+    Class to test WorkerConnection
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.dialect = 'ardupilotmega'
+        self.version = 2.0
+        self.ip = '127.0.0.1'
+        self.port = 15000
+        self.cname = 'udpclient:127.0.0.1:15000'
+        self.sname = 'udpserver:127.0.0.1:15000'
+
+        self.mod = getpymavlinkpackage(self.dialect, self.version)
+        self.mav = self.mod.MAVLink(
+            self, srcSystem=0, srcComponent=0, use_native=False)
+        self.cnum = 0
+        self.snum = 0
+
+    def newpacketcallback(self, pkt, strconnection):
+        """Callback when a link has a new packet"""
+        if pkt.get_type() == 'HEARTBEAT':
+            if strconnection == self.cname:
+                self.cnum += 1
+            elif strconnection == self.sname:
+                self.snum += 1
+
+    async def test_link_worker(self):
+        """Test passing data between a worker link and a udp server"""
+        server = UDPConnection(rxcallback=self.newpacketcallback,
+                               dialect=self.dialect, mavversion=self.version,
+                               srcsystem=0, srccomp=0, server=True, name=self.sname)
+        await self.loop.create_datagram_endpoint(lambda: server,
+                                                 local_addr=(self.ip, self.port))
+
+        client = WorkerConnection(rxcallback=self.newpacketcallback,
+                                  dialect=self.dialect, mavversion=self.version,
+                                  srcsystem=0, srccomp=0, name=self.cname)
+        client.start()
+
+        # wait for the worker to start
+        for i in range(50):
+            if client.connected:
+                break
+            await asyncio.sleep(0.1)
+        assert client.connected
+
+        # send a mavlink packet each way. The server only knows
+        # the client once it's received from it
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        client.send_data(pkt.pack(self.mav, force_mavlink1=False))
+        await asyncio.sleep(0.10)
+        server.send_data(pkt.pack(self.mav, force_mavlink1=False))
+        server.send_data(b'q837ot4c')
+        server.send_data(pkt.pack(self.mav, force_mavlink1=False))
+        await asyncio.sleep(0.10)
+        assert client.getRingDropped() == 0
+
+        client.close()
+        server.close()
+        await client.waitClosed()
+        assert client.ring is None and client.process is None
+
+        # Assert the packets were sent, and the bad data was dropped
+        assert self.snum == 1
+        assert self.cnum == 2
+
+    async def test_link_worker_retry(self):
+        """Test a worker keeps retrying a link that can't be opened"""
+        client = WorkerConnection(rxcallback=self.newpacketcallback,
+                                  dialect=self.dialect, mavversion=self.version,
+                                  srcsystem=0, srccomp=0,
+                                  name='tcpclient:127.0.0.1:15000', retry=0.05)
+        client.start()
+
+        for i in range(50):
+            if client.lasterror is not None:
+                break
+            await asyncio.sleep(0.1)
+
+        assert not client.connected
+        assert client.lasterror is not None
+
+        process = client.process
+        client.close()
+        await client.waitClosed()
+        assert not process.is_alive()
+
+    def test_link_badtype(self):
+        """Test server links can't be run in a worker"""
+        with self.assertRaises(ValueError):
+            WorkerConnection(rxcallback=self.newpacketcallback,
+                             dialect=self.dialect, mavversion=self.version,
+                             srcsystem=0, srccomp=0, name=self.sname)
+
+
+if __name__ == '__main__':
+    asynctest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''Helpers shared by the tests
+
+'''
+
+
+class FakeHandle():
+    """A scheduled call"""
+
+    def __init__(self, func):
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop():
+    """An event loop that only runs the scheduled calls when asked,
+    with only the public reader functions"""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def call_soon(self, func):
+        handle = FakeHandle(func)
+        self.scheduled.append(handle)
+        return handle
+
+    def runOnce(self) -> int:
+        """Run the currently scheduled calls, returning how many"""
+        scheduled = self.scheduled
+        self.scheduled = []
+        for handle in scheduled:
+            if not handle.cancelled:
+                handle.func()
+        return len(scheduled)
+
+    def add_reader(self, fd, callback):
+        return ('add_reader', fd)
+
+    def remove_reader(self, fd):
+        return ('remove_reader', fd)
+
+    def add_writer(self, fd, callback):
+        return ('add_writer', fd)
+
+    def remove_writer(self, fd):
+        return ('remove_writer', fd)
@@ -116,6 +116,13 @@ class ConnectionMatrixTest(asynctest.TestCase):
         except KeyError:
             self.rxdata[strconnection] = [pkt]
 
+    async def waitFor(self, condition, timeout: float = 5):
+        """Wait until condition() is True, or the timeout"""
+        for i in range(int(timeout / 0.01)):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+
     async def test_matrixstartup(self):
         """Test a simple startup of the matrix"""
         matrix = ConnectionManager(self.loop, self.dialect, self.version, 0, 0)
@@ -160,17 +167,131 @@ class ConnectionMatrixTest(asynctest.TestCase):
         assert len(matrix.getAllVeh()) == 1
         assert len(matrix.linkdict) == 1
 
+    async def test_routingindex(self):
+        """Test the rx and tx routing indexes are maintained as
+        vehicles and links are added and removed"""
+        matrix = ConnectionManager(self.loop, self.dialect, self.version, 0, 0)
+
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkB)
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkD)
+        await matrix.addVehicleLink(self.VehB.name, self.VehB.target_system, self.linkB)
+
+        assert matrix.rxroute[(self.linkB, 4)] == self.VehA.name
+        assert matrix.rxroute[(self.linkD, 4)] == self.VehA.name
+        assert matrix.rxroute[(self.linkB, 3)] == self.VehB.name
+        assert len(matrix.txroute[self.VehA.name]) == 2
+        assert len(matrix.txroute[self.VehB.name]) == 1
+
+        # a crashed link is no longer used for tx
+        matrix.closelinkcallback(self.linkD)
+        assert matrix.txroute[self.VehA.name] == [(matrix.linkdict[self.linkB], 4)]
+
+        # removing a vehicle removes it's routes
+        await matrix.removeVehicle(self.VehA.name)
+        assert (self.linkB, 4) not in matrix.rxroute
+        assert (self.linkD, 4) not in matrix.rxroute
+        assert self.VehA.name not in matrix.txroute
+        assert self.linkD not in matrix.linkdict
+
+        await matrix.stoploop()
+
+        assert matrix.getAllVeh() == [self.VehB.name]
+
+    async def test_rxprefilter(self):
+        """Test raw frames are dropped before decoding if they are
+        not for a vehicle on the link, or are duplicates"""
+        matrix = ConnectionManager(self.loop, self.dialect, self.version, 0, 0)
+        matrix.onPacketAttach(self.newpacketcallbackVeh)
+
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkD)
+        await matrix.addVehicleLink(self.VehB.name, self.VehB.target_system, self.linkB)
+        link = matrix.linkdict[self.linkD]
+
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        pktbytes = pkt.pack(self.mavUAS, force_mavlink1=False)
+        pktbytesone = pkt.pack(self.mavoneUAS, force_mavlink1=False)
+
+        # sysid 3 is not on this link, and the second packet is a duplicate
+        link.processPackets(pktbytes + pktbytesone + pktbytes)
+
+        await matrix.stoploop()
+
+        assert link.rxfiltered == 2
+        assert len(self.vehpkts[self.VehA.name]) == 1
+        assert self.VehB.name not in self.vehpkts
+        assert matrix.getDuplicateCounts() == {self.linkD: 1}
+
+    async def test_rxcorruptcopy(self):
+        """Test a corrupt copy of a packet on one link does not cause
+        the good copy on another link to be dropped as a duplicate"""
+        matrix = ConnectionManager(self.loop, self.dialect, self.version, 0, 0)
+        matrix.onPacketAttach(self.newpacketcallbackVeh)
+
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkC)
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkD)
+
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        pktbytes = pkt.pack(self.mavUAS, force_mavlink1=False)
+        # payload corrupted, but the CRC field is unchanged
+        badbytes = bytearray(pktbytes)
+        badbytes[10] ^= 0xFF
+
+        matrix.linkdict[self.linkD].processPackets(bytes(badbytes))
+        matrix.linkdict[self.linkC].processPackets(pktbytes)
+        # and a later copy is still a duplicate
+        matrix.linkdict[self.linkD].processPackets(pktbytes)
+
+        await matrix.stoploop()
+
+        assert len(self.vehpkts[self.VehA.name]) == 1
+        assert matrix.getDuplicateCounts() == {self.linkD: 1}
+
+    async def test_rxmsgtypes(self):
+        """Test raw frames are dropped before decoding if their
+        type is not wanted"""
+        matrix = ConnectionManager(self.loop, self.dialect, self.version, 0, 0)
+        matrix.onPacketAttach(self.newpacketcallbackVeh)
+
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkD)
+        link = matrix.linkdict[self.linkD]
+
+        matrix.setRxMsgTypes(['HEARTBEAT', 'NOT_A_MESSAGE'])
+        assert matrix.rxmsgids == {self.mod.MAVLINK_MSG_ID_HEARTBEAT}
+
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        pktsys = self.mod.MAVLink_system_time_message(0, 0)
+        link.processPackets(pkt.pack(self.mavUAS, force_mavlink1=False) +
+                            pktsys.pack(self.mavUAS, force_mavlink1=False))
+
+        await matrix.stoploop()
+
+        assert link.rxfiltered == 1
+        assert [p.get_type() for p in self.vehpkts[self.VehA.name]] == ['HEARTBEAT']
+
+        matrix.setRxMsgTypes(None)
+        assert matrix.rxmsgids is None
+
     async def test_linkretry_tcp(self):
         """For each of the TCP link types, test that they
         keep re-trying to connect, by only adding in the
         other side of the link 0.5 sec after startup"""
         matrix = ConnectionManager(
-            self.loop, self.dialect, self.version, 0, 0, 0.05)
+            self.loop, self.dialect, self.version, 0, 0, 0.05, maxreconnect=0.1)
         matrix.onPacketAttach(self.newpacketcallbackVeh)
 
         await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkA)
         await matrix.addVehicleLink(self.VehB.name, self.VehB.target_system, self.linkB)
 
+        # the client can't connect yet, so is backing off
+        state = matrix.getLinkState()
+        assert not state[self.linkA]['connected']
+        assert state[self.linkA]['failures'] == 1
+        assert state[self.linkA]['lasterror'] is not None
+        assert state[self.linkB]['connected']
+
         # now wait for a bit
         await asyncio.sleep(0.10)
 
@@ -206,6 +327,7 @@ class ConnectionMatrixTest(asynctest.TestCase):
         # assert the links are all still there
         assert len(matrix.getAllVeh()) == 2
         assert len(matrix.linkdict) == 2
+        assert matrix.getLinkState()[self.linkA]['connected']
 
         # assert packets were recived on both links (vehicles) in the matrix
         assert self.vehpkts[self.VehA.name][0].get_msgbuf() == pktbytes
@@ -216,7 +338,7 @@ class ConnectionMatrixTest(asynctest.TestCase):
         keep re-trying to connect, by only adding in the
         other side of the link 0.5 sec after startup"""
         matrix = ConnectionManager(
-            self.loop, self.dialect, self.version, 0, 0, 0.05)
+            self.loop, self.dialect, self.version, 0, 0, 0.05, maxreconnect=0.1)
         matrix.onPacketAttach(self.newpacketcallbackVeh)
 
         self.VehA.onPacketTxAttach(matrix.outgoingPacket)
@@ -280,6 +402,39 @@ class ConnectionMatrixTest(asynctest.TestCase):
         assert self.vehpkts[self.VehA.name][0].get_msgbuf() == pktbytes
         assert self.vehpkts[self.VehB.name][0].get_msgbuf() == pktbytesone
 
+    async def test_linkretry_parallel(self):
+        """Test links that are slow to fail don't hold up the
+        reconnection of other links"""
+        matrix = ConnectionManager(
+            self.loop, self.dialect, self.version, 0, 0, 0.05, maxreconnect=0.1)
+        matrix.onPacketAttach(self.newpacketcallbackVeh)
+
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, self.linkA)
+        await matrix.addVehicleLink(self.VehB.name, self.VehB.target_system, self.linkB)
+
+        # a link that never connects, with every attempt timing out
+        initLink = matrix.initLink
+
+        async def slowInitLink(strconnection):
+            if strconnection == self.linkA:
+                await asyncio.sleep(10)
+            return await initLink(strconnection)
+        matrix.initLink = slowInitLink
+
+        # lose the tcpserver link and check it's reconnected
+        matrix.closelinkcallback(self.linkB)
+        assert matrix.linkdict[self.linkB] is None
+        assert not matrix.getLinkState()[self.linkB]['connected']
+
+        await asyncio.sleep(0.20)
+
+        assert matrix.getLinkState()[self.linkB]['connected']
+        assert matrix.linkdict[self.linkB] is not None
+        assert not matrix.getLinkState()[self.linkA]['connected']
+        assert matrix.getLinkState()[self.linkA]['lasterror'] == 'Timeout'
+
+        await matrix.stoploop()
+
     async def test_incomingdistribution(self):
         """Test incoming packets (from vehicle) are distributed
         correctly"""
@@ -404,8 +559,8 @@ class ConnectionMatrixTest(asynctest.TestCase):
         await self.loop.create_datagram_endpoint(lambda: udpserver,
                                                  local_addr=(self.ip, 15002))
 
-        # send packets on each link and wait
-        await asyncio.sleep(0.15)
+        # wait for the tcp links to connect
+        await self.waitFor(lambda: matrix.linkdict.get(self.linkA) is not None and matrix.linkdict[self.linkB].clients)
 
         # send packet from the GCS of VehA, VehB and VehC
         pktbytesA = self.VehA.sendPacket(self.mod.MAVLINK_MSG_ID_HEARTBEAT,
@@ -433,7 +588,9 @@ class ConnectionMatrixTest(asynctest.TestCase):
                                          mavlink_version=int(self.VehC.mavversion))
 
         # wait for packets to send
-        await asyncio.sleep(0.15)
+        await self.waitFor(lambda: len(self.rxdata.get('tcpserver:127.0.0.1:15001', ())) >= 1 and
+                           len(self.rxdata.get('tcpclient:127.0.0.1:15020', ())) >= 2 and
+                           len(self.rxdata.get('udpserver:127.0.0.1:15002', ())) >= 1)
 
         # and close everything
         await matrix.stoploop()
@@ -456,6 +613,83 @@ class ConnectionMatrixTest(asynctest.TestCase):
         assert self.rxdata['udpserver:127.0.0.1:15002'][0].get_msgbuf(
         ) == pktbytesC
 
+    async def test_txpolicy(self):
+        """Test outgoing packets are only sent on the links
+        selected by the vehicle's tx policy"""
+        matrix = ConnectionManager(
+            self.loop, self.dialect, self.version, 0, 0, 0.05, txpolicy='failover')
+
+        linkE = 'udpclient:127.0.0.1:15030'
+        linkF = 'udpclient:127.0.0.1:15031'
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, linkE)
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, linkF)
+
+        # record the tx on each link
+        sent = {linkE: 0, linkF: 0}
+        for name in sent:
+            matrix.linkdict[name].send_data = lambda data, sysid, name=name: sent.__setitem__(name, sent[name] + 1)
+
+        # nothing received yet, so send on both
+        matrix.outgoingPacket(b'1234', self.VehA.name)
+        assert sent == {linkE: 1, linkF: 1}
+        assert matrix.getTxPolicy(self.VehA.name) == ('failover', None)
+
+        # both receiving, so send on the primary only
+        matrix.linkdict[linkE].stats.rxPacket(self.VehA.target_system, 0, 0, 20)
+        matrix.linkdict[linkF].stats.rxPacket(self.VehA.target_system, 0, 0, 20)
+        matrix.outgoingPacket(b'1234', self.VehA.name)
+        assert sent == {linkE: 2, linkF: 1}
+        assert matrix.getTxPolicy(self.VehA.name) == ('failover', linkE)
+
+        # back to sending on all
+        assert matrix.setTxPolicy(self.VehA.name, 'broadcast')
+        matrix.outgoingPacket(b'1234', self.VehA.name)
+        assert sent == {linkE: 3, linkF: 2}
+
+        with self.assertRaises(ValueError):
+            matrix.setTxPolicy(self.VehA.name, 'cheapest')
+        assert not matrix.setTxPolicy(self.VehB.name, 'best')
+
+        await matrix.stoploop()
+
+    async def test_bulkstripe(self):
+        """Test bulk packets are striped across links, and other
+        packets follow the tx policy"""
+        matrix = ConnectionManager(
+            self.loop, self.dialect, self.version, 0, 0, 0.05, bulkmode='stripe')
+
+        linkE = 'udpclient:127.0.0.1:15030'
+        linkF = 'udpclient:127.0.0.1:15031'
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, linkE)
+        await matrix.addVehicleLink(self.VehA.name, self.VehA.target_system, linkF)
+        assert matrix.getBulkMode(self.VehA.name) == 'stripe'
+
+        # record the tx on each link
+        sent = {linkE: 0, linkF: 0}
+        for name in sent:
+            matrix.linkdict[name].send_data = lambda data, sysid, name=name: sent.__setitem__(name, sent[name] + 1)
+        matrix.linkdict[linkE].stats.rxPacket(self.VehA.target_system, 0, 0, 20)
+        matrix.linkdict[linkF].stats.rxPacket(self.VehA.target_system, 0, 0, 20)
+
+        # param requests go on alternate links
+        pkt = self.mod.MAVLink_param_request_read_message(4, 0, b'RATE_RLL_P', -1)
+        for i in range(10):
+            matrix.outgoingPacket(pkt.pack(self.mavGCS), self.VehA.name)
+        assert sent == {linkE: 5, linkF: 5}
+
+        # heartbeats are broadcast
+        pkt = self.mod.MAVLink_heartbeat_message(6, 8, 0, 0, 0, int(self.version))
+        matrix.outgoingPacket(pkt.pack(self.mavGCS), self.VehA.name)
+        assert sent == {linkE: 6, linkF: 6}
+
+        # and the tx policy is kept when changing the bulk mode
+        assert matrix.setTxPolicy(self.VehA.name, 'failover')
+        assert matrix.setBulkMode(self.VehA.name, 'policy')
+        assert matrix.getTxPolicy(self.VehA.name)[0] == 'failover'
+        assert matrix.getBulkMode(self.VehA.name) == 'policy'
+
+        await matrix.stoploop()
+
 
 if __name__ == '__main__':
     asynctest.main()
@@ -29,6 +29,7 @@ add and remove vehicle
 
 '''
 
+import asyncio
 import asynctest
 import os
 import shutil
@@ -162,6 +163,95 @@ class ModuleManagerTest(asynctest.TestCase):
         # if we've not crashed at this point, the above exception
         # was handled
 
+    async def test_pktSubscriptions(self):
+        """Test packets only go to modules that want that type"""
+        self.manager = moduleManager.moduleManager(self.loop, self.settingsdir, False)
+        self.manager.onVehListAttach(self.getVehListCallback)
+        self.manager.onVehGetAttach(self.getVehicleCallback)
+        self.manager.onPktTxAttach(self.txcallback)
+
+        msgTypes = []
+        self.manager.onMsgTypesAttach(msgTypes.append)
+        self.manager.addModule("templateModule")
+        self.manager.addModule("internalPrinterModule")
+
+        # by default, modules get every packet
+        assert self.manager.pktHandlers == {}
+        assert len(self.manager.allPktHandlers) == 2
+        assert msgTypes[-1] is None
+
+        # the template module only wants HEARTBEAT's, the printer none
+        self.manager.multiModules["templateModule"].msgTypes = ["HEARTBEAT"]
+        self.manager.multiModules["internalPrinterModule"].msgTypes = []
+        self.manager.indexPktHandlers()
+        assert list(self.manager.pktHandlers.keys()) == ["HEARTBEAT"]
+        assert len(self.manager.pktHandlers["HEARTBEAT"]) == 1
+        assert self.manager.allPktHandlers == []
+        assert msgTypes[-1] == {"HEARTBEAT"}
+
+        pkt = self.mod.MAVLink_system_time_message(0, 0)
+        self.manager.incomingPacket("VehA", pkt, "link1")
+        assert self.manager.multiModules["templateModule"].pkts == 0
+
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        self.manager.incomingPacket("VehA", pkt, "link1")
+        assert self.manager.multiModules["templateModule"].pkts == 1
+
+        await self.manager.removeModule("templateModule")
+        assert self.manager.pktHandlers == {}
+        assert self.manager.allPktHandlers == []
+
+    async def test_execModes(self):
+        """Test packets going to modules in the task and process modes"""
+        self.manager = moduleManager.moduleManager(self.loop, self.settingsdir, False)
+        self.manager.onVehListAttach(self.getVehListCallback)
+        self.manager.onVehGetAttach(self.getVehicleCallback)
+        self.manager.onPktTxAttach(self.txcallback)
+
+        # task mode - packets are handled in a later run of the loop
+        self.manager.addModule("templateModule", "task")
+        pkt = self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version))
+        pkt.pack(self.mavUAS)
+        self.manager.incomingPacket("VehA", pkt, "link1")
+        assert self.manager.multiModules["templateModule"].pkts == 0
+        await asyncio.sleep(0.01)
+        assert self.manager.multiModules["templateModule"].pkts == 1
+        assert self.manager.runners["templateModule"].get()['handled'] == 1
+        await self.manager.removeModule("templateModule")
+
+        # process mode - the module runs in a worker process, and is
+        # added once it has started
+        starting = self.manager.addModule("templateModule", "process")
+        assert "templateModule" in self.manager.startingModules
+        assert await starting
+        assert "template" in self.manager.commands
+        assert len(self.manager.allPktHandlers) == 1
+
+        # packets that were never packed can't be passed on
+        self.manager.incomingPacket("VehA", self.mod.MAVLink_heartbeat_message(
+            5, 4, 0, 0, 0, int(self.version)), "link1")
+        assert self.manager.runners["templateModule"].get()['dropped'] == 1
+
+        self.manager.incomingPacket("VehA", pkt, "link1")
+        # the worker reports the packet as handled after it's output
+        for i in range(100):
+            if self.manager.runners["templateModule"].get()['handled'] == 1:
+                break
+            await asyncio.sleep(0.05)
+        assert self.txPackets["VehA"] == 0  # the packet type
+        assert self.manager.runners["templateModule"].get()['handled'] == 1
+
+        await self.manager.removeModule("templateModule")
+        assert self.manager.runners == {}
+
+        # modules that fail to start in the worker are not added
+        assert not await self.manager.addModule("PaGS.modulesupport.moduleexec", "process")
+        assert self.manager.startingModules == {}
+        assert self.manager.multiModules == {}
+        assert self.manager.runners == {}
+
     def test_addRemoveVehicle(self):
         """Test adding and removing a vehicle"""
         self.manager = moduleManager.moduleManager(self.loop, self.settingsdir, False)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''Shard manager tests
+
+Sources on the same link are kept in the same shard
+Shards are balanced by number of sources
+The coordinator tracks the shards' vehicles and output
+Commands are passed to the vehicle's shard
+
+'''
+
+import asynctest
+import os
+import shutil
+
+from PaGS.managers.shardManager import assignShards, ShardCoordinator
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+class FakePipe():
+    """A pipe end that stores the sent messages"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+class ShardManagerTest(asynctest.TestCase):
+
+    """
+    Class to test the shard manager
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        # The PaGS settings dir (just in source dir)
+        self.settingsdir = os.path.join(os.getcwd(), ".PaGS")
+        if not os.path.exists(self.settingsdir):
+            os.makedirs(self.settingsdir)
+
+        self.dialect = 'ardupilotmega'
+        self.version = 2.0
+        self.mod = getpymavlinkpackage(self.dialect, self.version)
+        self.mavUAS = self.mod.MAVLink(
+            self, srcSystem=4, srcComponent=0, use_native=False)
+
+        self.coordinator = ShardCoordinator(self.loop, self.settingsdir, 2, self.dialect, self.version,
+                                            255, 0, [], [])
+        self.coordinator.pipes = [FakePipe(), FakePipe()]
+        self.printed = []
+        self.coordinator.modules.printers['test'] = lambda text, vehname: self.printed.append((vehname, text))
+
+    def tearDown(self):
+        """Close down the test"""
+        if os.path.exists(self.settingsdir):
+            shutil.rmtree(self.settingsdir)
+
+    def test_assignShards(self):
+        """Test sources are grouped by link and balanced"""
+        sources = ["udpserver:127.0.0.1:14550:1:0",
+                   "udpserver:127.0.0.1:14550:2:0",
+                   "udpserver:127.0.0.1:14550:3:0",
+                   "tcpclient:127.0.0.1:5760:1:0",
+                   "tcpclient:127.0.0.1:5770:1:0"]
+
+        shards = assignShards(sources, 2)
+        assert shards == [sources[0:3], sources[3:5]]
+
+        # more shards than links
+        shards = assignShards(sources, 4)
+        assert shards == [sources[0:3], [sources[3]], [sources[4]], []]
+
+        # single shard has everything
+        assert assignShards(sources, 1) == [sources]
+
+    def test_vehicles(self):
+        """Test the coordinator tracks vehicles added and removed in the shards"""
+        self.coordinator.handleMessage(0, ('add', 'VehA'))
+        self.coordinator.handleMessage(1, ('add', 'VehB'))
+
+        assert sorted(self.coordinator.getVehicleList()) == ['VehA', 'VehB']
+        assert self.coordinator.getVehicle('VehB').shard == 1
+        assert not self.coordinator.getVehicle('VehA').hasInitial
+
+        self.coordinator.handleMessage(0, ('remove', 'VehA'))
+        assert self.coordinator.getVehicleList() == ['VehB']
+        with self.assertRaises(ValueError):
+            self.coordinator.getVehicle('VehA')
+
+    def test_packets(self):
+        """Test forwarded packets are decoded"""
+        self.coordinator.handleMessage(1, ('add', 'VehB'))
+        pkt = self.mavUAS.heartbeat_encode(self.mod.MAV_TYPE_QUADROTOR, self.mod.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                                           0, 0, 0, int(self.version))
+        self.coordinator.handleMessage(1, ('packet', 'VehB', bytes(pkt.pack(self.mavUAS))))
+
+        assert self.coordinator.getVehicle('VehB').hasInitial
+
+        # unknown vehicles are ignored
+        self.coordinator.handleMessage(1, ('packet', 'VehC', bytes(pkt.pack(self.mavUAS))))
+
+        # corrupt packets are counted and dropped
+        badpkt = bytearray(pkt.pack(self.mavUAS))
+        badpkt[-1] ^= 0xFF
+        self.coordinator.handleMessage(1, ('packet', 'VehB', bytes(badpkt)))
+        assert self.coordinator.badframes == 1
+
+    def test_commands(self):
+        """Test commands go to the vehicle's shard and output is merged"""
+        self.coordinator.handleMessage(0, ('add', 'VehA'))
+        self.coordinator.handleMessage(1, ('add', 'VehB'))
+
+        self.coordinator.modules.onModuleCommandCallback('VehB', 'mode list')
+        assert self.coordinator.pipes[0].sent == []
+        assert self.coordinator.pipes[1].sent == [('command', 'VehB', 'mode list')]
+
+        self.coordinator.modules.onModuleCommandCallback('VehC', 'mode list')
+        assert self.printed == [('VehC', "No vehicle with that name")]
+
+        self.coordinator.handleMessage(0, ('print', 'VehA', 'Mode list'))
+        assert self.printed[-1] == ('VehA', 'Mode list')
+
+
+if __name__ == '__main__':
+    asynctest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+'''FrameScanner tests
+
+Can find MAVLink v1 and v2 frames in a byte stream
+Frames split across multiple chunks are joined
+Corrupt data is skipped
+Rejected frames cause a resync on the next byte
+The buffered scanner finds frames in place, in it's own buffer
+
+'''
+
+import unittest
+
+from PaGS.mavlink.framescanner import FrameScanner, BufferedFrameScanner, frameFromBuf
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+class FrameScannerTest(unittest.TestCase):
+
+    """
+    Class to test FrameScanner
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.mod = getpymavlinkpackage('ardupilotmega', 2.0)
+        self.mav = self.mod.MAVLink(
+            self, srcSystem=4, srcComponent=1, use_native=False)
+        self.pkt = self.mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, 2)
+
+    def test_frames(self):
+        """Test reading the header from v1 and v2 frames"""
+        scanner = FrameScanner(self.mod)
+        self.mav.seq = 7
+        bufv2 = self.pkt.pack(self.mav, force_mavlink1=False)
+        bufv1 = self.pkt.pack(self.mav, force_mavlink1=True)
+
+        frames = list(scanner.frames(bufv2 + bufv1))
+
+        assert len(frames) == 2
+        for frame in frames:
+            assert frame.srcSystem == 4
+            assert frame.srcComponent == 1
+            assert frame.seq == 7
+            assert frame.msgId == self.mod.MAVLINK_MSG_ID_HEARTBEAT
+            assert scanner.validate(frame)
+        assert frames[0].buf == bufv2
+        assert frames[1].buf == bufv1
+        assert frames[0].crc == self.mav.decode(bytearray(bufv2)).get_crc()
+        assert len(scanner.buf) == 0
+
+        # and from a single frame
+        assert frameFromBuf(frames[0].buf) == frames[0]
+        assert frameFromBuf(frames[1].buf) == frames[1]
+
+    def test_splitframes(self):
+        """Test frames split across multiple chunks"""
+        scanner = FrameScanner(self.mod)
+        buf = self.pkt.pack(self.mav, force_mavlink1=False)
+
+        assert list(scanner.frames(buf[:5])) == []
+        assert list(scanner.frames(buf[5:-1])) == []
+        frames = list(scanner.frames(buf[-1:]))
+
+        assert len(frames) == 1
+        assert frames[0].buf == buf
+
+    def test_corruptdata(self):
+        """Test corrupt data between frames is skipped"""
+        scanner = FrameScanner(self.mod)
+        buf = self.pkt.pack(self.mav, force_mavlink1=False)
+
+        frames = list(scanner.frames(b'q837ot4c' + buf + b'q837ot4c' + buf))
+
+        assert len(frames) == 2
+        assert scanner.badbytes == 16
+
+    def test_reject(self):
+        """Test a rejected frame resyncs on the following byte"""
+        scanner = FrameScanner(self.mod)
+        buf = self.pkt.pack(self.mav, force_mavlink1=False)
+
+        # a fake frame start that swallows the real frame
+        fakebuf = bytes([0xFD, 20, 0]) + buf + bytes(20)
+        frames = []
+        for frame in scanner.frames(fakebuf):
+            if not scanner.validate(frame):
+                scanner.reject()
+            else:
+                frames.append(frame)
+
+        assert len(frames) == 1
+        assert frames[0].buf == buf
+
+    def test_bufferedframes(self):
+        """Test frames received directly into the buffer are views of it"""
+        scanner = BufferedFrameScanner(self.mod)
+        buf = self.pkt.pack(self.mav, force_mavlink1=False)
+
+        rxbuf = scanner.getBuffer()
+        rxbuf[:len(buf) + 5] = buf + buf[:5]
+        frames = list(scanner.bufferFrames(len(buf) + 5))
+
+        assert len(frames) == 1
+        assert isinstance(frames[0].buf, memoryview)
+        assert frames[0].buf == buf
+        assert scanner.validate(frames[0])
+
+        # keep() gives the frame it's own bytes
+        kept = scanner.keep(frames[0])
+        assert isinstance(kept.buf, bytearray)
+        assert kept == frames[0]._replace(buf=bytearray(buf))
+
+        # the rest of the partial frame
+        rxbuf = scanner.getBuffer()
+        rxbuf[:len(buf) - 5] = buf[5:]
+        frames = list(scanner.bufferFrames(len(buf) - 5))
+        assert len(frames) == 1
+        assert frames[0].buf == buf
+        assert scanner.start == scanner.end
+
+    def test_bufferedwrap(self):
+        """Test the buffered scanner reuses it's buffer, with the same
+        frames found as the FrameScanner"""
+        scanner = FrameScanner(self.mod)
+        bufscanner = BufferedFrameScanner(self.mod, size=600)
+        data = bytearray()
+        for seq in range(100):
+            self.mav.seq = seq
+            data += self.pkt.pack(self.mav, force_mavlink1=(seq % 3 == 0))
+            if seq % 7 == 0:
+                data += b'q837ot4c'
+
+        frames = [frame.buf for frame in scanner.frames(data)]
+        bufframes = []
+        for pos in range(0, len(data), 250):
+            bufframes += [bufscanner.keep(frame).buf for frame in bufscanner.frames(data[pos:pos + 250])]
+
+        assert len(frames) == 100
+        assert bufframes == frames
+        assert bufscanner.badbytes == scanner.badbytes
+
+
+if __name__ == '__main__':
+    unittest.main()
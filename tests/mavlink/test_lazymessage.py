@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+'''LazyMessage tests
+
+The header can be read without decoding the payload
+The payload is decoded on first access to a field
+Fields can be changed
+
+'''
+
+import unittest
+
+from PaGS.mavlink.framescanner import FrameScanner
+from PaGS.mavlink.lazymessage import LazyMessage
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+class LazyMessageTest(unittest.TestCase):
+
+    """
+    Class to test LazyMessage
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.mod = getpymavlinkpackage('ardupilotmega', 2.0)
+        self.mav = self.mod.MAVLink(
+            self, srcSystem=4, srcComponent=1, use_native=False)
+        self.pkt = self.mod.MAVLink_param_value_message(b'SYSID_THISMAV', 1.0, 9, 500, 1)
+        self.pktbytes = self.pkt.pack(self.mav, force_mavlink1=False)
+        self.frame = list(FrameScanner(self.mod).frames(self.pktbytes))[0]
+
+    def test_header(self):
+        """Test the header is read without decoding"""
+        msg = LazyMessage(self.frame, self.mav, self.mod.mavlink_map[self.frame.msgId])
+
+        assert msg.get_type() == 'PARAM_VALUE'
+        assert msg.name == 'PARAM_VALUE'
+        assert msg.get_msgId() == self.mod.MAVLINK_MSG_ID_PARAM_VALUE
+        assert msg.get_srcSystem() == 4
+        assert msg.get_srcComponent() == 1
+        assert msg.get_seq() == 0
+        assert msg.get_crc() == self.pkt.get_crc()
+        assert msg.get_msgbuf() == self.pktbytes
+        assert not msg.isDecoded
+
+    def test_fields(self):
+        """Test the payload is decoded on first use"""
+        msg = LazyMessage(self.frame, self.mav, self.mod.mavlink_map[self.frame.msgId])
+
+        assert msg.param_id == 'SYSID_THISMAV'
+        assert msg.isDecoded
+        assert msg.param_count == 500
+        assert msg == self.mav.decode(bytearray(self.pktbytes))
+
+        msg.param_id = 'SYSID_MYGCS'
+        assert msg.param_id == 'SYSID_MYGCS'
+        assert msg.decoded().param_id == 'SYSID_MYGCS'
+
+
+if __name__ == '__main__':
+    unittest.main()
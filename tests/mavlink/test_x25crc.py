@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''X25CRC tests
+
+Gives the same CRC as pymavlink for a corpus of buffers
+Works on bytes, bytearray, memoryview and sequences of ints
+Is used by the pymavlink dialects, for packing and decoding
+
+'''
+
+import random
+import unittest
+
+from pymavlink.generator.mavcrc import x25crc
+
+from PaGS.mavlink.x25crc import X25CRC, crcAccumulate, installCRC, removeCRC
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+
+
+class X25CRCTest(unittest.TestCase):
+
+    """
+    Class to test X25CRC
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        random.seed(0)
+        self.corpus = [bytes(random.randrange(256) for i in range(random.randrange(300)))
+                       for n in range(500)]
+
+    def test_corpus(self):
+        """Test the CRC of each buffer matches pymavlink"""
+        assert crcAccumulate(b'123456789') == 0x6F91
+        for buf in self.corpus:
+            crc = x25crc(buf).crc
+            assert crcAccumulate(buf) == crc
+            assert X25CRC(buf).crc == crc
+            assert X25CRC(bytearray(buf)).crc == crc
+            assert X25CRC(memoryview(buf)).crc == crc
+
+    def test_accumulate(self):
+        """Test adding to a CRC in parts"""
+        for buf in self.corpus:
+            crc = x25crc(buf[:10])
+            crc.accumulate(buf[10:])
+            crc.accumulate((buf[0] if buf else 0,))
+            crc.accumulate_str(b'ab')
+
+            fastcrc = X25CRC(buf[:10])
+            fastcrc.accumulate(buf[10:])
+            fastcrc.accumulate((buf[0] if buf else 0,))
+            fastcrc.accumulate_str(b'ab')
+            assert fastcrc.crc == crc.crc
+
+    def test_dialect(self):
+        """Test the dialects pack and decode with X25CRC, once installed"""
+        for version in [1.0, 2.0]:
+            mod = getpymavlinkpackage('ardupilotmega', version)
+            assert mod.x25crc is x25crc
+            installCRC(mod)
+            installCRC(mod)
+            assert mod.x25crc is X25CRC
+
+            mav = mod.MAVLink(self, srcSystem=4, srcComponent=1, use_native=False)
+            pkt = mod.MAVLink_statustext_message(6, b'PreArm: Compass not calibrated')
+            buf = pkt.pack(mav)
+
+            # the CRC on the end of the packet is the same as pymavlink's
+            crc = mod.x25crc_python(buf[1:-2])
+            crc.accumulate_str(bytes((mod.MAVLink_statustext_message.crc_extra,)))
+            assert buf[-2] | (buf[-1] << 8) == crc.crc
+
+            msg = mav.decode(bytearray(buf))
+            assert msg.text == 'PreArm: Compass not calibrated'
+
+            # and pymavlink's CRC is back afterwards
+            removeCRC(mod)
+            assert mod.x25crc is x25crc
+            assert not hasattr(mod, 'x25crc_python')
+            assert mav.decode(bytearray(buf)).text == 'PreArm: Compass not calibrated'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -141,6 +141,144 @@ class ModuleManagerTest(asynctest.TestCase):
         assert self.getOutText("VehA", 8) == "internalPrinterModule" or "PaGS.modules.modeModule"
         assert self.getOutText("VehA", 7) != self.getOutText("VehA", 8)
 
+    def test_linkStats(self):
+        """
+        Test printing of link statistics "link stats"
+        """
+        self.manager.onModuleCommandCallback("VehA", "link stats")
+        assert self.getOutText("VehA", 1) == "No link statistics available"
+
+        self.manager.onLinkStatsAttach(lambda: {'udpclient:127.0.0.1:15550': {
+            4: {'rxbytespersec': 1200, 'rxpktspersec': 40, 'txbytespersec': 30,
+                'txpktspersec': 1, 'received': 400, 'lost': 4, 'loss': 0.01,
+                'duplicates': 2, 'sent': 10, 'lastrx': 0}}})
+        self.manager.onModuleCommandCallback("VehA", "link stats")
+
+        assert self.getOutText("VehA", 3) == "udpclient:127.0.0.1:15550"
+        assert self.getOutText("VehA", 4) == ("  sysid 4: rx 1200 B/s 40.0 pkt/s, tx 30 B/s 1.0 pkt/s, "
+                                              "loss 1.0% (4 lost), 2 duplicates")
+
+    def test_linkQueues(self):
+        """
+        Test printing of link tx queues "link queues"
+        """
+        self.manager.onModuleCommandCallback("VehA", "link queues")
+        assert self.getOutText("VehA", 1) == "No link queues available"
+
+        self.manager.onLinkQueuesAttach(lambda: {'serial:/dev/ttyUSB0:57600': {
+            'control': 0, 'command': 1, 'bulk': 20, 'bytes': 700, 'transport': 1100,
+            'paused': True, 'pauses': 3}})
+        self.manager.onModuleCommandCallback("VehA", "link queues")
+
+        assert self.getOutText("VehA", 3) == ("serial:/dev/ttyUSB0:57600: control 0, command 1, bulk 20 (700 bytes), "
+                                              "transport 1100 bytes, paused 3 times")
+
+        self.manager.onLinkQueuesAttach(lambda: {'udpserver:127.0.0.1:14550': {
+            'control': 0, 'command': 0, 'bulk': 0, 'bytes': 0, 'transport': 0,
+            'paused': False, 'pauses': 0, 'rxqueue': 3, 'rxdropped': 0, 'rxbuf': 425984, 'rxdrops': 12}})
+        self.manager.onModuleCommandCallback("VehA", "link queues")
+
+        assert self.getOutText("VehA", 5) == ("udpserver:127.0.0.1:14550: control 0, command 0, bulk 0 (0 bytes), "
+                                              "transport 0 bytes, not paused 0 times")
+        assert self.getOutText("VehA", 6) == "  rx queue 3, 0 dropped"
+        assert self.getOutText("VehA", 7) == "  socket rx buffer 425984 bytes, 12 datagrams dropped"
+
+    def test_linkState(self):
+        """
+        Test printing of link reconnection state "link state"
+        """
+        self.manager.onModuleCommandCallback("VehA", "link state")
+        assert self.getOutText("VehA", 1) == "No link state available"
+
+        self.manager.onLinkStateAttach(lambda: {
+            'udpclient:127.0.0.1:15550': {'connected': True, 'failures': 0, 'retryin': 0, 'lasterror': None},
+            'serial:/dev/ttyUSB0:57600': {'connected': False, 'failures': 3, 'retryin': 2.5,
+                                          'lasterror': 'Timeout'}})
+        self.manager.onModuleCommandCallback("VehA", "link state")
+
+        assert self.getOutText("VehA", 3) == "udpclient:127.0.0.1:15550: connected"
+        assert self.getOutText("VehA", 4) == ("serial:/dev/ttyUSB0:57600: disconnected, 3 failed attempts, "
+                                              "retry in 2.5 sec (Timeout)")
+
+    def test_linkPolicy(self):
+        """
+        Test getting and setting the tx policy "link policy"
+        """
+        self.manager.onModuleCommandCallback("VehA", "link policy")
+        assert self.getOutText("VehA", 1) == "No link policy available"
+
+        policy = {'VehA': ('broadcast', None)}
+
+        def setPolicy(vehname, newpolicy):
+            if newpolicy not in ('broadcast', 'best', 'failover'):
+                raise ValueError("Unknown tx policy")
+            policy[vehname] = (newpolicy, 'udpclient:127.0.0.1:15550')
+        self.manager.onGetLinkPolicyAttach(lambda vehname: policy.get(vehname))
+        self.manager.onSetLinkPolicyAttach(setPolicy)
+
+        self.manager.onModuleCommandCallback("VehA", "link policy")
+        assert self.getOutText("VehA", 3) == "TX policy broadcast, sending on all links"
+        self.manager.onModuleCommandCallback("VehA", "link policy best")
+        assert self.getOutText("VehA", 5) == "TX policy best, sending on udpclient:127.0.0.1:15550"
+        self.manager.onModuleCommandCallback("VehA", "link policy cheapest")
+        assert self.getOutText("VehA", 7) == "Unknown tx policy"
+
+    def test_linkBulk(self):
+        """
+        Test getting and setting the bulk mode "link bulk"
+        """
+        self.manager.onModuleCommandCallback("VehA", "link bulk")
+        assert self.getOutText("VehA", 1) == "No link bulk mode available"
+
+        mode = {'VehA': 'policy'}
+
+        def setMode(vehname, newmode):
+            if newmode not in ('policy', 'stripe', 'weighted'):
+                raise ValueError("Unknown bulk mode")
+            mode[vehname] = newmode
+        self.manager.onGetLinkBulkAttach(lambda vehname: mode.get(vehname))
+        self.manager.onSetLinkBulkAttach(setMode)
+
+        self.manager.onModuleCommandCallback("VehA", "link bulk stripe")
+        assert self.getOutText("VehA", 3) == "Bulk mode stripe"
+        self.manager.onModuleCommandCallback("VehA", "link bulk fastest")
+        assert self.getOutText("VehA", 5) == "Unknown bulk mode"
+
+    def test_linkConflation(self):
+        """
+        Test printing of the conflation counters "link conflation"
+        """
+        self.manager.onModuleCommandCallback("VehA", "link conflation")
+        assert self.getOutText("VehA", 1) == "No conflation available"
+
+        self.manager.onConflationAttach(lambda vehname: None)
+        self.manager.onModuleCommandCallback("VehA", "link conflation")
+        assert self.getOutText("VehA", 3) == "Conflation not enabled"
+
+        self.manager.onConflationAttach(lambda vehname: {
+            'queued': 12, 'maxdepth': 150, 'overloaded': True, 'overloads': 2, 'conflated': 30,
+            'types': {'VFR_HUD': 10, 'ATTITUDE': 20}})
+        self.manager.onModuleCommandCallback("VehA", "link conflation")
+        assert self.getOutText("VehA", 5) == "Queue 12 (max 150), overloaded 2 times, 30 packets conflated"
+        assert self.getOutText("VehA", 6) == "  ATTITUDE: 20"
+        assert self.getOutText("VehA", 7) == "  VFR_HUD: 10"
+
+    def test_moduleQueues(self):
+        """
+        Test printing of the module queues "module queues"
+        """
+        self.manager.onModuleCommandCallback("VehA", "module queues")
+        assert self.getOutText("VehA", 1) == ("internalPrinterModule: inline, queue 0 (max 0), 0 handled, "
+                                              "0 dropped (oldest), 0 errors, slowest 0.0 ms")
+
+        self.manager.onModuleCommandCallback("VehA", "module load templateModule bogus")
+        assert self.getOutText("VehA", 3) == "Unknown execution mode: bogus"
+        assert "templateModule" not in self.manager.multiModules
+
+        self.manager.onModuleCommandCallback("VehA", "module load templateModule task newest")
+        assert self.manager.runners["templateModule"].get()['mode'] == 'task'
+        assert self.manager.runners["templateModule"].get()['policy'] == 'newest'
+
 
 if __name__ == '__main__':
     asynctest.main()
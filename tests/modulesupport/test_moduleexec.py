@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''Module execution mode tests
+
+Inline runners call the handler straight away
+Task runners call the handler from scheduled runs, within a time budget
+Full queues drop the oldest or newest packets
+Thread runners call the handler from worker threads, in order for each vehicle
+Exceptions in the handler are counted and passed to the errback
+
+'''
+
+import asyncio
+import threading
+import time
+import unittest
+
+from PaGS.modulesupport.moduleexec import InlineRunner, TaskRunner, ThreadRunner, newRunner, execModeAvailable
+
+from fakeloop import FakeLoop
+
+
+class ModuleExecTest(unittest.TestCase):
+
+    """
+    Class to test the module runners
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.loop = FakeLoop()
+        self.handled = []
+        self.errors = []
+        self.threads = set()
+
+    def handler(self, vehname, pkt):
+        """Record the packets passed on"""
+        if pkt == 'bad':
+            raise ValueError("bad packet")
+        self.threads.add(threading.current_thread())
+        self.handled.append((vehname, pkt))
+
+    def errback(self, vehname, text):
+        """Record the exceptions"""
+        self.errors.append((vehname, text))
+
+    def test_modes(self):
+        """Test the runner for each mode"""
+        assert isinstance(newRunner(self.loop, 'inline', self.handler, self.errback), InlineRunner)
+        assert isinstance(newRunner(self.loop, 'task', self.handler, self.errback), TaskRunner)
+        assert execModeAvailable('task')
+        assert not execModeAvailable('bogus')
+        with self.assertRaises(ValueError):
+            newRunner(self.loop, 'bogus', self.handler, self.errback)
+        with self.assertRaises(ValueError):
+            newRunner(self.loop, 'task', self.handler, self.errback, 'bogus')
+
+    def test_inline(self):
+        """Test packets are passed on straight away"""
+        runner = InlineRunner(self.loop, self.handler, self.errback)
+        runner.put('VehA', 1)
+        runner.put('VehA', 'bad')
+
+        assert self.handled == [('VehA', 1)]
+        assert len(self.errors) == 1
+        assert "bad packet" in self.errors[0][1]
+        counters = runner.get()
+        assert counters['mode'] == 'inline'
+        assert counters['handled'] == 2
+        assert counters['errors'] == 1
+        assert counters['queued'] == 0
+
+    def test_task(self):
+        """Test packets are passed on from a scheduled run"""
+        runner = TaskRunner(self.loop, self.handler, self.errback)
+        for i in range(5):
+            runner.put('VehA', i)
+
+        assert self.handled == []
+        assert len(self.loop.scheduled) == 1
+        assert runner.get()['queued'] == 5
+
+        self.loop.runOnce()
+        assert self.handled == [('VehA', i) for i in range(5)]
+        assert runner.get()['maxdepth'] == 5
+        assert self.loop.runOnce() == 0
+
+    def test_taskBudget(self):
+        """Test a run yields to the loop when the budget is used"""
+        runner = TaskRunner(self.loop, self.handler, self.errback, budget=0)
+        for i in range(3):
+            runner.put('VehA', i)
+
+        self.loop.runOnce()
+        assert len(self.handled) == 1
+        self.loop.runOnce()
+        self.loop.runOnce()
+        assert len(self.handled) == 3
+        assert self.loop.runOnce() == 0
+
+    def test_dropOldest(self):
+        """Test the oldest packets are dropped from a full queue"""
+        runner = TaskRunner(self.loop, self.handler, self.errback, 'oldest', 3)
+        for i in range(5):
+            runner.put('VehA', i)
+
+        assert runner.get()['dropped'] == 2
+        self.loop.runOnce()
+        assert [pkt for vehname, pkt in self.handled] == [2, 3, 4]
+
+    def test_dropNewest(self):
+        """Test the incoming packets are dropped when the queue is full"""
+        runner = TaskRunner(self.loop, self.handler, self.errback, 'newest', 3)
+        for i in range(5):
+            runner.put('VehA', i)
+
+        assert runner.get()['dropped'] == 2
+        self.loop.runOnce()
+        assert [pkt for vehname, pkt in self.handled] == [0, 1, 2]
+
+    def test_taskClose(self):
+        """Test closing drops the waiting packets"""
+        runner = TaskRunner(self.loop, self.handler, self.errback)
+        runner.put('VehA', 1)
+        runner.close()
+
+        assert runner.get()['queued'] == 0
+        self.loop.runOnce()
+        assert self.handled == []
+
+    def test_thread(self):
+        """Test packets are passed on from the worker threads, in order
+        for each vehicle"""
+        loop = asyncio.new_event_loop()
+        runner = ThreadRunner(loop, self.handler, self.errback, workers=2)
+        for i in range(20):
+            runner.put('VehA', i)
+            runner.put('VehB', i)
+        runner.put('VehA', 'bad')
+
+        for i in range(100):
+            if runner.get()['handled'] == 41:
+                break
+            time.sleep(0.01)
+        # the errback is called from the event loop
+        loop.run_until_complete(asyncio.sleep(0))
+        runner.close()
+        loop.run_until_complete(runner.waitClosed())
+        loop.close()
+
+        assert [pkt for vehname, pkt in self.handled if vehname == 'VehA'] == list(range(20))
+        assert [pkt for vehname, pkt in self.handled if vehname == 'VehB'] == list(range(20))
+        assert threading.current_thread() not in self.threads
+        assert len(self.threads) == 2
+        assert len(self.errors) == 1
+        assert runner.get()['errors'] == 1
+        assert not any(thread.is_alive() for thread in runner.threads)
+
+    def test_threadDrop(self):
+        """Test a full worker queue drops packets, without blocking"""
+        loop = asyncio.new_event_loop()
+        blocker = threading.Event()
+        runner = ThreadRunner(loop, lambda vehname, pkt: blocker.wait(), self.errback, 'newest', 2)
+        for i in range(10):
+            runner.put('VehA', i)
+
+        # up to one packet is in the handler, and 2 waiting
+        counters = runner.get()
+        assert counters['dropped'] >= 7
+        assert counters['queued'] <= 2
+        blocker.set()
+        runner.close()
+        loop.run_until_complete(runner.waitClosed())
+        loop.close()
+        assert not any(thread.is_alive() for thread in runner.threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,6 +28,8 @@ import asyncio
 import asynctest
 
 from PaGS.pags import pags
+from PaGS.mavlink.pymavutil import getpymavlinkpackage
+from PaGS.mavlink.x25crc import X25CRC
 
 
 class IntegratedTest(asynctest.TestCase):
@@ -76,6 +78,75 @@ class IntegratedTest(asynctest.TestCase):
         assert len(self.pagsInstance.connmtrx.linkdict) == 2
         assert len(self.pagsInstance.modules.multiModules) == 0
 
+        # every message type is decoded by default
+        assert self.pagsInstance.connmtrx.rxmsgids is None
+
+    async def test_rxfilter(self):
+        """
+        With rxfilter, only the message types the modules and vehicles
+        use are decoded, so the vehicle only has packets of those types
+        """
+        self.pagsInstance = pags(
+            self.dialect,
+            self.version,
+            self.source_system,
+            self.source_component,
+            self.nogui,
+            self.multi,
+            self.loop,
+            ['modules.statusModule'],
+            rxfilter=True)
+        mod = getpymavlinkpackage(self.dialect, self.version)
+        assert self.pagsInstance.connmtrx.rxmsgids == {mod.MAVLINK_MSG_ID_SYS_STATUS, mod.MAVLINK_MSG_ID_HEARTBEAT,
+                                                       mod.MAVLINK_MSG_ID_PARAM_VALUE}
+
+        await self.pagsInstance.addVehicles(self.source[1:])
+        await asyncio.sleep(0.1)
+
+        # packets from the vehicle
+        mav = mod.MAVLink(self, srcSystem=1, srcComponent=0, use_native=False)
+        link = self.pagsInstance.connmtrx.linkdict['udpclient:127.0.0.1:15001']
+        link.processPackets(mod.MAVLink_heartbeat_message(5, 4, 0, 0, 0, 2).pack(mav) +
+                            mod.MAVLink_system_time_message(0, 0).pack(mav) +
+                            mod.MAVLink_sys_status_message(1, 1, 1, 500, 12000, 100, 50, 0, 0, 0, 0, 0, 0).pack(mav))
+        await asyncio.sleep(0.1)
+
+        vehicle = self.pagsInstance.allvehicles.get_vehicle(self.pagsInstance.allvehicles.get_vehiclelist()[0])
+        assert vehicle.getPacket("HEARTBEAT") is not None
+        assert vehicle.getPacket("SYS_STATUS") is not None
+        assert vehicle.getPacket("SYSTEM_TIME") is None
+
+    def test_fastcrc(self):
+        """
+        The faster CRC is only used if asked for, and only
+        while the instance is running
+        """
+        mod = getpymavlinkpackage(self.dialect, self.version)
+        self.pagsInstance = pags(
+            self.dialect,
+            self.version,
+            self.source_system,
+            self.source_component,
+            self.nogui,
+            self.multi,
+            self.loop,
+            [],
+            fastcrc=True)
+        assert mod.x25crc is X25CRC
+        self.pagsInstance.close()
+        assert mod.x25crc is not X25CRC
+
+        self.pagsInstance = pags(
+            self.dialect,
+            self.version,
+            self.source_system,
+            self.source_component,
+            self.nogui,
+            self.multi,
+            self.loop,
+            [])
+        assert mod.x25crc is not X25CRC
+
 
 if __name__ == '__main__':
     asynctest.main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+The Python-async Ground Station (PaGS), a mavlink ground station for
+autonomous vehicles.
+Copyright (C) 2019  Stephen Dade
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+'''ConflationQueue tests
+
+Packets are passed on in order when not overloaded
+When overloaded, only the newest of each conflatable type is kept
+Other packets are never dropped
+A run stops when the time budget is used
+
+'''
+
+import unittest
+
+from PaGS.vehicle.conflationqueue import ConflationQueue
+
+from fakeloop import FakeLoop
+
+
+class FakePacket():
+    """A received packet"""
+
+    def __init__(self, name: str, value: int, srcComponent: int = 1):
+        self.name = name
+        self.value = value
+        self.srcComponent = srcComponent
+
+    def get_type(self):
+        return self.name
+
+    def get_srcComponent(self):
+        return self.srcComponent
+
+
+class ConflationQueueTest(unittest.TestCase):
+
+    """
+    Class to test ConflationQueue
+    """
+
+    def setUp(self):
+        """Set up some data that is reused in many tests"""
+        self.loop = FakeLoop()
+        self.handled = []
+
+    def handler(self, vehname, pkt, strconnection):
+        """Record the packets passed on"""
+        self.handled.append((pkt.name, pkt.value))
+
+    def test_inorder(self):
+        """Test all packets are passed on in order when not overloaded"""
+        queue = ConflationQueue(self.loop, "VehA", self.handler, overload=10)
+        for i in range(5):
+            queue.put(FakePacket('ATTITUDE', i), 'udpserver:127.0.0.1:14550')
+
+        assert self.handled == []
+        self.loop.runOnce()
+        assert self.handled == [('ATTITUDE', i) for i in range(5)]
+        assert queue.get() == {'queued': 0, 'maxdepth': 5, 'overloaded': False,
+                               'overloads': 0, 'conflated': 0, 'types': {}}
+
+    def test_overload(self):
+        """Test conflation of telemetry, but not critical packets"""
+        queue = ConflationQueue(self.loop, "VehA", self.handler, overload=3)
+        queue.put(FakePacket('ATTITUDE', 0), 'link')
+        queue.put(FakePacket('VFR_HUD', 0), 'link')
+        queue.put(FakePacket('HEARTBEAT', 0), 'link')
+        # now overloaded
+        for i in range(1, 10):
+            queue.put(FakePacket('ATTITUDE', i), 'link')
+            queue.put(FakePacket('STATUSTEXT', i), 'link')
+        queue.put(FakePacket('VFR_HUD', 1), 'link')
+        # a different component isn't conflated with the waiting packet
+        queue.put(FakePacket('ATTITUDE', 20, srcComponent=2), 'link')
+        queue.put(FakePacket('ATTITUDE', 21, srcComponent=2), 'link')
+
+        counters = queue.get()
+        assert counters['overloaded']
+        assert counters['overloads'] == 1
+        assert counters['conflated'] == 11
+        assert counters['types'] == {'ATTITUDE': 10, 'VFR_HUD': 1}
+
+        self.loop.runOnce()
+        assert self.handled == ([('ATTITUDE', 9), ('VFR_HUD', 1), ('HEARTBEAT', 0)] +
+                                [('STATUSTEXT', i) for i in range(1, 10)] + [('ATTITUDE', 21)])
+        assert not queue.get()['overloaded']
+
+    def test_budget(self):
+        """Test a run yields to the loop when the budget is used"""
+        queue = ConflationQueue(self.loop, "VehA", self.handler, budget=0)
+        for i in range(3):
+            queue.put(FakePacket('HEARTBEAT', i), 'link')
+
+        self.loop.runOnce()
+        assert len(self.handled) == 1
+        self.loop.runOnce()
+        self.loop.runOnce()
+        assert len(self.handled) == 3
+        assert self.loop.runOnce() == 0
+
+        # flush passes on everything, close stops the runs
+        queue.put(FakePacket('HEARTBEAT', 3), 'link')
+        queue.flush()
+        assert len(self.handled) == 4
+        assert self.loop.runOnce() == 1
+        assert len(self.handled) == 4
+
+
+if __name__ == '__main__':
+    unittest.main()